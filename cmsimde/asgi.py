@@ -0,0 +1,363 @@
+# coding: utf-8
+
+"""Optional ASGI application serving the read-only routes from the event loop
+
+uvicorn cmsimde.asgi:app    或    python -m cmsimde.serve --server uvicorn
+
+匿名使用者的 get_page 與 sitemap 以 ETag 為 key 保存完整回應 (含 gzip 版本), 同一頁面被大量同時開啟時,
+只有第一個要求在執行緒中產生頁面, 其他要求等待同一結果. /static, /images 與 /downloads 的檔案
+在執行緒中分段讀取, 較小的檔案保存在記憶體中. 管理者, 編輯與其他所有路徑仍交由 Flask 處理,
+Flask 在固定大小的 thread pool 中執行.
+"""
+
+import io
+import os
+import sys
+import asyncio
+import urllib.parse
+import concurrent.futures
+from werkzeug.security import safe_join
+from cmsimde import flaskapp, conditional, compress, precompress, bundle, fragmentcache, serve
+
+# 完整頁面回應 cache 的 bytes 上限
+PAGE_CACHE_BYTES = 8 * 1024 * 1024
+# 檔案 cache 的 bytes 上限, 以及可放入 cache 的單一檔案上限
+FILE_CACHE_BYTES = 32 * 1024 * 1024
+FILE_CACHE_MAX = 256 * 1024
+# 較大檔案每次讀取與送出的 bytes 數
+CHUNK_SIZE = 256 * 1024
+
+
+def file_routes():
+
+    """Return (url prefix, directory) of the file routes served without Flask
+    """
+
+    return (("/static/", flaskapp.app.static_folder), ("/images/", flaskapp.image_dir),
+            ("/downloads/", flaskapp.download_dir))
+
+
+def header_map(scope):
+
+    """Return the request headers of an ASGI scope as a lower case name to str dict
+    """
+
+    headers = {}
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").lower()
+        value = value.decode("latin-1")
+        # 重複的 header 以逗號相接, cookie 以分號相接
+        if name in headers:
+            headers[name] += ("; " if name == "cookie" else ", ") + value
+        else:
+            headers[name] = value
+    return headers
+
+
+def is_admin(headers):
+
+    """Return True when the Flask session cookie of headers carries the admin login
+    """
+
+    cookie_name = flaskapp.app.config["SESSION_COOKIE_NAME"]
+    for item in headers.get("cookie", "").split(";"):
+        name, sep, value = item.strip().partition("=")
+        if name != cookie_name:
+            continue
+        serializer = flaskapp.app.session_interface.get_signing_serializer(flaskapp.app)
+        try:
+            session = serializer.loads(value, max_age=flaskapp.app.permanent_session_lifetime.total_seconds())
+        except Exception:
+            # 簽章錯誤或過期的 session 在 Flask 中同樣視為匿名
+            return False
+        return session.get("admin_" + flaskapp.token) == 1
+    return False
+
+
+def wsgi_environ(scope, body, headers):
+
+    """Return the WSGI environ of an ASGI http scope and its request body
+    """
+
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers.items():
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name == "content-length":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+
+def call_wsgi(app, environ):
+
+    """Run a WSGI app to completion, return (status code, headers, body)
+    """
+
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(" ", 1)[0]), headers]
+        return body.append
+
+    body = []
+    app_iter = app(environ, start_response)
+    try:
+        for part in app_iter:
+            body.append(part)
+    finally:
+        close = getattr(app_iter, "close", None)
+        if close is not None:
+            close()
+    return response[0], response[1], b"".join(body)
+
+
+async def read_body(receive):
+    parts = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        parts.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(parts)
+
+
+async def send_response(send, status, headers, body=b"", head=False):
+
+    """Send a whole response, headers as (str, str) pairs
+    """
+
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+    await send({"type": "http.response.body", "body": b"" if head else body})
+
+
+class ReadApp(object):
+
+    """ASGI application answering read-only routes itself and passing every other request to the Flask app
+    """
+
+    def __init__(self, wsgi_app=None, threads=None):
+        self.wsgi_app = wsgi_app or flaskapp.app.wsgi_app
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            threads or getattr(flaskapp.init.Init, "serve_threads", None) or serve.auto_threads("uvicorn"),
+            thread_name_prefix="cmsimde-asgi")
+        # key 為 (ETag, 編碼), 值為回應內容
+        self.pages = fragmentcache.FragmentCache(PAGE_CACHE_BYTES)
+        # key 為 (檔案, mtime_ns, size), 值為檔案內容
+        self.files = fragmentcache.FragmentCache(FILE_CACHE_BYTES)
+        # 產生中的頁面, 相同 key 的要求等待同一 future
+        self.pending = {}
+        self.compress = getattr(flaskapp.init.Init, "compress_responses", True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        headers = header_map(scope)
+        if scope["method"] in ("GET", "HEAD") and not is_admin(headers):
+            path = scope["path"]
+            if path.startswith("/get_page/") and await self.get_page(scope, headers, send):
+                return
+            if path == "/sitemap" and await self.sitemap(scope, headers, send):
+                return
+            if "range" not in headers:
+                # Range 要求交由 Flask 的 send_from_directory 處理
+                for prefix, directory in file_routes():
+                    if path.startswith(prefix) and await self.send_file(directory, path[len(prefix):],
+                                                                        scope, headers, send):
+                        return
+        await self.flask(scope, receive, send, headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # 與 cmsimde.serve 相同, 開始接受連線後在背景預熱快取, 完成前 /ready 回應 503
+                flaskapp.readiness.update({"ready": False, "server": "uvicorn"})
+                warming = asyncio.get_running_loop().run_in_executor(self.executor, serve.warm, flaskapp)
+                warming.add_done_callback(lambda future: flaskapp.readiness.update(
+                    {"ready": True, "warm_seconds": future.result()}))
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def flask(self, scope, receive, send, headers):
+        body = await read_body(receive)
+        environ = wsgi_environ(scope, body, headers)
+        status, response_headers, data = await asyncio.get_running_loop().run_in_executor(
+            self.executor, call_wsgi, self.wsgi_app, environ)
+        await send_response(send, status, response_headers, data)
+
+    async def get_page(self, scope, headers, send):
+        heading = scope["path"][len("/get_page/"):]
+        # 其他路徑, 包含編輯模式與轉址到 /get_page/<heading> 的 /get_page/<heading>/0, 交由 Flask
+        if not heading or "/" in heading:
+            return False
+        parts = flaskapp.get_page_version(heading)
+        if parts is None:
+            return False
+        path = "/get_page/" + urllib.parse.quote(heading, safe="")
+        await self.send_page(parts, path, lambda: flaskapp.get_page.__wrapped__(heading, 0), scope, headers, send)
+        return True
+
+    async def sitemap(self, scope, headers, send):
+        version = flaskapp.content_version()
+        if version == "missing":
+            return False
+        parts = (flaskapp.dynamic_template_key, version, "/sitemap", flaskapp.site_title_version())
+        await self.send_page(parts, "/sitemap", lambda: flaskapp.sitemap(1), scope, headers, send)
+        return True
+
+    async def send_page(self, parts, path, view, scope, headers, send):
+
+        """Send the anonymous html of view, rendered once per ETag and encoding
+        """
+
+        tag = '"' + conditional.make_etag(parts) + '"'
+        encoding = None
+        if self.compress:
+            encoding, compressor = compress.choose_encoding(headers.get("accept-encoding"))
+        response_tag = tag if encoding is None else compress.encoded_etag(tag, encoding)
+        response_headers = [("Content-Type", "text/html; charset=utf-8"), ("ETag", response_tag),
+                            ("Cache-Control", conditional.PUBLIC), ("Vary", "Cookie, Accept-Encoding"),
+                            ("Access-Control-Allow-Origin", "*")]
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and precompress.etag_matches(compress.strip_encoding(if_none_match), tag):
+            await send_response(send, 304, response_headers)
+            return
+        body = await self.page_body(tag, encoding, path, view)
+        if encoding is not None and body is not None:
+            response_headers.append(("Content-Encoding", encoding))
+        else:
+            # 太小或壓縮後未變小的頁面送出原內容
+            response_headers[1] = ("ETag", tag)
+            body = await self.page_body(tag, None, path, view)
+        response_headers.append(("Content-Length", str(len(body))))
+        await send_response(send, 200, response_headers, body, scope["method"] == "HEAD")
+
+    async def page_body(self, tag, encoding, path, view):
+
+        """Return the page bytes of tag in encoding, None when not worth compressing
+        """
+
+        key = (tag, encoding)
+        body = self.pages.get(key)
+        if body is not None:
+            return body or None
+        future = self.pending.get(key)
+        if future is None:
+            future = self.pending[key] = asyncio.get_running_loop().run_in_executor(
+                self.executor, self.render_page, tag, encoding, path, view)
+            future.add_done_callback(lambda done: self.pending.pop(key, None))
+        return await asyncio.shield(future) or None
+
+    def render_page(self, tag, encoding, path, view):
+        data = self.pages.get((tag, None))
+        if data is None:
+            # 沒有 session 的 request context 中產生的頁面即為匿名使用者所見
+            with flaskapp.app.test_request_context(path):
+                data = view().encode("utf-8")
+            self.pages.put((tag, None), data)
+        if encoding is None:
+            return data
+        compressed = b""
+        if len(data) >= compress.MIN_SIZE:
+            encoded = dict(compress.encoders())[encoding](data)
+            if len(encoded) < len(data):
+                compressed = encoded
+        # 空 bytes 記錄不需壓縮的頁面
+        self.pages.put((tag, encoding), compressed)
+        return compressed
+
+    async def send_file(self, directory, name, scope, headers, send):
+
+        """Send a file below directory with its precompressed sibling when accepted, False when not found
+        """
+
+        path = safe_join(directory, name)
+        if path is None or not os.path.isfile(path):
+            return False
+        variant, encoding = precompress.choose(path, headers.get("accept-encoding"))
+        try:
+            st = os.stat(variant)
+        except OSError:
+            return False
+        tag = precompress.etag(st, encoding)
+        response_headers = [("Content-Type", precompress.content_type(path)), ("ETag", tag),
+                            ("Access-Control-Allow-Origin", "*")]
+        if precompress.has_variant(path):
+            response_headers.append(("Vary", "Accept-Encoding"))
+        cache_control = bundle.cache_control(path)
+        if cache_control is not None:
+            response_headers.append(("Cache-Control", cache_control))
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and precompress.etag_matches(if_none_match, tag):
+            await send_response(send, 304, response_headers)
+            return True
+        if encoding is not None:
+            response_headers.append(("Content-Encoding", encoding))
+        response_headers.append(("Content-Length", str(st.st_size)))
+        head = scope["method"] == "HEAD"
+        loop = asyncio.get_running_loop()
+        if st.st_size <= FILE_CACHE_MAX:
+            key = (variant, st.st_mtime_ns, st.st_size)
+            data = self.files.get(key)
+            if data is None:
+                data = await loop.run_in_executor(self.executor, read_file, variant)
+                self.files.put(key, data)
+            await send_response(send, 200, response_headers, data, head)
+            return True
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]})
+        if head:
+            await send({"type": "http.response.body", "body": b""})
+            return True
+        f = await loop.run_in_executor(self.executor, open, variant, "rb")
+        try:
+            remaining = st.st_size
+            while remaining > 0:
+                chunk = await loop.run_in_executor(self.executor, f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # 檔案在送出期間變短, 結束回應
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await loop.run_in_executor(self.executor, f.close)
+        return True
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+app = ReadApp()
@@ -0,0 +1,631 @@
+# coding: utf-8
+
+"""Benchmarks for content.htm processing on synthetic sites
+
+python -m cmsimde.bench split [pages ...]
+python -m cmsimde.bench tokenize [pages ...]
+python -m cmsimde.bench search [pages ...]
+python -m cmsimde.bench patch [pages ...]
+python -m cmsimde.bench build [pages ...]
+python -m cmsimde.bench nav [pages ...]
+python -m cmsimde.bench rewrite [pages ...]
+python -m cmsimde.bench index [pages ...]
+python -m cmsimde.bench precompress [pages ...]
+python -m cmsimde.bench etag [pages ...]
+python -m cmsimde.bench fragments [pages ...]
+python -m cmsimde.bench compress [pages ...]
+python -m cmsimde.bench asgi [pages ...]
+
+只量測時間, 新舊做法結果相同的檢查見各 test_*.py
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import bs4
+from cmsimde import contentstore
+
+
+class _Heading(object):
+
+    """Stand-in for a bs4 h1-h3 tag, only what the splitters use
+    """
+
+    def __init__(self, level, title):
+        self.name = "h" + str(level)
+        self.text = title
+
+    def __str__(self):
+        return "<" + self.name + ">" + self.text + "</" + self.name + ">"
+
+
+def synthetic_content(pages):
+
+    """Return content.htm text and headings of a site with pages pages
+    """
+
+    htag = []
+    parts = []
+    for i in range(pages):
+        level = 1 + i % 3
+        # 每 50 頁放一個重複標題
+        title = "Page " + str(i) if i % 50 else "Duplicate"
+        tag = _Heading(level, title)
+        htag.append(tag)
+        parts.append(str(tag))
+        parts.append("<p>paragraph " + str(i) + " 頁面內容</p>\n" * 3)
+    return "".join(parts), htag
+
+
+def legacy_split(subject, htag):
+
+    """Repeated str.split page splitter used by parse_content before user-003
+    """
+
+    head_list = []
+    level_list = []
+    page_list = []
+    n = len(htag)
+    temp_data = subject.split(str(htag[0]))
+    if len(temp_data) > 2:
+        subject = str(htag[0]).join(temp_data[1:])
+    else:
+        subject = temp_data[1]
+    for i in range(1, n):
+        head_list.append(htag[i-1].text.strip())
+        level_list.append(htag[i-1].name[1])
+        temp_data = subject.split(str(htag[i]))
+        if len(temp_data) > 2:
+            subject = str(htag[i]).join(temp_data[1:])
+        else:
+            subject = temp_data[1]
+        page_list.append(temp_data[0])
+    head_list.append(htag[n-1].text.strip())
+    level_list.append(htag[n-1].name[1])
+    page_list.append(subject.split(str(htag[n-1]))[0])
+    return head_list, level_list, page_list
+
+
+def offset_split(subject, htag):
+
+    """Single pass offset splitter of contentstore
+    """
+
+    headings = contentstore.heading_offsets(
+        subject, [(tag.name[1], tag.text.strip(), str(tag)) for tag in htag])
+    return ([title for level, title, start, end in headings],
+            [level for level, title, start, end in headings],
+            contentstore.split_pages(subject, headings))
+
+
+def timed(func, *args):
+
+    """Return (seconds, result) of func(*args)
+    """
+
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_split(sizes):
+
+    """Compare legacy and offset page splitters
+    """
+
+    print("%8s %10s %12s %12s %8s" % ("pages", "bytes", "legacy (s)", "offset (s)", "speedup"))
+    for pages in sizes:
+        subject, htag = synthetic_content(pages)
+        legacy_time, legacy = timed(legacy_split, subject, htag)
+        offset_time, result = timed(offset_split, subject, htag)
+        print("%8d %10d %12.4f %12.4f %7.1fx" % (pages, len(subject.encode("utf-8")),
+              legacy_time, offset_time, legacy_time / max(offset_time, 1e-9)))
+
+
+def bs4_headings(subject):
+
+    """Headings of subject found with a full bs4 html.parser tree
+    """
+
+    soup = bs4.BeautifulSoup(subject, 'html.parser')
+    return contentstore.tag_headings(soup)
+
+
+def scanned_headings(subject):
+
+    """Headings of subject found with the streaming HeadingScanner
+    """
+
+    return [(level, title, subject[start:end])
+            for level, title, start, end in contentstore.scan_headings(subject)]
+
+
+def bench_tokenize(sizes):
+
+    """Compare bs4 tree and streaming heading tokenizer
+    """
+
+    print("%8s %10s %12s %12s %8s" % ("pages", "bytes", "bs4 (s)", "stream (s)", "speedup"))
+    for pages in sizes:
+        subject = synthetic_content(pages)[0]
+        bs4_time, expected = timed(bs4_headings, subject)
+        stream_time, result = timed(scanned_headings, subject)
+        print("%8d %10d %12.4f %12.4f %7.1fx" % (pages, len(subject.encode("utf-8")),
+              bs4_time, stream_time, bs4_time / max(stream_time, 1e-9)))
+
+
+def legacy_lookups(head):
+
+    """Page orders of every heading found by enumerating head, as search_content did before user-007
+    """
+
+    find = lambda searchList, elem: [[i for i, x in enumerate(searchList) if x == e] for e in elem]
+    return [tuple(find(head, [heading])[0]) for heading in head]
+
+
+def indexed_lookups(head):
+
+    """Page orders of every heading found through the contentstore heading index
+    """
+
+    orders = contentstore.Headings(head).orders
+    return [orders[heading] for heading in head]
+
+
+def bench_search(sizes):
+
+    """Compare linear and indexed heading lookups for one lookup per page, as generate_pages does
+    """
+
+    print("%8s %12s %12s %8s" % ("pages", "linear (s)", "index (s)", "speedup"))
+    for pages in sizes:
+        head = [tag.text for tag in synthetic_content(pages)[1]]
+        linear_time, expected = timed(legacy_lookups, head)
+        index_time, result = timed(indexed_lookups, head)
+        print("%8d %12.4f %12.4f %7.1fx" % (pages, linear_time, index_time,
+              linear_time / max(index_time, 1e-9)))
+
+
+def bench_patch(sizes):
+
+    """Compare full save and byte-range page splice
+    """
+
+    path = os.path.join(tempfile.mkdtemp(), "content.htm")
+    print("%8s %10s %12s %12s %8s" % ("pages", "bytes", "full (s)", "splice (s)", "speedup"))
+    for pages in sizes:
+        subject = synthetic_content(pages)[0]
+        contentstore.save(path, subject)
+        head, level, page = contentstore.get(path)
+        order = pages // 2
+        new = "<h2>" + head[order] + "</h2>" + page[order] + "<p>edited</p>"
+        rebuilt = "".join(new if i == order else "<h" + level[i] + ">" + head[i] + "</h" + level[i] + ">" + page[i]
+                          for i in range(len(head)))
+        full_time, result = timed(contentstore.save, path, rebuilt)
+        contentstore.save(path, subject)
+        contentstore.get(path)
+        splice_time, spliced = timed(contentstore.save_page, path, order, new)
+        print("%8d %10d %12.4f %12.4f %7.1fx" % (pages, len(subject.encode("utf-8")),
+              full_time, splice_time, full_time / max(splice_time, 1e-9)))
+
+
+def read_tree(path):
+
+    """Return name to bytes of every file in directory path
+    """
+
+    tree = {}
+    for name in os.listdir(path):
+        # 子目錄 (如搜尋索引) 另行比較
+        if os.path.isdir(os.path.join(path, name)):
+            continue
+        with open(os.path.join(path, name), "rb") as f:
+            tree[name] = f.read()
+    return tree
+
+
+def bench_build(sizes, samples=20, jobs=None):
+
+    """Time build_static serially, with a process pool and incrementally after editing one page
+
+    抽樣頁面另以 user-011 之前逐頁解析的方式轉檔, 推估全部頁面所需時間
+    """
+
+    from cmsimde import flaskapp
+    # 單核心機器也以兩個 process 轉檔
+    jobs = jobs or max(2, os.cpu_count() or 1)
+    for pages in sizes:
+        work = tempfile.mkdtemp()
+        config_dir = os.path.join(work, "config") + "/"
+        os.makedirs(config_dir)
+        contentstore.save(config_dir + "content.htm", synthetic_content(pages)[0])
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        for build_jobs in (1, jobs):
+            content_dir = os.path.join(work, "content" + str(build_jobs)) + "/"
+            os.makedirs(content_dir)
+            timings = flaskapp.build_static(content_dir, build_jobs)
+            total = sum(seconds for name, seconds in timings)
+            print("%d pages: " % pages + ", ".join("%s %.3f s" % item for item in timings) + ", total %.3f s" % total)
+        # 未共用 site 時每頁各自解析與置換, 以抽樣頁面推估全部頁面所需時間
+        newhead = flaskapp.static_heads(flaskapp.parse_content()[0])
+        orders = random.Random(pages).sample(range(pages), min(samples, pages))
+        start = time.perf_counter()
+        for order in orders:
+            flaskapp.get_page2(newhead[order], newhead, 0)
+        legacy = (time.perf_counter() - start) / len(orders) * pages
+        print("%d pages: per-page parsing estimated %.3f s" % (pages, legacy))
+        bench_search_text(flaskapp, pages)
+        head, level, page = contentstore.get(config_dir + "content.htm")
+        contentstore.save(config_dir + "content.htm", "".join(
+            "<h" + level[i] + ">" + head[i] + "</h" + level[i] + ">" + page[i] +
+            ("<p>edited</p>" if i == pages // 2 else "") for i in range(len(head))))
+        timings = flaskapp.build_static(os.path.join(work, "content1") + "/", 1, True)
+        print("%d pages: incremental build after editing one page, " % pages +
+              ", ".join("%s %.3f s" % item for item in timings))
+
+
+def legacy_search_text(html):
+
+    """Visible text of html from an lxml tree and a per-node filter, as generate_pages did before user-018
+    """
+
+    def visible(element):
+        if element.parent.name in ['style', 'script', '[document]', 'head', 'title']:
+            return False
+        elif isinstance(element, bs4.Comment):
+            return False
+        return True
+    soup = bs4.BeautifulSoup(html, "lxml")
+    return " ".join(" ".join(filter(visible, soup.find_all(string=True))).split())
+
+
+def bench_search_text(flaskapp, pages):
+
+    """Compare lxml tree and streaming extraction of the search text of every page
+    """
+
+    from cmsimde import searchindex
+    page = flaskapp.parse_content()[2]
+    legacy_time, expected = timed(lambda: [legacy_search_text(w) for w in page])
+    stream_time, result = timed(lambda: [searchindex.visible_text(w) for w in page])
+    print("%d pages: search text lxml tree %.3f s, streaming %.3f s, %.1fx" %
+          (pages, legacy_time, stream_time, legacy_time / max(stream_time, 1e-9)))
+
+
+def bench_nav(sizes):
+
+    """Compare bytes written with the menu inlined in every page and in a shared nav asset
+    """
+
+    from cmsimde import flaskapp
+    print("%8s %14s %14s %12s %12s %10s" % ("pages", "inline bytes", "external", "inline page", "external", "asset"))
+    for pages in sizes:
+        work = tempfile.mkdtemp()
+        config_dir = os.path.join(work, "config") + "/"
+        os.makedirs(config_dir)
+        contentstore.save(config_dir + "content.htm", synthetic_content(pages)[0])
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        sizes_written = []
+        for nav in ("inline", "external"):
+            content_dir = os.path.join(work, nav) + "/"
+            os.makedirs(content_dir)
+            flaskapp.build_static(content_dir, 1, nav=nav)
+            tree = read_tree(content_dir)
+            page_bytes = [len(data) for name, data in tree.items() if name.endswith(".html")]
+            asset = sum(len(data) for name, data in tree.items() if name.startswith("nav-"))
+            sizes_written.append((sum(len(data) for data in tree.values()), sum(page_bytes) // len(page_bytes), asset))
+        print("%8d %14d %14d %12d %12d %10d" % (pages, sizes_written[0][0], sizes_written[1][0],
+              sizes_written[0][1], sizes_written[1][1], sizes_written[1][2]))
+
+
+def legacy_urls(page):
+
+    """Seven str.replace passes over every page, as get_page2 did before user-016
+    """
+
+    page = [w.replace('src="/images/', 'src="./../images/') for w in page]
+    page = [w.replace('href="/downloads/', 'href="./../downloads/') for w in page]
+    page = [w.replace('data="/images/', 'data="./../images/') for w in page]
+    page = [w.replace('src="/static/', 'src="./../cmsimde/static/') for w in page]
+    page = [w.replace('src="/downloads', 'src="./../downloads') for w in page]
+    page = [w.replace("pythonpath:['/static/'", "pythonpath:['./../cmsimde/static/'") for w in page]
+    page = [w.replace("data-dirname=\"/static\"", "data-dirname=\"./../cmsimde/static\"") for w in page]
+    return page
+
+
+def url_page(rnd):
+
+    """Return random page markup dense with urls the static rewriter maps
+    """
+
+    parts = ['<img src="/images/a.png">', '<a href="/downloads/f.zip">f</a>', '<object data="/images/s.svg">',
+             '<script src="/static/ace/ace.js"></script>', '<video src="/downloads', "pythonpath:['/static/'",
+             'data-dirname="/static"', 'src="/imag', 'src="src="/images/', "<p>text 頁面</p>", "/static/", '"']
+    return "".join(rnd.choice(parts) for i in range(rnd.randint(0, 30)))
+
+
+def bench_rewrite(sizes):
+
+    """Compare seven site-wide replace passes and the per-page rewrite table
+    """
+
+    from cmsimde import flaskapp
+    rnd = random.Random(2024)
+    print("%8s %10s %12s %12s %8s" % ("pages", "bytes", "passes (s)", "table (s)", "speedup"))
+    # 計時以一般頁面內容為主, 每頁再加入少量網址
+    body = synthetic_content(1)[0].split("</h1>", 1)[1] * 10
+    for pages in sizes:
+        page = [body + url_page(rnd)[:200] + body for i in range(pages)]
+        legacy_time, expected = timed(legacy_urls, page)
+        table_time, result = timed(flaskapp.static_urls, page)
+        print("%8d %10d %12.4f %12.4f %7.1fx" % (pages, sum(len(w.encode("utf-8")) for w in page),
+              legacy_time, table_time, legacy_time / max(table_time, 1e-9)))
+
+
+def bench_index(sizes, queries=200):
+
+    """Compare bytes a search downloads from tipuesearch_content.js and from the sharded index
+    """
+
+    from cmsimde import flaskapp, searchindex
+    rnd = random.Random(17)
+    vocabulary = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for j in range(rnd.randint(2, 9)))
+                  for i in range(3000)] + [chr(0x4e00 + rnd.randrange(3000)) * 2 for i in range(500)]
+    print("%8s %14s %12s %10s %14s" % ("pages", "tipue bytes", "meta bytes", "shards", "query bytes"))
+    for pages in sizes:
+        work = tempfile.mkdtemp()
+        config_dir = os.path.join(work, "config") + "/"
+        os.makedirs(config_dir)
+        # 每頁加入約 300 個詞的內文, 接近一般課程頁面的文字量
+        subject = synthetic_content(pages)[0].replace("</p>\n<h", "</p>\n<p>%s</p>\n<h")
+        subject = subject % tuple(" ".join(rnd.choice(vocabulary) for j in range(300))
+                                  for i in range(subject.count("%s")))
+        contentstore.save(config_dir + "content.htm", subject)
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        trees = {}
+        for search in ("tipue", "index"):
+            content_dir = os.path.join(work, search) + "/"
+            os.makedirs(content_dir)
+            flaskapp.build_static(content_dir, 1, search=search)
+            trees[search] = read_tree(content_dir)
+        shards = read_tree(os.path.join(work, "index", searchindex.SEARCH_DIR))
+        meta = len(shards.pop("meta.js"))
+        # 查詢詞取自頁面內文, 每次查詢下載 meta.js 與查詢詞所在的 shard
+        words = vocabulary + [str(rnd.randrange(pages)) for i in range(10)]
+        loaded = 0
+        for i in range(queries):
+            terms = [rnd.choice(words) for j in range(rnd.randint(1, 3))]
+            loaded += meta + sum(len(shards.get(key + ".js", b"")) for key in set(map(searchindex.shard_key, terms)))
+        print("%8d %14d %12d %10d %14d" % (pages, len(trees["tipue"]["tipuesearch_content.js"]), meta,
+              len(shards), loaded // queries))
+
+
+def bench_precompress(sizes):
+
+    """Time writing .gz siblings of a built site cold and unchanged
+    """
+
+    from cmsimde import flaskapp, precompress
+    print("%8s %12s %12s %10s %10s %10s" % ("pages", "bytes", "compressed", "files", "cold (s)", "warm (s)"))
+    for pages in sizes:
+        work = tempfile.mkdtemp()
+        config_dir = os.path.join(work, "config") + "/"
+        os.makedirs(config_dir)
+        contentstore.save(config_dir + "content.htm", synthetic_content(pages)[0])
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        content_dir = os.path.join(work, "content") + "/"
+        os.makedirs(content_dir)
+        flaskapp.build_static(content_dir, 1, precompress_assets=False)
+        cold_time, (checked, written) = timed(precompress.compress_tree, content_dir)
+        warm_time, (checked, rewritten) = timed(precompress.compress_tree, content_dir)
+        tree = read_tree(content_dir)
+        original = compressed = 0
+        for name, data in tree.items():
+            if name.endswith(".gz"):
+                original += len(tree[name[:-3]])
+                compressed += len(data)
+        print("%8d %12d %12d %10d %10.3f %10.3f" % (pages, original, compressed, written, cold_time, warm_time))
+
+
+def bench_etag(sizes, requests=200):
+
+    """Time rendered get_page responses against 304 revalidations
+    """
+
+    from cmsimde import flaskapp
+    print("%8s %12s %12s" % ("pages", "200 (ms)", "304 (ms)"))
+    for pages in sizes:
+        config_dir = tempfile.mkdtemp() + "/"
+        subject, htag = synthetic_content(pages)
+        contentstore.save(config_dir + "content.htm", subject)
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        client = flaskapp.app.test_client()
+        url = "/get_page/Page " + str(pages // 2 + (pages // 2 % 50 == 0))
+        tag = client.get(url).headers["ETag"]
+        start = time.perf_counter()
+        for i in range(requests):
+            client.get(url)
+        rendered = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(requests):
+            response = client.get(url, headers={"If-None-Match": tag})
+        revalidated = time.perf_counter() - start
+        print("%8d %12.3f %12.3f" % (pages, rendered / requests * 1000, revalidated / requests * 1000))
+
+
+def bench_fragments(sizes, requests=200):
+
+    """Time anonymous get_page views without and with the fragment cache
+    """
+
+    from cmsimde import flaskapp, fragmentcache
+    print("%8s %12s %12s %10s %10s" % ("pages", "off (ms)", "on (ms)", "entries", "evictions"))
+    for pages in sizes:
+        config_dir = tempfile.mkdtemp() + "/"
+        contentstore.save(config_dir + "content.htm", synthetic_content(pages)[0])
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        client = flaskapp.app.test_client()
+        urls = ["/get_page/Page " + str(i) for i in range(1, pages, max(pages // 20, 1)) if i % 50]
+        results = []
+        for max_bytes in (0, 8 * 1024 * 1024):
+            flaskapp.fragment_cache = fragmentcache.FragmentCache(max_bytes)
+            for url in urls:
+                client.get(url)
+            start = time.perf_counter()
+            for i in range(requests):
+                client.get(urls[i % len(urls)])
+            results.append(time.perf_counter() - start)
+        stats = flaskapp.fragment_cache.stats()
+        print("%8d %12.3f %12.3f %10d %10d" % (pages, results[0] / requests * 1000,
+              results[1] / requests * 1000, stats["entries"], stats["evictions"]))
+
+
+def bench_compress(sizes, requests=100):
+
+    """Time gzip get_page responses compressed on every request and cached by ETag
+    """
+
+    from cmsimde import flaskapp, compress
+    print("%8s %10s %10s %12s %12s %12s" % ("pages", "bytes", "gzip", "plain (ms)", "cold (ms)", "cached (ms)"))
+    for pages in sizes:
+        config_dir = tempfile.mkdtemp() + "/"
+        contentstore.save(config_dir + "content.htm", synthetic_content(pages)[0])
+        flaskapp.config_dir = config_dir
+        flaskapp.content_backend = "htm"
+        flaskapp.parse_config()
+        client = flaskapp.app.test_client()
+        url = "/get_page/Page 1"
+        plain = client.get(url).get_data()
+        timings = []
+        for cache_bytes in (None, 0, compress.CACHE_BYTES):
+            if cache_bytes is not None:
+                flaskapp.app.wsgi_app.cache = flaskapp.fragmentcache.FragmentCache(cache_bytes)
+            headers = {"Accept-Encoding": "gzip"} if cache_bytes is not None else {}
+            start = time.perf_counter()
+            for i in range(requests):
+                response = client.get(url, headers=headers)
+            timings.append((time.perf_counter() - start) / requests * 1000)
+        print("%8d %10d %10d %12.3f %12.3f %12.3f" % ((pages, len(plain), len(response.get_data())) +
+                                                      tuple(timings)))
+
+
+def load(port, path, concurrency, seconds):
+
+    """Return (responses, errors, p50 ms, p99 ms) of concurrency clients requesting path for seconds
+    """
+
+    import asyncio
+    import urllib.parse
+    request = ("GET " + urllib.parse.quote(path) + " HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+               "Accept-Encoding: gzip\r\nConnection: close\r\n\r\n").encode("latin-1")
+    latencies = []
+    errors = [0]
+
+    async def client(deadline):
+        loop = asyncio.get_running_loop()
+        while loop.time() < deadline:
+            start = loop.time()
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(request)
+                data = await reader.read()
+                writer.close()
+            except OSError:
+                errors[0] += 1
+                continue
+            if data.split(b" ", 2)[1:2] != [b"200"]:
+                errors[0] += 1
+                continue
+            latencies.append(loop.time() - start)
+
+    async def run():
+        deadline = asyncio.get_running_loop().time() + seconds
+        await asyncio.gather(*[client(deadline) for i in range(concurrency)])
+
+    asyncio.run(run())
+    latencies.sort()
+    if not latencies:
+        return 0, errors[0], 0.0, 0.0
+    return (len(latencies), errors[0], latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
+
+
+def bench_asgi(sizes, concurrency=300, seconds=5):
+
+    """Compare requests/sec of the prefork WSGI server and the uvicorn ASGI read path for one page opened by a class
+    """
+
+    import shutil
+    import subprocess
+    import urllib.request
+    package = os.path.dirname(os.path.abspath(__file__))
+    servers = [("prefork", ["--server", "prefork"])]
+    try:
+        import uvicorn
+        servers.append(("uvicorn", ["--server", "uvicorn"]))
+    except ImportError:
+        print("uvicorn is not installed, only the WSGI path is measured")
+    print("%d clients for %d s, one connection per request" % (concurrency, seconds))
+    print("%8s %10s %10s %8s %10s %10s" % ("pages", "server", "req/s", "errors", "p50 (ms)", "p99 (ms)"))
+    for pages in sizes:
+        # 以連結指向 cmsimde 的暫存網站, flaskapp 依套件位置決定 config 目錄
+        site = tempfile.mkdtemp()
+        os.symlink(package, os.path.join(site, "cmsimde"))
+        for name in ("init.py", "nocache.py"):
+            shutil.copy(os.path.join(os.path.dirname(package), name), site)
+        os.makedirs(os.path.join(site, "config"))
+        contentstore.save(os.path.join(site, "config", "content.htm"), synthetic_content(pages)[0])
+        for number, (name, options) in enumerate(servers):
+            port = 18000 + number
+            process = subprocess.Popen([sys.executable, "-m", "cmsimde.serve", "--host", "127.0.0.1",
+                                        "--port", str(port)] + options, cwd=site,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                for attempt in range(300):
+                    try:
+                        with urllib.request.urlopen("http://127.0.0.1:%d/ready" % port) as response:
+                            if response.status == 200:
+                                break
+                    except OSError:
+                        time.sleep(0.1)
+                else:
+                    raise SystemExit(name + " server did not become ready")
+                done, errors, p50, p99 = load(port, "/get_page/Page 1", concurrency, seconds)
+            finally:
+                process.terminate()
+                process.wait()
+            print("%8d %10s %10.1f %8d %10.2f %10.2f" % (pages, name, done / seconds, errors, p50, p99))
+        shutil.rmtree(site)
+
+
+benchmarks = {"split": bench_split, "tokenize": bench_tokenize, "search": bench_search,
+              "patch": bench_patch, "build": bench_build,
+              "nav": bench_nav, "rewrite": bench_rewrite, "index": bench_index,
+              "precompress": bench_precompress, "etag": bench_etag,
+              "fragments": bench_fragments, "compress": bench_compress,
+              "asgi": bench_asgi}
+# 未指定頁數時的預設值
+default_sizes = {"build": [200, 1000, 5000], "nav": [100, 1000, 5000],
+                 "index": [100, 1000, 5000], "precompress": [100, 1000, 5000],
+                 "etag": [100, 1000, 5000], "fragments": [100, 1000, 5000],
+                 "compress": [100, 1000, 5000], "asgi": [100, 1000]}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        raise SystemExit("usage: python -m cmsimde.bench {" + ",".join(benchmarks) + "} [pages ...]")
+    sizes = [int(n) for n in sys.argv[2:]] or default_sizes.get(sys.argv[1], [1000, 5000, 20000])
+    benchmarks[sys.argv[1]](sizes)
@@ -0,0 +1,77 @@
+# coding: utf-8
+
+"""Convert config/content.htm to static html files in content/ without a running server
+
+flaskapp 只被 import 取得轉檔函式, 不會啟動 Flask 伺服器, 也不需要管理者登入.
+
+python -m cmsimde.build [--jobs N] [--incremental] [--output-dir DIR] [--nav inline|external]
+                        [--search tipue|index] [--bundle] [--precompress] [--profile]
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+from cmsimde import flaskapp
+
+
+def main(argv=None):
+
+    """Run the static conversion, return the process exit status
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m cmsimde.build", description="static site conversion")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="processes rendering pages, default init.py build_jobs or cpu count")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rewrite pages whose inputs changed since the last build")
+    parser.add_argument("--output-dir", default=None,
+                        help="directory of the html files, default content/; pages link to ../images, "
+                             "../downloads and ../cmsimde beside it")
+    parser.add_argument("--nav", choices=["inline", "external"], default=None,
+                        help="menu in every page or in one shared nav-*.js asset, default init.py static_nav")
+    parser.add_argument("--search", choices=["tipue", "index"], default=None,
+                        help="full text tipuesearch_content.js or sharded search index, default init.py static_search")
+    parser.add_argument("--bundle", action="store_true", default=None,
+                        help="concatenate footer scripts and each page's syntaxhighlighter brushes into "
+                             "fingerprinted bundles, default init.py static_bundle")
+    parser.add_argument("--precompress", action="store_true", default=None,
+                        help="write .gz (and .br with brotli installed) siblings of text assets, "
+                             "default init.py static_precompress")
+    parser.add_argument("--profile", action="store_true",
+                        help="print stage timings and the slowest functions of the main process")
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    content_dir = None
+    if args.output_dir is not None:
+        content_dir = os.path.join(os.path.abspath(args.output_dir), "")
+        os.makedirs(content_dir, exist_ok=True)
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        timings = flaskapp.build_static(content_dir, args.jobs, args.incremental, args.nav, args.search,
+                                         args.precompress, args.bundle)
+    except (ValueError, OSError) as e:
+        # 內容無法轉檔時以非 0 狀態結束, 讓 CI 判定失敗
+        print("build failed: " + str(e), file=sys.stderr)
+        return 1
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    total = time.perf_counter() - start
+    if args.profile:
+        for name, seconds in timings:
+            print("%-36s %8.3f s" % (name, seconds))
+        # process pool 中各 worker 的轉檔時間只計入 pages 階段
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+    print("static site written to " + (content_dir or flaskapp._curdir + "/content/") + " in %.3f s" % total)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# coding: utf-8
+
+"""Syntaxhighlighter brushes used by each page and fingerprinted script bundles of static pages
+
+頁面以 class="brush: py; ..." 指定 syntaxhighlighter 語言, 轉檔時只載入頁面用到的 brush.
+bundle 將多個 javascript 依序串接為一個檔案, 檔名含內容 hash, 內容改變時檔名隨之改變,
+伺服器可對其設定長期快取.
+"""
+
+import os
+import re
+import hashlib
+
+# class 屬性中 syntaxhighlighter 的 brush 參數
+_BRUSH = re.compile(r"""\bclass\s*=\s*(?:"[^"]*?\bbrush\s*:\s*([^;"\s]+)|'[^']*?\bbrush\s*:\s*([^;'\s]+))""", re.I)
+# brush 檔案中的 Brush.aliases = ['py', 'python'];
+_ALIASES = re.compile(r"\.aliases\s*=\s*\[([^\]]*)\]")
+# 檔名中的內容 hash, 見 fingerprinted
+FINGERPRINT = re.compile(r"-[0-9a-f]{12}\.(?:js|css)$")
+# 含內容 hash 的檔案內容不會改變, 可長期快取
+IMMUTABLE = "public, max-age=31536000, immutable"
+# 以目錄為索引的 (各 brush 檔案修改時間, alias 對應)
+_alias_cache = {}
+
+
+def brush_aliases(directory):
+
+    """Return alias to file name of every shBrush*.js in directory
+    """
+
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith("shBrush") and name.endswith(".js"))
+    key = tuple((name, os.stat(os.path.join(directory, name)).st_mtime_ns) for name in names)
+    cached = _alias_cache.get(directory)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    aliases = {}
+    for name in names:
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            found = _ALIASES.search(f.read())
+        if found is not None:
+            for alias in re.findall(r"""["']([^"']+)["']""", found.group(1)):
+                aliases.setdefault(alias, name)
+    _alias_cache[directory] = (key, aliases)
+    return aliases
+
+
+def page_brushes(html, aliases):
+
+    """Return the sorted brush file names html uses, brushes without a file are left out
+    """
+
+    found = set()
+    for match in _BRUSH.finditer(html):
+        name = aliases.get(match.group(1) or match.group(2))
+        if name is not None:
+            found.add(name)
+    return tuple(sorted(found))
+
+
+def cache_control(path):
+
+    """Return the Cache-Control of a fingerprinted file name, None for other files
+    """
+
+    if FINGERPRINT.search(path):
+        return IMMUTABLE
+    return None
+
+
+def fingerprinted(prefix, data):
+
+    """Return prefix-<hash>.js file name of javascript data
+    """
+
+    return prefix + "-" + hashlib.sha1(data.encode("utf-8")).hexdigest()[:12] + ".js"
+
+
+def bundle(prefix, paths):
+
+    """Return (file name, javascript) of the files at paths concatenated in order
+    """
+
+    # 開頭的 ; 讓第一個檔案的 "use strict" 不會套用到整個 bundle
+    parts = [";\n"]
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = f.read().lstrip("\ufeff")
+        # 結尾的 ; 與換行避免前一檔案的最後一個敘述或 // 註解延續到下一檔案
+        parts.append("/* " + os.path.basename(path) + " */\n" + data.rstrip() + "\n;\n")
+    data = "".join(parts)
+    return fingerprinted(prefix, data), data
@@ -0,0 +1,220 @@
+# coding: utf-8
+
+"""WSGI middleware compressing dynamic text responses with gzip or brotli
+
+動態頁面含完整選單與大量 inline script, 編輯頁面更含整個 content.htm, waitress 與 gevent 皆未壓縮.
+CompressMiddleware 包在 flaskapp.app.wsgi_app 之外, 所有伺服器皆適用. 帶有 strong ETag 的回應
+以 ETag 為 key 保存壓縮結果, 內容未改變時不再重新壓縮. 串流回應與 send_from_directory 的檔案回應不處理,
+已預先壓縮的靜態檔見 precompress.py.
+"""
+
+import re
+import gzip
+from werkzeug.wsgi import FileWrapper
+from cmsimde import precompress, fragmentcache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小於此 bytes 數的回應不壓縮
+MIN_SIZE = 1024
+# 壓縮結果 cache 的 bytes 上限
+CACHE_BYTES = 4 * 1024 * 1024
+# 壓縮的 Content-Type, 另包含所有 text/*
+TEXT_TYPES = ("application/json", "application/javascript", "application/x-javascript", "application/xml",
+              "image/svg+xml")
+# 壓縮後的 ETag 加上編碼名稱, 用戶端送回時去除, 讓 conditional 仍可比對
+_ETAG_SUFFIX = re.compile(r'-(?:gzip|br)"')
+
+
+def encoders():
+
+    """Return (Content-Encoding, compress function) of each available encoding, preferred first
+    """
+
+    # 每次要求即時壓縮, 使用比 precompress 低的壓縮等級
+    found = []
+    if brotli is not None:
+        found.append(("br", lambda data: brotli.compress(data, quality=5)))
+    found.append(("gzip", lambda data: gzip.compress(data, 6, mtime=0)))
+    return found
+
+
+def choose_encoding(header):
+
+    """Return the preferred Content-Encoding an Accept-Encoding header allows, None for identity
+    """
+
+    codings = precompress.accepted(header or "")
+    best = None
+    for encoding, compress in encoders():
+        q = codings.get(encoding, codings.get("*", 0.0))
+        if q > 0 and (best is None or q > best[0]):
+            best = (q, encoding, compress)
+    if best is None:
+        return None, None
+    return best[1], best[2]
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _without(headers, *names):
+    names = {name.lower() for name in names}
+    return [(key, value) for key, value in headers if key.lower() not in names]
+
+
+def _add_vary(headers):
+    vary = _header(headers, "Vary")
+    if vary is None:
+        return headers + [("Vary", "Accept-Encoding")]
+    if "accept-encoding" in vary.lower() or vary.strip() == "*":
+        return headers
+    return _without(headers, "Vary") + [("Vary", vary + ", Accept-Encoding")]
+
+
+def encoded_etag(tag, encoding):
+
+    """Return the strong ETag of the encoding representation of tag, weak tags unchanged
+    """
+
+    if tag.startswith("W/") or not tag.endswith('"'):
+        return tag
+    return tag[:-1] + "-" + encoding + '"'
+
+
+def strip_encoding(if_none_match):
+
+    """Return an If-None-Match header with the encoding suffix of encoded_etag removed from each tag
+    """
+
+    return _ETAG_SUFFIX.sub('"', if_none_match)
+
+
+def compressible(status, headers, min_size):
+
+    """Return True when a response with status and headers is a whole text body worth compressing
+    """
+
+    if not status.startswith("200") or _header(headers, "Content-Encoding") is not None:
+        return False
+    content_type = (_header(headers, "Content-Type") or "").split(";")[0].strip().lower()
+    if not content_type.startswith("text/") and content_type not in TEXT_TYPES:
+        return False
+    if "no-transform" in (_header(headers, "Cache-Control") or "").lower():
+        return False
+    # 串流回應沒有 Content-Length
+    try:
+        return int(_header(headers, "Content-Length")) >= min_size
+    except (TypeError, ValueError):
+        return False
+
+
+def is_file_response(environ, app_iter):
+
+    """Return True when app_iter is a wsgi.file_wrapper, as send_file and send_from_directory return
+    """
+
+    if isinstance(app_iter, FileWrapper):
+        return True
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    return isinstance(file_wrapper, type) and isinstance(app_iter, file_wrapper)
+
+
+def _close(app_iter):
+    close = getattr(app_iter, "close", None)
+    if close is not None:
+        close()
+
+
+class CompressMiddleware(object):
+
+    """Compress whole text responses of a WSGI app the client accepts encoded, caching them by ETag
+    """
+
+    def __init__(self, app, min_size=MIN_SIZE, cache_bytes=CACHE_BYTES):
+        self.app = app
+        self.min_size = min_size
+        # key 為 (編碼, 網址, ETag)
+        self.cache = fragmentcache.FragmentCache(cache_bytes)
+
+    def identity(self, start_response):
+
+        """Wrap start_response to add Vary: Accept-Encoding to responses other clients get compressed
+        """
+
+        # 不接受壓縮的用戶端收到原內容, shared cache 仍須依 Accept-Encoding 分開保存
+        def vary(status, headers, exc_info=None):
+            if compressible(status, headers, self.min_size):
+                headers = _add_vary(headers)
+            return start_response(status, headers, exc_info)
+
+        return vary
+
+    def __call__(self, environ, start_response):
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            environ["HTTP_IF_NONE_MATCH"] = strip_encoding(if_none_match)
+        encoding, compress = choose_encoding(environ.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is None or environ.get("REQUEST_METHOD") != "GET":
+            return self.app(environ, self.identity(start_response))
+        # app 呼叫 start_response 時決定是否壓縮, 不壓縮的回應直接交給伺服器
+        state = {"deferred": True}
+        body = []
+
+        def capture(status, headers, exc_info=None):
+            if exc_info is None and state["deferred"] and compressible(status, headers, self.min_size):
+                state["response"] = (status, headers)
+                return body.append
+            state.pop("response", None)
+            tag = _header(headers, "ETag")
+            if status.startswith("304") and tag is not None and if_none_match and \
+                    encoded_etag(tag, encoding) in if_none_match:
+                # 用戶端持有的是壓縮後的版本
+                headers = _add_vary(_without(headers, "ETag") + [("ETag", encoded_etag(tag, encoding))])
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, capture)
+        state["deferred"] = False
+        if "response" not in state:
+            return app_iter
+        status, headers = state["response"]
+        if is_file_response(environ, app_iter):
+            start_response(status, headers)
+            return app_iter
+        tag = _header(headers, "ETag")
+        key = None
+        if tag is not None and not tag.startswith("W/"):
+            key = (encoding, environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", "") + "?" +
+                   environ.get("QUERY_STRING", ""), tag)
+        data = self.cache.get(key) if key is not None else None
+        if data is not None:
+            # 相同 ETag 的內容相同, 不需讀取與壓縮
+            _close(app_iter)
+        else:
+            try:
+                for part in app_iter:
+                    body.append(part)
+            finally:
+                _close(app_iter)
+            original = b"".join(body)
+            data = compress(original)
+            if len(data) >= len(original):
+                start_response(status, _add_vary(headers))
+                return [original]
+            if key is not None:
+                self.cache.put(key, data)
+        headers = _add_vary(_without(headers, "Content-Length", "ETag"))
+        headers.append(("Content-Encoding", encoding))
+        headers.append(("Content-Length", str(len(data))))
+        if tag is not None:
+            headers.append(("ETag", encoded_etag(tag, encoding)))
+        start_response(status, headers)
+        return [data]
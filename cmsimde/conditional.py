@@ -0,0 +1,65 @@
+# coding: utf-8
+
+"""Conditional GET decorator for dynamic pages, the counterpart of nocache.py
+
+nocache 讓瀏覽器每次都重新下載頁面; conditional 則以內容版本組成 strong ETag,
+用戶端或 reverse proxy 帶著相同的 If-None-Match 再次要求時, 不產生頁面直接回應 304.
+"""
+
+import hashlib
+import functools
+from flask import make_response, request, Response
+
+# 匿名使用者的頁面可由 proxy 保存, 但每次使用前都需以 ETag 確認
+PUBLIC = "public, no-cache"
+# 管理者頁面含管理選單, 只能存在瀏覽器中
+PRIVATE = "private, no-cache"
+# 沒有 validator 的回應, 例如編輯模式, 與 nocache 相同不留下 cache
+NO_STORE = "no-store, max-age=0"
+
+
+def make_etag(parts):
+
+    """Return the strong ETag value, without quotes, of a sequence of version strings
+    """
+
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()[:24]
+
+
+def _headers(response, tag, cache_control):
+    if tag is not None:
+        response.set_etag(tag)
+    response.headers["Cache-Control"] = cache_control
+    # 回應依 session cookie 而不同, proxy 不可將管理者頁面交給匿名使用者
+    response.vary.add("Cookie")
+    return response
+
+
+def conditional(validator):
+
+    """Decorate a view with an ETag built from validator(*args, **kwargs) and answer If-None-Match with 304
+
+    validator 傳回 (版本字串 tuple, 是否為管理者) 且不可產生頁面; 傳回 None 時回應不快取
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            found = None
+            if request.method in ("GET", "HEAD"):
+                found = validator(*args, **kwargs)
+            if found is None:
+                return _headers(make_response(view(*args, **kwargs)), None, NO_STORE)
+            parts, private = found
+            tag = make_etag(parts)
+            cache_control = PRIVATE if private else PUBLIC
+            # If-None-Match 以 weak comparison 比對, 包含 *
+            if request.if_none_match.contains_weak(tag):
+                return _headers(Response(status=304), tag, cache_control)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                # 轉址或錯誤頁面不加上 ETag
+                return _headers(response, None, NO_STORE)
+            return _headers(response, tag, cache_control)
+        return wrapper
+    return decorator
@@ -0,0 +1,753 @@
+# coding: utf-8
+
+"""Process-wide store of parsed content.htm shared by flaskapp routes
+
+content.htm 的標題正規化只在存檔時進行, 讀取時不再改寫檔案.
+解析結果為不可變的 Snapshot, 存檔先寫入暫存檔再以 os.replace 換入,
+多執行緒讀取時只會取得完整的舊版本或新版本.
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import hashlib
+import tempfile
+import threading
+import collections
+from html.parser import HTMLParser
+import bs4
+
+# 同一 process 中所有執行緒共用的 (版本 key, Snapshot), 以檔案路徑為索引
+_cache = {}
+# 已驗證的 (版本 key, 頁面 offset 索引, sidecar 版本 key), 同樣以檔案路徑為索引
+_index_cache = {}
+_lock = threading.Lock()
+# hit/miss 計數, 由 flaskapp 的 /cache_stats 傳回供監控使用
+stats = {"hits": 0, "misses": 0, "invalidations": 0}
+# 正規化最多重複次數, 標題結構通常兩次內即不再變動
+_NORMALIZE_PASSES = 5
+# Windows 上 os.replace 遇到讀取中的檔案時的重試次數
+_REPLACE_ATTEMPTS = 50
+# 單頁存檔時放在頁面前後的標題, 讓正規化以文件中段的規則處理該頁, 並確認頁面標註皆已關閉
+_PAGE_PREFIX = "<h1>cmsimde</h1>"
+_PAGE_SENTINEL = "<h1>cmsimde_end</h1>"
+
+
+# 一個內容版本的 head, level 與 page, 皆為 tuple, 由所有讀取者共用
+Snapshot = collections.namedtuple("Snapshot", "head level page")
+# 單頁存檔改變的範圍: 由 utf-8 byte offset 開始, old 被換為 new, sha1 為存檔後全文的 hash (未知時為 None)
+Splice = collections.namedtuple("Splice", "offset old new sha1")
+
+
+def file_key(path):
+
+    """Return the (mtime_ns, size, inode) version key of path
+    """
+
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def get(path):
+
+    """Return head, level and page lists of path, re-parsing only when path changed on disk
+    """
+
+    try:
+        key = file_key(path)
+    except OSError:
+        # 檔案不存在時交由 parse_file 傳回錯誤訊息, 不放入 cache
+        return parse_file(path)
+    # 讀檔前先取版本 key, 若解析期間檔案變動, 下次呼叫時 key 不符會重新解析
+    return cached(path, key, lambda: parse_file(path))
+
+
+def cached(name, key, loader):
+
+    """Return the snapshot of loader() cached under name while its version key stays the same
+    """
+
+    # 取出與換入 cache 項目皆為單一 dict 操作, 讀取者不需等待存檔
+    entry = _cache.get(name)
+    if entry is not None and entry[0] == key:
+        with _lock:
+            stats["hits"] += 1
+        return entry[1]
+    with _lock:
+        stats["misses"] += 1
+    return publish(name, key, loader())
+
+
+def publish(name, key, result):
+
+    """Swap in the immutable snapshot of a head, level and page result as version key of name
+    """
+
+    # 錯誤時 parse_file 傳回字串
+    if isinstance(result, str):
+        return result
+    # 標題索引隨 snapshot 建立一次, 同一版本的所有讀取者共用
+    snapshot = Snapshot(Headings(result[0]), tuple(result[1]), tuple(result[2]))
+    _cache[name] = (key, snapshot)
+    return snapshot
+
+
+def invalidate(path=None):
+
+    """Drop cached result of path, or of every path when path is None
+    """
+
+    with _lock:
+        if path is None:
+            _cache.clear()
+            _index_cache.clear()
+        else:
+            _cache.pop(path, None)
+            _index_cache.pop(path, None)
+        stats["invalidations"] += 1
+
+
+def get_stats():
+
+    """Return a copy of the cache counters
+    """
+
+    with _lock:
+        result = dict(stats)
+        result["entries"] = len(_cache)
+    return result
+
+
+def heading_orders(head):
+
+    """Return a multimap from each heading to the tuple of its page orders
+    """
+
+    orders = {}
+    for order, heading in enumerate(head):
+        orders.setdefault(heading, []).append(order)
+    return {heading: tuple(found) for heading, found in orders.items()}
+
+
+class Headings(tuple):
+
+    """Head tuple carrying its heading to page orders multimap
+    """
+
+    def __new__(cls, iterable=()):
+        self = tuple.__new__(cls, iterable)
+        self._orders = None
+        return self
+
+    @property
+    def orders(self):
+        # 第一次使用時才建立
+        if self._orders is None:
+            self._orders = heading_orders(self)
+        return self._orders
+
+
+def read(path):
+
+    """Return path content decoded as utf-8 with universal newlines
+    """
+
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def _digest(subject):
+
+    """Return hex digest used as the normalized marker of subject
+    """
+
+    return hashlib.sha1(subject.encode("utf-8")).hexdigest()
+
+
+def _marker_path(path):
+
+    """Return the normalized marker file of path
+    """
+
+    return path + ".normalized"
+
+
+def is_normalized(path, subject):
+
+    """Check if subject is the content last normalized and saved to path
+    """
+
+    try:
+        return read(_marker_path(path)).strip() == _digest(subject)
+    except OSError:
+        return False
+
+
+def _remove_h123_attrs(soup):
+
+    """Remove h1-h3 tag attribute
+    """
+
+    tag_order = 0
+    for tag in soup.find_all(['h1', 'h2', 'h3']):
+        # 假如標註內容沒有字串
+        #if len(tag.text) == 0:
+        if len(tag.contents) ==0:
+            # 且該標註為排序第一
+            if tag_order == 0:
+                tag.string = "First"
+            else:
+          # 若該標註非排序第一, 則移除無內容的標題標註
+                tag.extract()
+        # 針對單一元件的標題標註
+        elif len(tag.contents) == 1:
+            # 若內容非為純文字, 表示內容為其他標註物件
+            if tag.get_text() == "":
+                # 且該標註為排序第一
+                if tag_order == 0:
+                    # 在最前方插入標題
+                    tag.insert_before(soup.new_tag('h1', 'First'))
+                else:
+                    # 移除 h1, h2 或 h3 標註, 只留下內容
+                    tag.unwrap()
+            # 表示單一元件的標題標註, 且標題為單一字串者
+            else:
+                # 判定若其排序第一, 則將 tag.name 為 h2 或 h3 者換為 h1
+                if tag_order == 0 and tag.name != "h1":
+                    tag.name = "h1"
+            # 針對其餘單一字串內容的標註, 則保持原樣
+        # 針對內容一個以上的標題標註
+        #elif len(tag.contents) > 1:
+        else:
+            # 假如該標註內容長度大於 1
+            # 且該標註為排序第一
+            if tag_order == 0:
+                # 先移除 h1, h2 或 h3 標註, 只留下內容
+                #tag.unwrap()
+                # 在最前方插入標題
+                tag.insert_before(soup.new_tag('h1', 'First'))
+            else:
+                # 只保留標題內容,  去除 h1, h2 或 h3 標註
+                # 為了與前面的內文區隔, 先在最前面插入 br 標註
+                tag.insert_before(soup.new_tag('br'))
+                # 再移除非排序第一的 h1, h2 或 h3 標註, 只留下內容
+                tag.unwrap()
+        tag_order = tag_order + 1
+
+    return soup
+
+
+def _normalize(subject):
+
+    """Return normalized subject and its soup
+    """
+
+    # 以往每次讀取都改寫檔案, 多次讀取後才穩定, 這裡直接重複到結果不再變動
+    for i in range(_NORMALIZE_PASSES):
+        soup = _remove_h123_attrs(bs4.BeautifulSoup(subject, 'html.parser'))
+        # 與寫入後再以文字模式讀回相同, 換行一律為 \n
+        normalized = soup.decode().replace("\r\n", "\n").replace("\r", "\n")
+        if normalized == subject:
+            break
+        subject = normalized
+    return subject, soup
+
+
+def normalize(subject):
+
+    """Return subject with h1-h3 headings normalized by _remove_h123_attrs
+    """
+
+    return _normalize(subject)[0]
+
+
+def write_atomic(path, data):
+
+    """Write data bytes to a temporary file beside path and os.replace it into place
+
+    傳回新檔案的版本 key
+    """
+
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        try:
+            # mkstemp 建立的檔案權限為 0600, 沿用原檔案權限
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        except OSError:
+            os.chmod(temp_path, 0o644)
+        for attempt in range(_REPLACE_ATTEMPTS):
+            try:
+                os.replace(temp_path, path)
+                break
+            except PermissionError:
+                # Windows 上其他執行緒正開啟 path 時無法換入, 稍候再試
+                if os.name != "nt" or attempt == _REPLACE_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.01)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def save(path, subject):
+
+    """Normalize subject and write it to path together with its marker and page index
+
+    存檔後直接換入新版本的 snapshot, 讀取者不必重新解析
+    """
+
+    subject, soup = _normalize(subject)
+    headings = heading_offsets(subject, tag_headings(soup))
+    key = write_atomic(path, subject.encode("utf-8"))
+    write_atomic(_marker_path(path), _digest(subject).encode("utf-8"))
+    invalidate(path)
+    write_index(path, subject, headings, key)
+    if subject != "" and headings:
+        publish(path, key, ([title for level, title, start, end in headings],
+                            [level for level, title, start, end in headings],
+                            split_pages(subject, headings)))
+    return subject
+
+
+def _closed_page(subject, order):
+
+    """Return subject normalized as page order when it closes all its tags, otherwise None
+    """
+
+    # 非第一頁前面加上標題, 後面的標題若被吸收或改變, 表示頁面有未關閉的標註
+    prefix = _PAGE_PREFIX if order > 0 else ""
+    normalized = normalize(prefix + subject + _PAGE_SENTINEL)
+    if not normalized.startswith(prefix) or not normalized.endswith(_PAGE_SENTINEL):
+        return None
+    return normalized[len(prefix):len(normalized) - len(_PAGE_SENTINEL)]
+
+
+def save_page(path, order, subject):
+
+    """Splice page order of path with subject using the page index, without rewriting other pages, return the Splice
+
+    頁面索引無效, 或頁面標註影響前後頁面時傳回 None, 由呼叫者改為完整存檔
+    """
+
+    key, index = _get_index(path)
+    if index is None or not 0 <= order < len(index["pages"]):
+        return None
+    try:
+        if read(_marker_path(path)).strip() != index["sha1"]:
+            return None
+    except OSError:
+        return None
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if (st.st_mtime_ns, st.st_size, st.st_ino) != key:
+            return None
+        data = f.read()
+    pages = index["pages"]
+    head_start, stop = pages[order][2], pages[order][4]
+    # 最後一頁之後還有內容時, 頁面範圍不連續
+    if order == len(pages) - 1 and stop != len(data):
+        return None
+    old = data[head_start:stop].decode("utf-8")
+    new = _closed_page(subject, order)
+    if new is None or _closed_page(old, order) != old:
+        return None
+    # 標題字串曾出現在註解或 script 中時, 依序尋找的頁面範圍會錯開, 改為完整存檔
+    old_found = scan_headings(old)
+    if len(old_found) != 1 or old_found[0][2] != 0 or \
+       old[:old_found[0][3]].encode("utf-8") != data[head_start:pages[order][3]]:
+        return None
+    found = [(level, title, new[start:end]) for level, title, start, end in scan_headings(new)]
+    # 第一頁存檔後仍須以標題開頭
+    if order == 0 and not found:
+        return None
+    # 與 heading_offsets 相同, 由前一個標題之後依序尋找各標題
+    window_start = pages[order-1][3] if order > 0 else 0
+    tail = data[window_start:head_start].decode("utf-8")
+    window = tail + new
+    following = [data[page[2]:page[3]].decode("utf-8") for page in pages[order+1:order+2]]
+    try:
+        headings = heading_offsets(window, found)
+    except ValueError:
+        return None
+    if headings and headings[0][2] < len(tail):
+        return None
+    searched = headings[-1][3] if headings else 0
+    if following and window.find(following[0], searched) >= 0:
+        return None
+    # 換算為 byte offset 並組成新的頁面索引
+    new_data = new.encode("utf-8")
+    delta = len(new_data) - (stop - head_start)
+    entries = [page[:4] for page in pages[:order]]
+    position = len(tail)
+    byte_position = head_start
+    for level, title, start, end in headings:
+        offsets = []
+        for char_offset in (start, end):
+            byte_position += len(window[position:char_offset].encode("utf-8"))
+            position = char_offset
+            offsets.append(byte_position)
+        entries.append([level, title] + offsets)
+    entries.extend([level, title, start + delta, end + delta]
+                   for level, title, start, end, page_stop in pages[order+1:])
+    if not entries:
+        return None
+    # 其他頁面的 bytes 原樣複製, 不需解碼或重新正規化
+    spliced = data[:head_start] + new_data + data[stop:]
+    # 各頁終點為下一頁標題起點, 最後一頁與 split_pages 相同
+    for entry, following_entry in zip(entries, entries[1:]):
+        entry.append(following_entry[2])
+    last = entries[-1]
+    last_stop = spliced.find(spliced[last[2]:last[3]], last[3])
+    last.append(last_stop if last_stop >= 0 else len(spliced))
+    digest = hashlib.sha1(spliced).hexdigest()
+    snapshot = _cache.get(path)
+    new_key = write_atomic(path, spliced)
+    write_atomic(_marker_path(path), digest.encode("utf-8"))
+    invalidate(path)
+    index = {"sha1": digest, "key": list(new_key), "pages": entries}
+    write_atomic(_index_path(path), json.dumps(index, ensure_ascii=False).encode("utf-8"))
+    with _lock:
+        _index_cache[path] = (new_key, index, None)
+    if snapshot is not None and snapshot[0] == key:
+        # 只重新取出前一頁與新頁面的內容, 其餘頁面沿用原 snapshot
+        head, level, page = snapshot[1]
+        first = max(order - 1, 0)
+        changed = order + len(headings)
+        publish(path, new_key, (head[:order] + tuple(entry[1] for entry in entries[order:changed]) +
+                                head[order+1:],
+                                level[:order] + tuple(entry[0] for entry in entries[order:changed]) +
+                                level[order+1:],
+                                page[:first] + tuple(spliced[entry[3]:entry[4]].decode("utf-8")
+                                                     for entry in entries[first:changed]) +
+                                page[order+1:]))
+    return Splice(head_start, old, new, digest)
+
+
+def _index_path(path):
+
+    """Return the page offset index sidecar of path
+    """
+
+    return path + ".index"
+
+
+def write_index(path, subject, headings, key=None):
+
+    """Write heading, level and utf-8 byte range of every page of path to its sidecar index
+    """
+
+    # 各頁面記錄 [level, heading, 標題起點, 內容起點, 內容終點], 皆為 byte offset
+    pages = []
+    stops = [start for level, title, start, end in headings[1:]]
+    if headings:
+        # 最後一頁的終點與 split_pages 相同
+        last = headings[-1]
+        stop = subject.find(subject[last[2]:last[3]], last[3])
+        stops.append(stop if stop >= 0 else len(subject))
+    position = 0
+    byte_position = 0
+    for (level, title, start, end), stop in zip(headings, stops):
+        offsets = []
+        # 逐段累加 utf-8 長度, 避免每頁重新編碼整個檔案
+        for char_offset in (start, end, stop):
+            byte_position += len(subject[position:char_offset].encode("utf-8"))
+            position = char_offset
+            offsets.append(byte_position)
+        pages.append([level, title] + offsets)
+    index = {"sha1": _digest(subject), "key": list(key or file_key(path)), "pages": pages}
+    write_atomic(_index_path(path), json.dumps(index, ensure_ascii=False).encode("utf-8"))
+    with _lock:
+        _index_cache[path] = (tuple(index["key"]), index, None)
+    return index
+
+
+def get_index(path):
+
+    """Return the page index of path when its sidecar still matches the file, otherwise None
+    """
+
+    return _get_index(path)[1]
+
+
+def _get_index(path):
+
+    """Return (version key, page index) of path, index is None when missing or stale
+    """
+
+    try:
+        key = file_key(path)
+    except OSError:
+        return None, None
+    try:
+        sidecar_key = file_key(_index_path(path))
+    except OSError:
+        sidecar_key = None
+    with _lock:
+        entry = _index_cache.get(path)
+    # 無效的索引在檔案與 sidecar 皆未改變前不再讀取與計算 hash, 其他 process 寫入 sidecar 後重新確認
+    if entry is not None and entry[0] == key and (entry[1] is not None or entry[2] == sidecar_key):
+        return entry[0], entry[1]
+    try:
+        with open(_index_path(path), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = None
+    if index is not None and tuple(index["key"]) != key:
+        # 檔案時間或 inode 改變 (例如 git checkout), 以內容 hash 確認索引是否仍有效
+        with open(path, "rb") as f:
+            if hashlib.sha1(f.read()).hexdigest() != index["sha1"]:
+                index = None
+    with _lock:
+        _index_cache[path] = (key, index, sidecar_key)
+    return key, index
+
+
+class PageSlices(object):
+
+    """Page list of an indexed content.htm, each page decoded from an mmap slice on access
+    """
+
+    def __init__(self, path, key, index):
+        self.path = path
+        self.key = key
+        self.index = index
+
+    def __len__(self):
+        return len(self.index["pages"])
+
+    def __getitem__(self, order):
+        level, title, head_start, start, end = self.index["pages"][order]
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            # 索引驗證後檔案若又被改寫, 改用完整解析結果
+            if (st.st_mtime_ns, st.st_size, st.st_ino) != self.key:
+                return get(self.path)[2][order]
+            if start == end:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[start:end].decode("utf-8")
+
+
+def get_pages(path):
+
+    """Return head and level lists plus lazily read pages of path, or None without a valid index
+    """
+
+    key, index = _get_index(path)
+    # 沒有頁面時交由 parse_file 回報錯誤
+    if index is None or not index["pages"]:
+        return None
+    # 標題清單與標題索引在同一索引版本中只建立一次, 由所有讀取者共用
+    head = index.get("_head")
+    if head is None:
+        # 先放入 level, 其他執行緒看到 _head 時 _level 必定已存在
+        index["_level"] = tuple(page[0] for page in index["pages"])
+        head = index["_head"] = Headings(page[1] for page in index["pages"])
+    return head, index["_level"], PageSlices(path, key, index)
+
+
+def replace_page(subject, order, new, normalized=False):
+
+    """Return subject with the heading and content of page order replaced by new, other pages copied unchanged
+    """
+
+    subject, headings = parse_subject(subject, normalized)
+    start = headings[order][2]
+    if order + 1 < len(headings):
+        stop = headings[order+1][2]
+    else:
+        # 與 split_pages 相同, 最後一頁在再次出現相同標題字串處結束
+        markup = subject[start:headings[order][3]]
+        stop = subject.find(markup, headings[order][3])
+        if stop < 0:
+            stop = len(subject)
+    return subject[:start] + new + subject[stop:]
+
+
+def parse_file(path):
+
+    """Use bs4 and re module functions to parse content.htm
+    """
+
+    # if no content.htm, generate a head 1 and content 1 file
+    if not os.path.isfile(path):
+        return "Error: no content.htm"
+    subject = read(path)
+    # deal with content without content
+    if subject == "":
+        return "Error: no data in content.htm"
+    subject, headings = parse_subject(subject, is_normalized(path, subject))
+    head_list = [title for level, title, start, end in headings]
+    # use name attribute of h* tag to get h1, h2 or h3
+    # the number of h1, h2 or h3 is the level of page menu
+    level_list = [level for level, title, start, end in headings]
+    page_list = split_pages(subject, headings)
+    return head_list, level_list, page_list
+
+
+def parse_subject(subject, normalized=False):
+
+    """Return normalized subject and (level, title, start, end) of its headings
+    """
+
+    if normalized:
+        # 存檔時已經正規化, 只需串流取出標題, 不必建立整個 bs4 樹
+        headings = [(level, title, subject[start:end])
+                    for level, title, start, end in scan_headings(subject)]
+    else:
+        # 尚未正規化的內容只在記憶體中處理, 讀取時不寫檔
+        subject, soup = _normalize(subject)
+        # get all h1, h2, h3 tags into list
+        headings = tag_headings(soup)
+    return subject, heading_offsets(subject, headings)
+
+
+def tag_headings(soup):
+
+    """Return (level, title, markup) of each h1-h3 tag in soup
+    """
+
+    return [(tag.name[1], tag.text.strip(), str(tag))
+            for tag in soup.find_all(['h1', 'h2', 'h3'])]
+
+
+class HeadingScanner(HTMLParser):
+
+    """Event driven h1-h3 tokenizer that does not build a document tree
+
+    Records follow bs4 html.parser semantics: title is the stripped text of
+    the heading without comments, script, style, template, rt and rp strings.
+    """
+
+    # 與 bs4 相同, 這些標註內的字串不計入 get_text()
+    string_containers = ("script", "style", "template", "rt", "rp")
+
+    def __init__(self, subject):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.subject = subject
+        # 各行起始 offset, 用來將 getpos() 轉為字串 offset
+        self.line_starts = [0]
+        found = subject.find("\n")
+        while found >= 0:
+            self.line_starts.append(found + 1)
+            found = subject.find("\n", found + 1)
+        # (level, title parts, start, end) 依標題出現次序
+        self.records = []
+        # 尚未結束的標題與字串容器標註
+        self.open_headings = []
+        self.containers = []
+
+    def source_offset(self):
+        lineno, col = self.getpos()
+        return self.line_starts[lineno - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("h1", "h2", "h3"):
+            record = [tag[1], [], self.source_offset(), None]
+            self.records.append(record)
+            self.open_headings.append(record)
+        elif tag in self.string_containers:
+            self.containers.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in ("h1", "h2", "h3"):
+            # 與 bs4 相同, 結束標註關閉最近一個同名且尚未結束的標題
+            for i in range(len(self.open_headings) - 1, -1, -1):
+                record = self.open_headings[i]
+                if record[0] == tag[1]:
+                    record[3] = self.subject.find(">", self.source_offset()) + 1
+                    del self.open_headings[i:]
+                    break
+        elif tag in self.containers:
+            while self.containers.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if self.open_headings and not self.containers:
+            for record in self.open_headings:
+                record[1].append(data)
+
+    def close(self):
+        HTMLParser.close(self)
+        # 未結束的標題延伸到內容結尾
+        for record in self.open_headings:
+            record[3] = len(self.subject)
+        return [(level, "".join(parts).strip(), start, end)
+                for level, parts, start, end in self.records]
+
+
+def scan_headings(subject):
+
+    """Return (level, title, start, end) of each h1-h3 tag in subject
+    """
+
+    scanner = HeadingScanner(subject)
+    scanner.feed(subject)
+    return scanner.close()
+
+
+def heading_offsets(subject, headings):
+
+    """Return (level, title, start, end) of each (level, title, markup) heading in subject
+    """
+
+    offsets = []
+    start = 0
+    for level, title, markup in headings:
+        # 依序由上一個標題之後搜尋, 重複標題因此各自對應到下一次出現的位置
+        found = subject.find(markup, start)
+        if found < 0:
+            raise ValueError("heading not found in content: " + markup)
+        start = found + len(markup)
+        offsets.append((level, title, found, start))
+    return offsets
+
+
+def split_pages(subject, headings):
+
+    """Slice page contents of subject between heading offsets in one pass
+    """
+
+    page_list = []
+    for i in range(1, len(headings)):
+        page_list.append(subject[headings[i-1][3]:headings[i][2]])
+    if not headings:
+        return page_list
+    # 最後一頁與原先 split 作法相同, 若其後再次出現相同標題字串則截斷
+    last = headings[-1]
+    markup = subject[last[2]:last[3]]
+    stop = subject.find(markup, last[3])
+    page_list.append(subject[last[3]:stop if stop >= 0 else len(subject)])
+    return page_list
+
+
+def migrate(path):
+
+    """Normalize an existing content.htm once so later reads skip normalization
+    """
+
+    subject = read(path)
+    if is_normalized(path, subject) and get_index(path) is not None:
+        return False
+    save(path, subject)
+    return True
+
+
+if __name__ == "__main__":
+    # python -m cmsimde.contentstore [config/content.htm]
+    # 一次性將既有 content.htm 正規化並寫入 marker 與頁面索引
+    content_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("config", "content.htm")
+    if migrate(content_path):
+        print(content_path + " normalized")
+    else:
+        print(content_path + " already normalized")
@@ -4,7 +4,7 @@
 """
 
 from flask import Flask, send_from_directory, request, redirect, \
-    render_template, session, make_response, url_for, flash
+    render_template, session, make_response, url_for, flash, jsonify
 from flask_cors import CORS
 import random
 import math
@@ -14,6 +14,8 @@ from nocache import nocache
 import re
 import math
 import hashlib
+# 靜態網頁漸進轉檔的 .build-manifest.json
+import json
 # use quote_plus() to generate URL
 import urllib.parse
 # use cgi.escape() to resemble php htmlspecialchars()
@@ -31,6 +33,10 @@ import shutil
 # for merge_sequence
 from difflib import SequenceMatcher
 import inspect
+# generate_pages 各階段計時
+import time
+# generate_pages 以 process pool 平行轉檔
+import concurrent.futures
 # 針對單一頁面有許多 html 標註時, 增大遞迴圈數設定
 sys.setrecursionlimit(1000000)
 
@@ -40,6 +46,24 @@ parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir) 
 _curdir = os.path.join(os.getcwd(), parentdir)
 import init
+# parse_content 解析結果的 process-wide cache
+from cmsimde import contentstore
+# 取代 content_backup.htm 的存檔紀錄
+from cmsimde import journal
+# 靜態網頁的分段搜尋索引
+from cmsimde import searchindex
+# 靜態網頁文字檔的 .gz 與 .br 壓縮檔
+from cmsimde import precompress
+# 靜態網頁的 syntaxhighlighter brush 與 script bundle
+from cmsimde import bundle
+# start_static 啟動的背景靜態網頁伺服器
+from cmsimde import staticserver
+# 動態頁面的 ETag 與 304 回應
+from cmsimde import conditional
+# get_page 選單, 頁首與頁面內容的 LRU cache
+from cmsimde import fragmentcache
+# 動態回應的 gzip 與 brotli 壓縮
+from cmsimde import compress
 # for start_static function
 #import os
 import subprocess
@@ -76,10 +100,24 @@ uwsgi = init.Init.uwsgi
 ip = init.Init.ip
 dynamic_port = init.Init.dynamic_port
 static_port = init.Init.static_port
+# 舊版 init.py 沒有 content_backend 設定時, 仍使用 content.htm
+content_backend = getattr(init.Init, "content_backend", "htm")
+content_db = config_dir + "content.db"
+journal_path = config_dir + "content.journal"
+# get_page 片段 cache 的 bytes 上限, 0 為不使用
+fragment_cache = fragmentcache.FragmentCache(getattr(init.Init, "fragment_cache_bytes", 8 * 1024 * 1024))
+if content_backend == "sqlite":
+    from cmsimde import pagedb
+    # 第一次啟用 sqlite 時, 由 content.htm 匯入各頁面
+    if not os.path.isfile(content_db) and os.path.isfile(config_dir + "content.htm"):
+        pagedb.import_htm(content_db, config_dir + "content.htm")
 
 # 必須先將 download_dir 設為 static_folder, 然後才可以用於 download 方法中的 app.static_folder 的呼叫
 app = Flask(__name__)
 CORS(app, support_credentials=False)
+# 依 Accept-Encoding 壓縮較大的文字回應, waitress, gevent 與 app.run 皆適用
+if getattr(init.Init, "compress_responses", True):
+    app.wsgi_app = compress.CompressMiddleware(app.wsgi_app)
 
 # 設置隨後要在 blueprint 應用程式中引用的 global 變數
 app.config['config_dir'] = config_dir
@@ -267,6 +305,9 @@ def doAcp():
         return redirect("/login")
     else:
         commit_messages = request.form['commit']
+        if content_backend == "sqlite":
+            # 提交前將資料庫中的頁面匯出至 content.htm
+            pagedb.export_htm(content_db, config_dir + "content.htm")
         head, level, page = parse_content()
         directory = render_menu(head, level, page)
         # execute acp.bat with commit_messages
@@ -279,6 +320,32 @@ def doAcp():
                    directory + "</nav><section><h1>Acp done</h1>Acp done</section></div></body></html>"
 
 
+@app.route('/doRestore', methods=['POST'])
+def doRestore():
+
+    """Action to restore content to a journal revision
+    """
+
+    if not isAdmin():
+        return redirect("/login")
+    try:
+        rev = int(request.form.get('rev', ''))
+    except ValueError:
+        return error_log(None, "Error: no revision " + html_escape(request.form.get('rev', '')))
+    try:
+        restored = journal.text_at(journal_path, rev)
+    except (KeyError, ValueError) as e:
+        # error_log 的第一個參數未被使用, 訊息放在 info
+        return error_log(None, "Error: " + str(e.args[0]))
+    old_content = content_text()
+    if content_backend == "sqlite":
+        pagedb.save_all(content_db, restored)
+    else:
+        contentstore.save(config_dir + "content.htm", restored)
+    record_revision(old_content, action="doRestore", restored=rev)
+    return redirect("/revision_list")
+
+
 @app.route('/doSearch', methods=['POST'])
 def doSearch():
 
@@ -573,7 +640,10 @@ def edit_page(edit):
     else:
         head, level, page = parse_content()
         directory = render_menu(head, level, page)
-        pagedata =file_get_contents(config_dir + "content.htm")
+        if content_backend == "sqlite":
+            pagedata = pagedb.export_text(content_db)
+        else:
+            pagedata =file_get_contents(config_dir + "content.htm")
         #outstring = tinymce_editor(directory, cgi.escape(pagedata))
         # for python 3.8
         outstring = tinymce_editor(directory, html_escape(pagedata))
@@ -936,165 +1006,622 @@ def generate_pages():
     if not isAdmin():
         return redirect('/login')
     else:
-        head, level, page = parse_content()
-        directory = render_menu(head, level, page)
-        # 處理重複標題 head 數列， 重複標題則按照次序加上 1, 2, 3...
-        newhead = []
-        for i, v in enumerate(head):
-            # 各重複標題總數
-            totalcount = head.count(v)
-            # 目前重複標題出現總數
-            count = head[:i].count(v)
-            # 針對重複標題者, 附加目前重複標題出現數 +1, 未重複採原標題
-            newhead.append(v + "-" + str(count + 1) if totalcount > 1 else v)
-        # 刪除 content 目錄中所有 html 檔案
-        filelist = [ f for f in os.listdir(_curdir + "/content/") if f.endswith(".html") ]
-        for f in filelist:
-            os.remove(os.path.join(_curdir + "/content/", f))
-        # 這裡需要建立專門寫出 html 的 write_page
-        # index.html
-        with open(_curdir + "/content/index.html", "w", encoding="utf-8") as f:
-            f.write(get_page2(None, newhead, 0))
-        # sitemap
-        with open(_curdir + "/content/sitemap.html", "w", encoding="utf-8") as f:
-            # 為了修改為動態與靜態網頁雙向轉檔, 這裡需要 newhead pickle
-            # sitemap2 需要 newhead
-            f.write(sitemap2(newhead))
-        # 以下轉檔, 改用 newhead 數列
-
-        def visible(element):
-            if element.parent.name in ['style', 'script', '[document]', 'head', 'title']:
-                return False
-            elif re.match('<!--.*-->', str(element.encode('utf-8'))):
-                return False
-            return True
-
-        search_content = []
-        # generate each page html under content directory
-        for i in range(len(newhead)):
-            # 在此必須要將頁面中的 /images/ 字串換為 images/, /downloads/ 換為 downloads/
-            # 因為 Flask 中靠 /images/ 取檔案, 但是一般 html 則採相對目錄取檔案
-            # 此一字串置換在 get_page2 中進行
-            # 加入 tipue search 模式
-            get_page_content = []
-            html_doc = get_page2(newhead[i], newhead, 0, get_page_content)
-            """
-            # html = "<meta property='head' content='H1'>"
-            soup = BeautifulSoup(html)
-            title = soup.find("meta", property="head")
-            print(title["content"])
-            """
-            html_doc = html_doc.replace('<meta charset="utf-8">', '<meta charset="utf-8">\n<meta property="head" content="H'+str(level[i])+'">')
-            soup = bs4.BeautifulSoup(" ".join(get_page_content), "lxml")
-            search_content.append({"title": newhead[i], "text": " ".join(filter(visible, soup.findAll(text=True))), "tags": "", "url": newhead[i] + ".html"})
-            with open(_curdir + "/content/" + newhead[i] + ".html", "w", encoding="utf-8") as f:
-                # 增加以 newhead 作為輸入
-                f.write(html_doc)
-        # GENERATE js file
-        with open(_curdir + "/content/tipuesearch_content.js", "w", encoding="utf-8") as f:
-            f.write("var tipuesearch = {\"pages\": " + str(search_content) + "};")
+        try:
+            # 在多執行緒或 gevent 伺服器的 process 中 fork 可能 deadlock, 網頁轉檔逐頁進行, process pool 只用於 cmsimde.build
+            timings = build_static(jobs=1, incremental=True)
+            message = "已經將網站轉為靜態網頁!" + timing_table(timings)
+        except ValueError as e:
+            # 沒有 content.htm 或標題無法作為檔名時, 不轉檔並顯示原因
+            message = "無法轉為靜態網頁: " + html_escape(str(e))
+        content = parse_content()
+        directory = "" if isinstance(content, str) else render_menu(*content)
         return set_css() + "<div class='container'><nav>" + \
                      directory + "</nav><section><h1>Generate Pages</h1>" + \
-                     "已經將網站轉為靜態網頁!" + \
+                     message + \
                      "</section></div></body></html>"
 
 
+def render_static_page(state, i):
+
+    """Render and write static page i of a build_static state, return its tipue search entry
+    """
+
+    site, newhead, content_dir = state
+    # 在此必須要將頁面中的 /images/ 字串換為 images/, /downloads/ 換為 downloads/
+    # 因為 Flask 中靠 /images/ 取檔案, 但是一般 html 則採相對目錄取檔案
+    # 此一字串置換已在 static_site 中對全部頁面進行一次
+    get_page_content = []
+    html_doc = get_page2(newhead[i], newhead, 0, get_page_content, site)
+    html_doc = html_doc.replace('<meta charset="utf-8">', '<meta charset="utf-8">\n<meta property="head" content="H'+str(site["level"][i])+'">')
+    # 與 write_changed 相同以 bytes 寫入, Windows 上也不轉換換行字元, 各頁與 index.html 的內容一致
+    with open(os.path.join(content_dir, newhead[i] + ".html"), "wb") as f:
+        f.write(html_doc.encode("utf-8"))
+    # 加入 tipue search 模式
+    # 單次串流掃描取得搜尋文字, 不建立 lxml 文件樹
+    return {"title": newhead[i], "text": searchindex.visible_text(" ".join(get_page_content)), "tags": "", "url": newhead[i] + ".html"}
+
+
+# process pool 中各 worker 由 initializer 取得一次 build_static state
+_static_state = None
+
+
+def _static_worker_init(state):
+
+    """Keep the build_static state in a process pool worker
+    """
+
+    global _static_state
+    _static_state = state
+
+
+def _static_worker_page(i):
+
+    """Render static page i in a process pool worker
+    """
+
+    return render_static_page(_static_state, i)
+
+
+# get_page2 與 sitemap2 靜態頁面版型改變時需加 1, 讓漸進轉檔重新產生所有頁面
+static_template_version = 1
+
+
+def static_page_keys(site, newhead):
+
+    """Return file name to input hash of every static page
+
+    各頁輸入包含頁面內容, 標題, 層級, 前後頁標題, 導覽選單, css, scripts 與版型版本
+    """
+
+    site_hash = hashlib.sha1()
+    for part in (str(static_template_version), init.Init.site_title, site["css"][0], site["css"][1],
+                 site["footer"], site["directory"]):
+        site_hash.update(part.encode("utf-8") + b"\0")
+    site_key = site_hash.hexdigest()
+    keys = {}
+    for i in range(len(newhead)):
+        previous_head = newhead[i-1] if i > 0 else ""
+        next_head = newhead[i+1] if i + 1 < len(newhead) else ""
+        data = json.dumps([site_key, newhead[i], site["level"][i], site["page"][i], previous_head, next_head,
+                           static_highlight(site, newhead[i])], ensure_ascii=False)
+        keys[newhead[i] + ".html"] = hashlib.sha1(data.encode("utf-8")).hexdigest()
+    return keys
+
+
+def read_manifest(manifest_path):
+
+    """Return the pages of a build manifest, empty when missing or from another template version
+    """
+
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != static_template_version:
+        return {}
+    return manifest.get("pages", {})
+
+
+def write_changed(path, data):
+
+    """Write data to path unless the file already holds it, return True when written
+
+    內容未改變的檔案不重寫, 保留原有的修改時間
+    """
+
+    data = data.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+# build_static 產生的 nav asset 與 script bundle 檔名開頭
+static_asset_prefixes = ("nav-", "sh-", "scripts-")
+
+
+def build_static(content_dir=None, jobs=None, incremental=False, nav=None, search=None, precompress_assets=None,
+                 bundle_scripts=None):
+
+    """Convert content.htm to static html files in content_dir, return (stage, seconds) timings
+
+    content.htm 只解析一次, 網址置換與導覽選單也只做一次, 各頁由共用的 site 產生.
+    jobs 為同時轉檔的 process 數, 預設為 init.py 中的 build_jobs 或 os.cpu_count(), 在伺服器中呼叫時應為 1.
+    incremental 為 True 時, 只重新產生 .build-manifest.json 中輸入 hash 改變的頁面.
+    nav, search 與 bundle_scripts 見 static_site. precompress_assets 為 True 時為 content_dir 與 cmsimde/static
+    中的文字檔產生壓縮檔, 預設為 init.py 中的 static_precompress. 內容無法轉檔時 raise ValueError
+    """
+
+    if content_dir is None:
+        content_dir = _curdir + "/content/"
+    if jobs is None:
+        jobs = getattr(init.Init, "build_jobs", None) or os.cpu_count() or 1
+    manifest_path = os.path.join(content_dir, ".build-manifest.json")
+    timings = []
+    start = time.perf_counter()
+    content = parse_content()
+    if isinstance(content, str):
+        # parse_content 以字串傳回 "Error: ..." 訊息
+        raise ValueError(content)
+    head, level, page = content
+    # 標題即為檔案名稱, 在刪除任何檔案之前先檢查
+    for title in head:
+        if "/" in title or os.sep in title or "\0" in title:
+            raise ValueError("heading " + repr(title) + " can not be used as a static file name")
+    # 處理重複標題 head 數列， 重複標題則按照次序加上 1, 2, 3...
+    newhead = static_heads(head)
+    timings.append(("parse", time.perf_counter() - start))
+    site = static_site(newhead, timings, nav, search, bundle_scripts)
+
+    start = time.perf_counter()
+    keys = static_page_keys(site, newhead)
+    manifest = read_manifest(manifest_path) if incremental else {}
+    if incremental:
+        # 只刪除已不存在頁面的 html 檔案
+        keep = set(keys) | {"index.html", "sitemap.html"}
+    else:
+        # 刪除 content 目錄中所有 html 檔案
+        keep = set()
+    keep.update(site["assets"])
+    # 先前轉檔留下的 nav asset 與 script bundle 一併刪除
+    filelist = [ f for f in os.listdir(content_dir)
+                 if (f.endswith(".html") or f.startswith(static_asset_prefixes) and f.endswith(".js")) and f not in keep ]
+    for f in filelist:
+        os.remove(os.path.join(content_dir, f))
+    changed = []
+    for i in range(len(newhead)):
+        name = newhead[i] + ".html"
+        entry = manifest.get(name)
+        if not isinstance(entry, dict) or entry.get("key") != keys[name] or "search" not in entry \
+           or not os.path.isfile(os.path.join(content_dir, name)):
+            changed.append(i)
+    timings.append(("clean", time.perf_counter() - start))
+
+    start = time.perf_counter()
+    state = (site, newhead, content_dir)
+    jobs = max(1, min(jobs, len(changed)))
+    if jobs == 1:
+        rendered = [render_static_page(state, i) for i in changed]
+    else:
+        # 各頁獨立轉檔, map 依頁面次序傳回搜尋資料, 結果與逐頁轉檔相同
+        with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_static_worker_init,
+                                                    initargs=(state,)) as executor:
+            rendered = list(executor.map(_static_worker_page, changed,
+                                         chunksize=max(1, len(changed) // (jobs * 4))))
+    # 未改變的頁面沿用 manifest 中的搜尋資料
+    search = dict(zip(changed, rendered))
+    search_content = [search[i] if i in search else manifest[newhead[i] + ".html"]["search"]
+                      for i in range(len(newhead))]
+    timings.append(("pages (" + str(len(changed)) + " of " + str(len(newhead)) + ", " +
+                    str(jobs) + " jobs)", time.perf_counter() - start))
+
+    start = time.perf_counter()
+    # index.html, sitemap, 搜尋資料, nav asset 與 script bundle, 內容改變時才寫入
+    for name in sorted(site["assets"]):
+        write_changed(os.path.join(content_dir, name), site["assets"][name])
+    write_changed(os.path.join(content_dir, "index.html"), get_page2(None, newhead, 0, site=site))
+    write_changed(os.path.join(content_dir, "sitemap.html"), sitemap2(newhead, site))
+    if site["search"] == "index":
+        searchindex.write(content_dir, [(entry["title"], entry["url"], entry["text"]) for entry in search_content],
+                          write_changed)
+        if os.path.isfile(os.path.join(content_dir, "tipuesearch_content.js")):
+            os.remove(os.path.join(content_dir, "tipuesearch_content.js"))
+    else:
+        # 以 JSON 而非 Python repr 寫出搜尋資料
+        write_changed(os.path.join(content_dir, "tipuesearch_content.js"),
+                      "var tipuesearch = {\"pages\": " + searchindex.js_json(search_content, (", ", ": ")) + "};")
+        searchindex.remove(content_dir)
+    pages = {newhead[i] + ".html": {"key": keys[newhead[i] + ".html"], "search": search_content[i]}
+             for i in range(len(newhead))}
+    contentstore.write_atomic(manifest_path, json.dumps({"version": static_template_version, "pages": pages},
+                                                        ensure_ascii=False, indent=1).encode("utf-8"))
+    timings.append(("index, sitemap, search", time.perf_counter() - start))
+
+    if precompress_assets is None:
+        precompress_assets = getattr(init.Init, "static_precompress", False)
+    if precompress_assets:
+        start = time.perf_counter()
+        checked, written = precompress.compress_tree(content_dir, jobs=jobs)
+        # cmsimde/static 中可能有使用者自備的壓縮檔, 不移除
+        static_checked, static_written = precompress.compress_tree(app.static_folder, jobs=jobs, prune=False)
+        timings.append(("precompress (" + str(written + static_written) + " of " + str(checked + static_checked) +
+                        " files)", time.perf_counter() - start))
+    return timings
+
+
+def timing_table(timings):
+
+    """Return html table of build_static stage timings
+    """
+
+    rows = "".join("<tr><td>" + name + "</td><td>" + "%.3f" % seconds + " s</td></tr>"
+                   for name, seconds in timings)
+    total = sum(seconds for name, seconds in timings)
+    return "<table><tr><th>stage</th><th>time</th></tr>" + rows + \
+           "<tr><td>total</td><td>" + "%.3f" % total + " s</td></tr></table>"
+
+
 # seperate page need heading and edit variables, if edit=1, system will enter edit mode
 # single page edit will use ssavePage to save content, it means seperate save page
+# 動態頁面版型由 flaskapp.py 與 init.py 決定, 兩者修改後 ETag 隨之改變
+dynamic_template_key = "%x-%x" % (os.stat(__file__).st_mtime_ns, os.stat(init.__file__).st_mtime_ns)
+
+
+def content_version():
+
+    """Return a string that changes whenever the content of the current backend changes
+
+    content.htm 有頁面索引時為內容 hash, 各 process 與 git checkout 後皆相同
+    """
+
+    if content_backend == "sqlite":
+        return "db-%d" % pagedb.version(content_db)
+    path = config_dir + "content.htm"
+    index = contentstore.get_index(path)
+    if index is not None:
+        return index["sha1"]
+    try:
+        return "%x-%x-%x" % contentstore.file_key(path)
+    except OSError:
+        return "missing"
+
+
+def site_title_version():
+
+    """Return the version key of config/sitetitle shown in the page header
+    """
+
+    try:
+        return "%x-%x-%x" % contentstore.file_key(config_dir + "sitetitle")
+    except OSError:
+        return ""
+
+
+def get_page_version(heading=None):
+
+    """Return the ETag parts of the anonymous view of heading without a request, None without content
+    """
+
+    version, pages = get_versioned_pages()
+    # 沒有 content.htm 時 get_pages 傳回錯誤訊息
+    if isinstance(pages, str):
+        return None
+    head = pages[0]
+    if not head:
+        return None
+    if heading is None:
+        heading = head[0]
+    if not isinstance(head, contentstore.Headings):
+        head = contentstore.Headings(head)
+    return (dynamic_template_key, version, heading,
+            ",".join(str(order) for order in head.orders.get(heading, ())), site_title_version())
+
+
+def get_page_validator(heading=None, edit=0):
+
+    """Return the ETag parts of a get_page view without rendering it, None in edit mode
+    """
+
+    if edit != 0:
+        return None
+    parts = get_page_version(heading)
+    if parts is None:
+        return None
+    admin = isAdmin()
+    if admin:
+        # 管理選單中的 Edit 連結依 request 網址而不同
+        parts += ("admin", correct_url())
+    return parts, admin
+
+
 @app.route('/get_page')
 @app.route('/get_page/<heading>', defaults={'edit': 0})
 @app.route('/get_page/<heading>/<int:edit>')
+@conditional.conditional(get_page_validator)
 def get_page(heading, edit):
 
     """Get dynamic page content
     """
 
-    head, level, page = parse_content()
-    directory = render_menu(head, level, page)
+    version, (head, level, page) = get_versioned_pages()
     if heading is None:
         heading = head[0]
+    # edit=0 for viewpage
+    if edit == 0:
+        # 選單與頁面內容在同一內容版本中皆相同, 由 fragment_cache 取得
+        # 產生期間存檔時, 逐頁讀取的內容可能屬於新版本, 此時不放入 cache
+        current = lambda: content_version() == version
+        directory = fragment_cache.get_or_render(("menu", version), lambda: render_menu(head, level, page), current)
+        return_content = fragment_cache.get_or_render(("page", version, heading, "view"),
+                                                      lambda: get_page_content(head, page, heading), current)
+        if isAdmin():
+            # 管理者的頁首含管理選單與本頁網址, 不放入 cache
+            header = set_css()
+        else:
+            header = fragment_cache.get_or_render(("css", site_title_version(), "anonymous"), set_css)
+        return header + "<div class='container'><nav>" + \
+                 directory + "</nav><section>" + return_content + "</section></div>" + checkMath() + "</body></html>"
+    # enter edit mode
+    # check if administrator
+    if not isAdmin():
+        return redirect(url_for('login'))
+    directory = render_menu(head, level, page)
     # 因為同一 heading 可能有多頁, 因此不可使用 head.index(heading) 搜尋 page_order
     page_order_list, page_content_list = search_content(head, page, heading)
-    return_content = ""
     pagedata = ""
     outstring = ""
     outstring_duplicate = ""
     pagedata_duplicate = ""
     outstring_list = []
     for i in range(len(page_order_list)):
-        #page_order = head.index(heading)
         page_order = page_order_list[i]
-        if page_order == 0:
-            last_page = ""
-        else:
-            last_page = head[page_order-1] + " << <a href='/get_page/" + \
-                             head[page_order-1] + "'>Previous</a>"
-        if page_order == len(head) - 1:
-            # no next page
-            next_page = ""
-        else:
-            next_page = "<a href='/get_page/"+ head[page_order+1] + \
-                              "'>Next</a> >> " + head[page_order+1]
+        last_page, next_page = page_links(head, page_order)
         if len(page_order_list) > 1:
-            return_content += last_page + " " + next_page + \
-                                      "<br /><h1>" + heading + "</h1>" + \
-                                      page_content_list[i] + "<br />"+ \
-                                      last_page + " " + next_page + "<br /><hr>"
             pagedata_duplicate = "<h"+level[page_order] + ">" + heading + \
                                           "</h"+level[page_order] + ">" + page_content_list[i]
             outstring_list.append(last_page + " " + next_page + "<br />" + tinymce_editor(directory, html_escape(pagedata_duplicate), page_order))
-        else:
-            return_content += last_page + " " + next_page + "<br /><h1>" +\
-                                      heading + "</h1>" + page_content_list[i] + "<br />" + last_page + " " + next_page
-            
         pagedata += "<h"+level[page_order] + ">" + heading + "</h" + level[page_order] + ">" + page_content_list[i]
         # 利用 html_escape() 將 specialchar 轉成只能顯示的格式
         outstring += last_page + " " + next_page + "<br />" + tinymce_editor(directory, html_escape(pagedata), page_order)
-    
-    # edit=0 for viewpage
-    if edit == 0:
-        return set_css() + "<div class='container'><nav>" + \
-                 directory + "</nav><section>" + return_content + "</section></div>" + checkMath() + "</body></html>"
-    # enter edit mode
+    if len(page_order_list) > 1:
+        # 若碰到重複頁面頁印, 且要求編輯, 則導向 edit_page
+        #return redirect("/edit_page")
+        for i in range(len(page_order_list)):
+            outstring_duplicate += outstring_list[i] + "<br /><hr>"
+        return outstring_duplicate
     else:
-        # check if administrator
-        if not isAdmin():
-            redirect(url_for('login'))
+        return outstring
+
+
+def page_links(head, page_order):
+
+    """Return the previous and next page links of page_order
+    """
+
+    if page_order == 0:
+        last_page = ""
+    else:
+        last_page = head[page_order-1] + " << <a href='/get_page/" + \
+                         head[page_order-1] + "'>Previous</a>"
+    if page_order == len(head) - 1:
+        # no next page
+        next_page = ""
+    else:
+        next_page = "<a href='/get_page/"+ head[page_order+1] + \
+                          "'>Next</a> >> " + head[page_order+1]
+    return last_page, next_page
+
+
+def get_page_content(head, page, heading):
+
+    """Return the section html of every page titled heading in view mode
+    """
+
+    page_order_list, page_content_list = search_content(head, page, heading)
+    return_content = ""
+    for i in range(len(page_order_list)):
+        last_page, next_page = page_links(head, page_order_list[i])
+        if len(page_order_list) > 1:
+            return_content += last_page + " " + next_page + \
+                                      "<br /><h1>" + heading + "</h1>" + \
+                                      page_content_list[i] + "<br />"+ \
+                                      last_page + " " + next_page + "<br /><hr>"
         else:
-            if len(page_order_list) > 1:
-                # 若碰到重複頁面頁印, 且要求編輯, 則導向 edit_page
-                #return redirect("/edit_page")
-                for i in range(len(page_order_list)):
-                    outstring_duplicate += outstring_list[i] + "<br /><hr>"
-                return outstring_duplicate
-            else:
-                return outstring
+            return_content += last_page + " " + next_page + "<br /><h1>" +\
+                                      heading + "</h1>" + page_content_list[i] + "<br />" + last_page + " " + next_page
+    return return_content
 
 
-def get_page2(heading, head, edit, get_page_content = None):
+def static_heads(head):
 
-    """Get page content and replace certain string for static site
+    """Return head list with duplicate headings numbered 1, 2, 3... for static file names
     """
 
-    not_used_head, level, page = parse_content()
-    # 直接在此將 /images/ 換為 ./../images/, /downloads/ 換為 ./../downloads/, 以 content 為基準的相對目錄設定
+    newhead = []
+    for i, v in enumerate(head):
+        # 由標題索引取得同一標題的各頁次序
+        orders = head.orders[v]
+        # 各重複標題總數
+        totalcount = len(orders)
+        # 目前重複標題出現總數
+        count = orders.index(i)
+        # 針對重複標題者, 附加目前重複標題出現數 +1, 未重複採原標題
+        newhead.append(v + "-" + str(count + 1) if totalcount > 1 else v)
+    return contentstore.Headings(newhead)
 
-    page = [w.replace('src="/images/', 'src="./../images/') for w in page]
-    page = [w.replace('href="/downloads/', 'href="./../downloads/') for w in page]
+
+# 靜態網頁網址置換表, 以 content 為基準的相對目錄設定, 依序套用
+# init.py 中的 static_url_rewrites 可再加入 (原字串, 新字串)
+static_url_rewrites = [
+    # 直接在此將 /images/ 換為 ./../images/, /downloads/ 換為 ./../downloads/
+    ('src="/images/', 'src="./../images/'),
+    ('href="/downloads/', 'href="./../downloads/'),
     # 配合 object 標註導入 svg data 來源的轉換
-    page = [w.replace('data="/images/', 'data="./../images/') for w in page]
+    ('data="/images/', 'data="./../images/'),
     # 假如有 src="/static/ace/ 則換為 src="./../static/ace/
-    page = [w.replace('src="/static/', 'src="./../cmsimde/static/') for w in page]
+    ('src="/static/', 'src="./../cmsimde/static/'),
     # 假如有 src=/downloads 則換為 src=./../../downloads
-    page = [w.replace('src="/downloads', 'src="./../downloads') for w in page]
+    ('src="/downloads', 'src="./../downloads'),
     # 假如有 pythonpath:['/static/' 則換為 ./../cmsimde/static/
-    page = [w.replace("pythonpath:['/static/'", "pythonpath:['./../cmsimde/static/'") for w in page]
+    ("pythonpath:['/static/'", "pythonpath:['./../cmsimde/static/'"),
     # 針對 wink3 假如有 data-dirname="/static" 換為 data-dirname="./../cmsimde/static"
-    page = [w.replace("data-dirname=\"/static\"", "data-dirname=\"./../cmsimde/static\"") for w in page]
+    ('data-dirname="/static"', 'data-dirname="./../cmsimde/static"'),
     # 假如有 /get_page 則需額外使用 regex 進行字串代換, 表示要在靜態網頁直接取網頁 (尚未完成)
-    #page = [w.replace('/get_page', '') for w in page]
+]
+def static_urls(page):
+
+    """Rewrite dynamic site urls of page list to relative urls of the content directory
+
+    只走訪全部頁面一次, 每一頁依序套用置換表中的所有規則
+    """
+
+    rewrites = list(static_url_rewrites) + list(getattr(init.Init, "static_url_rewrites", ()))
+    result = []
+    for w in page:
+        for old, new in rewrites:
+            w = w.replace(old, new)
+        result.append(w)
+    return result
+
+
+def static_nav_tree(head, level):
+
+    """Return the static menu as nested [heading, children] lists, nested as render_menu2 does
+    """
+
+    tree = []
+    # stack 中為各層的 (層級, 子選單)
+    stack = [(0, tree)]
+    current_level = level[0] if level else "1"
+    for index in range(len(head)):
+        this_level = level[index]
+        # 與 render_menu2 相同, 相鄰層級相差超過一層時只往下一層
+        if (int(this_level) - int(current_level)) > 1:
+            this_level = str(int(current_level) + 1)
+        depth = int(this_level) - int(level[0]) + 1
+        while len(stack) > 1 and stack[-1][0] >= depth:
+            stack.pop()
+        children = []
+        stack[-1][1].append([head[index], children])
+        stack.append((depth, children))
+        current_level = this_level
+    return tree
+
+
+# 瀏覽器在載入頁面時, 將 nav asset 中的選單樹加入 script 所在的 ul
+_nav_script = '''(function (tree) {
+    var script = document.currentScript, menu = script.parentNode;
+    function add(parent, items, before) {
+        for (var i = 0; i < items.length; i++) {
+            var li = document.createElement("li"), a = document.createElement("a");
+            a.setAttribute("href", items[i][0] + ".html");
+            a.textContent = items[i][0];
+            li.appendChild(a);
+            if (items[i][1].length) {
+                var ul = document.createElement("ul");
+                ul.className = "dropdown";
+                li.className = "has-children";
+                add(ul, items[i][1], null);
+                li.appendChild(ul);
+            }
+            parent.insertBefore(li, before);
+        }
+    }
+    add(menu, tree, script);
+})(%s);
+'''
+
+
+def static_nav_asset(head, level):
+
+    """Return (file name, data) of the fingerprinted script holding the static menu tree
+    """
+
+    data = _nav_script % json.dumps(static_nav_tree(head, level), ensure_ascii=False, separators=(",", ":"))
+    return "nav-" + hashlib.sha1(data.encode("utf-8")).hexdigest()[:12] + ".js", data
+
+
+# 靜態網頁頁尾依序載入的 cmsimde/static 程式
+# jquery-3.3.1.min.js 已在 head 中載入, chimper/js/typed.js 暫時不用
+static_footer_scripts = ["chimper/js/jquery-migrate-3.0.1.min.js", "chimper/js/jquery-ui.js",
+                         "chimper/js/popper.min.js", "chimper/js/bootstrap.min.js",
+                         "chimper/js/owl.carousel.min.js", "chimper/js/jquery.stellar.min.js",
+                         "chimper/js/jquery.countdown.min.js", "chimper/js/jquery.magnific-popup.min.js",
+                         "chimper/js/bootstrap-datepicker.min.js", "chimper/js/aos.js", "chimper/js/main.js"]
+
+
+def static_site(head, timings=None, nav=None, search=None, bundle_scripts=None):
+
+    """Return state shared by every static page: heads, levels, rewritten pages, nav, css and scripts
+
+    timings 為 list 時, 依序加入各階段的 (名稱, 秒數).
+    nav 為 "external" 時, 選單樹存為共用的 nav asset, 預設為 init.py 中的 static_nav.
+    search 為 "tipue" 或 "index", 見 static_css.
+    bundle_scripts 為 True 時, 頁尾程式與各頁的 syntaxhighlighter 串接為 bundle, 預設為 init.py 中的 static_bundle.
+    assets 為須寫入 content 目錄的檔名與內容
+    """
+
+    if nav is None:
+        nav = getattr(init.Init, "static_nav", "inline")
+    if search is None:
+        search = getattr(init.Init, "static_search", "tipue")
+    if bundle_scripts is None:
+        bundle_scripts = getattr(init.Init, "static_bundle", False)
+    # 轉檔時 content.htm 已由 build_static 解析, 此處取得的是同一份快取內容
+    not_used_head, level, page = parse_content()
+    start = time.perf_counter()
+    page = static_urls(page)
+    if timings is not None:
+        timings.append(("rewrite urls", time.perf_counter() - start))
+    start = time.perf_counter()
+    nav_asset = static_nav_asset(head, level) if nav == "external" else None
+    site = {"head": head, "level": level, "page": page, "nav_asset": nav_asset, "search": search,
+            "directory": render_menu2(head, level, page, nav_asset=nav_asset and nav_asset[0]),
+            "css": static_css(search), "assets": dict([nav_asset] if nav_asset else [])}
+    if timings is not None:
+        timings.append(("nav", time.perf_counter() - start))
+    start = time.perf_counter()
+    static_scripts(site, bundle_scripts)
+    if timings is not None:
+        timings.append(("scripts", time.perf_counter() - start))
+    return site
+
+
+def static_scripts(site, bundle_scripts):
+
+    """Add the brushes of every heading, the syntaxhighlighter bundles and the footer scripts to site
+    """
+
+    brush_dir = os.path.join(app.static_folder, "syntaxhighlighter")
+    aliases = bundle.brush_aliases(brush_dir)
+    # 重複標題的各頁合併為一個網頁, brush 一併合併
+    brushes = {}
+    for i in range(len(site["head"])):
+        used = bundle.page_brushes(site["page"][i], aliases)
+        if used:
+            brushes[site["head"][i]] = tuple(sorted(set(brushes.get(site["head"][i], ())) | set(used)))
+    site["brushes"] = brushes
+    site["brush_bundles"] = {}
+    if not bundle_scripts:
+        site["footer"] = "".join('''
+            <script src="../cmsimde/static/''' + name + '''"></script>''' for name in static_footer_scripts)
+        return
+    for used in sorted(set(brushes.values())):
+        name, data = bundle.bundle("sh", [os.path.join(brush_dir, brush) for brush in ("shCore.js",) + used])
+        site["brush_bundles"][used] = name
+        site["assets"][name] = data
+    name, data = bundle.bundle("scripts", [os.path.join(app.static_folder, script) for script in static_footer_scripts])
+    site["assets"][name] = data
+    site["footer"] = '''
+            <script src="''' + name + '''"></script>'''
+
+
+def static_highlight(site, heading):
+
+    """Return the syntaxhighlight scripts of static page heading
+    """
+
+    brushes = site["brushes"].get(heading, ())
+    return syntaxhighlight2(brushes, site["brush_bundles"].get(brushes))
+
+
+def get_page2(heading, head, edit, get_page_content = None, site = None):
+
+    """Get page content and replace certain string for static site
+    """
 
-    directory = render_menu2(head, level, page)
+    # generate_pages 轉檔時各頁共用同一個 site, 只解析與置換一次
+    if site is None:
+        site = static_site(head)
+    level = site["level"]
+    page = site["page"]
+    directory = site["directory"]
     if heading is None:
         heading = head[0]
     # 因為同一 heading 可能有多頁, 因此不可使用 head.index(heading) 搜尋 page_order
@@ -1124,21 +1651,24 @@ def get_page2(heading, head, edit, get_page_content = None):
             return_content += last_page + " " + next_page + "<br /><h1>" + \
                                       heading + "</h1>" + page_content_list[i] + \
                                       "<br />" + last_page + " "+ next_page + "<br /><hr>"
-            pagedata_duplicate = "<h"+level[page_order] + ">" + heading + "</h" + level[page_order]+">"+page_content_list[i]
-            outstring_list.append(last_page + " " + next_page + "<br />" + tinymce_editor(directory, html_escape(pagedata_duplicate), page_order))
+            # 編輯器內容只在編輯模式下才需要產生
+            if edit != 0:
+                pagedata_duplicate = "<h"+level[page_order] + ">" + heading + "</h" + level[page_order]+">"+page_content_list[i]
+                outstring_list.append(last_page + " " + next_page + "<br />" + tinymce_editor(directory, html_escape(pagedata_duplicate), page_order))
         else:
             return_content += last_page + " " + next_page + "<br /><h1>" + \
                                       heading + "</h1>" + page_content_list[i] + \
                                       "<br />" + last_page + " " + next_page
 
-        pagedata += "<h" + level[page_order] + ">" + heading + \
-                          "</h" + level[page_order] + ">" + page_content_list[i]
-        # 利用 html_escape() 將 specialchar 轉成只能顯示的格式
-        outstring += last_page + " " + next_page + "<br />" + tinymce_editor(directory, html_escape(pagedata), page_order)
+        if edit != 0:
+            pagedata += "<h" + level[page_order] + ">" + heading + \
+                              "</h" + level[page_order] + ">" + page_content_list[i]
+            # 利用 html_escape() 將 specialchar 轉成只能顯示的格式
+            outstring += last_page + " " + next_page + "<br />" + tinymce_editor(directory, html_escape(pagedata), page_order)
     
     # edit=0 for viewpage
     if edit == 0:
-        return set_css2() + '''<div class='container'><nav>
+        return site["css"][0] + static_highlight(site, heading) + site["css"][1] + '''<div class='container'><nav>
         '''+ \
         directory + "<div id=\"tipue_search_content\">" + return_content + \
         '''</div>
@@ -1155,33 +1685,7 @@ def get_page2(heading, head, edit, get_page_content = None):
       </div>
     <!-- for footer -->
     
-        </div> <!-- for site wrap -->
-            <!-- <script src="../cmsimde/static/chimper/js/jquery-3.3.1.min.js"></script> -->
-            <script src="../cmsimde/static/chimper/js/jquery-migrate-3.0.1.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/jquery-ui.js"></script>
-            <script src="../cmsimde/static/chimper/js/popper.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/bootstrap.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/owl.carousel.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/jquery.stellar.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/jquery.countdown.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/jquery.magnific-popup.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/bootstrap-datepicker.min.js"></script>
-            <script src="../cmsimde/static/chimper/js/aos.js"></script>
-            <!--
-            <script src="../cmsimde/static/chimper/js/typed.js"></script>
-                    <script>
-                    var typed = new Typed('.typed-words', {
-                    strings: ["Web Apps"," WordPress"," Mobile Apps"],
-                    typeSpeed: 80,
-                    backSpeed: 80,
-                    backDelay: 4000,
-                    startDelay: 1000,
-                    loop: true,
-                    showCursor: true
-                    });
-                    </script>
-            -->
-            <script src="../cmsimde/static/chimper/js/main.js"></script>
+        </div> <!-- for site wrap -->''' + site["footer"] + '''
         ''' + checkMath() + '''</body></html>
         '''
     # enter edit mode
@@ -1978,146 +2482,74 @@ def parse_config():
     return site_title, password
 
 
-def _remove_h123_attrs(soup):
+def parse_content():
 
-    """Remove h1-h3 tag attribute
+    """Return head, level and page lists of content.htm, cached until the file changes
     """
 
-    tag_order = 0
-    for tag in soup.find_all(['h1', 'h2', 'h3']):
-        # 假如標註內容沒有字串
-        #if len(tag.text) == 0:
-        if len(tag.contents) ==0:
-            # 且該標註為排序第一
-            if tag_order == 0:
-                tag.string = "First"
-            else:
-          # 若該標註非排序第一, 則移除無內容的標題標註
-                tag.extract()
-        # 針對單一元件的標題標註
-        elif len(tag.contents) == 1:
-            # 若內容非為純文字, 表示內容為其他標註物件
-            if tag.get_text() == "":
-                # 且該標註為排序第一
-                if tag_order == 0:
-                    # 在最前方插入標題
-                    tag.insert_before(soup.new_tag('h1', 'First'))
-                else:
-                    # 移除 h1, h2 或 h3 標註, 只留下內容
-                    tag.replaceWithChildren()
-            # 表示單一元件的標題標註, 且標題為單一字串者
-            else:
-                # 判定若其排序第一, 則將 tag.name 為 h2 或 h3 者換為 h1
-                if tag_order == 0 and tag.name != "h1":
-                    tag.name = "h1"
-            # 針對其餘單一字串內容的標註, 則保持原樣
-        # 針對內容一個以上的標題標註
-        #elif len(tag.contents) > 1:
-        else:
-            # 假如該標註內容長度大於 1
-            # 且該標註為排序第一
-            if tag_order == 0:
-                # 先移除 h1, h2 或 h3 標註, 只留下內容
-                #tag.replaceWithChildren()
-                # 在最前方插入標題
-                tag.insert_before(soup.new_tag('h1', 'First'))
-            else:
-                # 只保留標題內容,  去除 h1, h2 或 h3 標註
-                # 為了與前面的內文區隔, 先在最前面插入 br 標註
-                tag.insert_before(soup.new_tag('br'))
-                # 再移除非排序第一的 h1, h2 或 h3 標註, 只留下內容
-                tag.replaceWithChildren()
-        tag_order = tag_order + 1
+    if content_backend == "sqlite":
+        return pagedb.get(content_db)
+    return contentstore.get(config_dir + "content.htm")
 
-    return soup
 
+def content_text():
 
-def parse_content():
+    """Return the whole content.htm text of the current content backend
+    """
 
-    """Use bs4 and re module functions to parse content.htm
+    if content_backend == "sqlite":
+        return pagedb.export_text(content_db)
+    if not os.path.isfile(config_dir + "content.htm"):
+        return ""
+    return contentstore.read(config_dir + "content.htm")
+
+
+def record_revision(old_content, **info):
+
+    """Append the change from old_content to the current content to the revision journal
     """
 
-    #from pybean import Store, SQLiteWriter
-    # if no content.db, create database file with cms table
-    '''
-    if not os.path.isfile(config_dir+"content.db"):
-        library = Store(SQLiteWriter(config_dir+"content.db", frozen=False))
-        cms = library.new("cms")
-        cms.follow = 0
-        cms.title = "head 1"
-        cms.content = "content 1"
-        cms.memo = "first memo"
-        library.save(cms)
-        library.commit()
-    '''
-    # if no content.htm, generate a head 1 and content 1 file
-    if not os.path.isfile(config_dir+"content.htm"):
-        return "Error: no content.htm"
-        '''
-        # create content.htm if there is no content.htm
-        with open(config_dir + "content.htm", "w", encoding="utf-8") as f:
-            f.write("<h1>head 1</h1>content 1")
-        '''
-    subject = file_get_contents(config_dir+"content.htm")
-    # deal with content without content
-    if subject == "":
-        return "Error: no data in content.htm"
-        '''
-        # create content.htm if there is no content.htm
-        with open(config_dir + "content.htm", "w", encoding="utf-8") as f:
-            f.write("<h1>head 1</h1>content 1")
-        subject = "<h1>head 1</h1>content 1"
-        '''
-    # initialize the return lists
-    head_list = []
-    level_list = []
-    page_list = []
-    # make the soup out of the html content
-    soup = bs4.BeautifulSoup(subject, 'html.parser')
-    # 嘗試解讀各種情況下的標題
-    soup = _remove_h123_attrs(soup)
-    # 改寫 content.htm 後重新取 subject
-    with open(config_dir + "content.htm", "wb") as f:
-        f.write(soup.encode("utf-8"))
-    subject = file_get_contents(config_dir+"content.htm")
-    # get all h1, h2, h3 tags into list
-    htag= soup.find_all(['h1', 'h2', 'h3'])
-    n = len(htag)
-    # get the page content to split subject using each h tag
-    temp_data = subject.split(str(htag[0]))
-    if len(temp_data) > 2:
-        subject = str(htag[0]).join(temp_data[1:])
-    else:
-        subject = temp_data[1]
-    if n >1:
-            # i from 1 to i-1
-            for i in range(1, len(htag)):
-                head_list.append(htag[i-1].text.strip())
-                # use name attribute of h* tag to get h1, h2 or h3
-                # the number of h1, h2 or h3 is the level of page menu
-                level_list.append(htag[i-1].name[1])
-                temp_data = subject.split(str(htag[i]))
-                if len(temp_data) > 2:
-                    subject = str(htag[i]).join(temp_data[1:])
-                else:
-                    subject = temp_data[1]
-                # cut the other page content out of htag from 1 to i-1
-                cut = temp_data[0]
-                # add the page content
-                page_list.append(cut)
-    # last i
-    # add the last page title
-    head_list.append(htag[n-1].text.strip())
-    # add the last level
-    level_list.append(htag[n-1].name[1])
-    temp_data = subject.split(str(htag[n-1]))
-    # the last subject
-    subject = temp_data[0]
-    # cut the last page content out
-    cut = temp_data[0]
-    # the last page content
-    page_list.append(cut)
-    return head_list, level_list, page_list
+    return journal.record(journal_path, old_content, content_text(), content_version(), **info)
+
+
+def record_splice(splice, old_version, **info):
+
+    """Append a single page save to the revision journal, old_version is content_version() before the save
+    """
+
+    return journal.record_splice(journal_path, splice, old_version, content_version(), content_text, **info)
+
+
+def get_pages():
+
+    """Return head and level lists with pages read only when indexed
+    """
+
+    # 有頁面索引時只讀取所需頁面, 選單也只用索引中的標題
+    if content_backend == "sqlite":
+        return pagedb.get_pages(content_db)
+    indexed = contentstore.get_pages(config_dir + "content.htm")
+    if indexed is None:
+        return parse_content()
+    return indexed
+
+
+def get_versioned_pages():
+
+    """Return content_version() and get_pages() read from the same content version
+    """
+
+    if content_backend == "sqlite":
+        pages = pagedb.get_pages(content_db)
+        if isinstance(pages, str):
+            return content_version(), pages
+        return "db-%d" % pages[2].content_version, pages
+    indexed = contentstore.get_pages(config_dir + "content.htm")
+    if indexed is not None:
+        return indexed[2].index["sha1"], indexed
+    # 沒有索引時先取得版本, 解析期間存檔時 get_page 產生片段後的版本檢查不會通過
+    version = content_version()
+    return version, parse_content()
 
 
 def remove_special_characters(text):
@@ -2190,9 +2622,11 @@ def render_menu(head, level, page, sitemap=0):
     return directory
 
 
-def render_menu2(head, level, page, sitemap=0):
+def render_menu2(head, level, page, sitemap=0, nav_asset=None):
 
     """Render menu for static site
+
+    有 nav_asset 時只產生主頁選單, 各標題由該 script 在瀏覽器中加入
     """
 
     site_title, password = parse_config()
@@ -2250,6 +2684,11 @@ def render_menu2(head, level, page, sitemap=0):
                         </ul>
                       </li>
                      '''
+    if nav_asset is not None:
+        # 未啟用 JavaScript 時, 仍可由主頁選單中的 SMap 取得所有頁面連結
+        directory += "<script src='" + nav_asset + "'></script>"
+        # 各標題改由 nav asset 產生, 不在此逐一列出
+        head = []
     # 逐一配合 level 數列中的各標題階次, 一一建立對應的表單或 sitemap
     for index in range(len(head)):
         # 用 this_level 取出迴圈中逐一處理的頁面對應層級, 注意取出值為 str
@@ -2308,7 +2747,9 @@ def render_menu2(head, level, page, sitemap=0):
                 #表示為最後一個
                 directory += "<li><a href='" + head[index] + ".html'>" + head[index] + "</a>"
         current_level = this_level
-    directory += '''</li>
+    if head:
+        directory += "</li>"
+    directory += '''
                       </ul>
                 </nav>
               </div>
@@ -2377,6 +2818,32 @@ def render_menu3(head, level, page, sitemap=0):
     return directory
 
 
+@app.route('/revision_list')
+def revision_list():
+
+    """List content revisions of the journal, each with a restore button
+    """
+
+    if not isAdmin():
+        return redirect("/login")
+    head, level, page = parse_content()
+    directory = render_menu(head, level, page)
+    outstring = "<table><tr><th>rev</th><th>time</th><th>action</th><th>page</th><th></th></tr>"
+    # 最新的版本列在最前面
+    for header in reversed(journal.revisions(journal_path)):
+        if header.get("restored") is not None:
+            note = "rev " + str(header["restored"])
+        else:
+            note = html_escape(header.get("heading") or "")
+        outstring += "<tr><td>" + str(header["rev"]) + "</td><td>" + header["time"] + "</td><td>" + \
+                     header.get("action", "") + "</td><td>" + note + "</td><td>" + \
+                     "<form method='post' action='/doRestore'><input type='hidden' name='rev' value='" + \
+                     str(header["rev"]) + "'><input type='submit' value='restore'></form></td></tr>"
+    outstring += "</table>"
+    return set_css() + "<div class='container'><nav>" + \
+             directory + "</nav><section><h1>Revisions</h1>" + outstring + "</section></div></body></html>"
+
+
 @app.route('/saveConfig', methods=['POST'])
 def saveConfig():
 
@@ -2429,13 +2896,16 @@ def savePage():
         return redirect("/login")
     if page_content is None:
         return error_log("no content to save!")
-    # 在插入新頁面資料前, 先複製 content.htm 一分到 content_backup.htm
-    shutil.copy2(config_dir + "content.htm", config_dir + "content_backup.htm")
     # in Windows client operator, to avoid textarea add extra \n
     # for ajax save comment the next line
     #page_content = page_content.replace("\n","")
-    with open(config_dir + "content.htm", "w", encoding="utf-8") as f:
-        f.write(page_content)
+    old_content = content_text()
+    if content_backend == "sqlite":
+        pagedb.save_all(content_db, page_content)
+    else:
+        # 存檔時才進行標題正規化, 讀取時不再改寫 content.htm
+        contentstore.save(config_dir + "content.htm", page_content)
+    record_revision(old_content, action="savePage")
     return redirect("/edit_page")
 
 
@@ -2444,8 +2914,10 @@ def search_content(head, page, search):
     """Search content
     """
 
-    find = lambda searchList, elem: [[i for i, x in enumerate(searchList) if x == e] for e in elem]
-    search_result = find(head, [search])[0]
+    # head 由 parse_content 取得時已帶有標題索引, 其他清單則建立一次
+    if not isinstance(head, contentstore.Headings):
+        head = contentstore.Headings(head)
+    search_result = head.orders.get(search, ())
     page_order = []
     page_content = []
     for i in range(len(search_result)):
@@ -2479,6 +2951,45 @@ def search_form(edit):
         return redirect("/login")
 
 
+@app.route('/cache_stats')
+def cache_stats():
+
+    """Return parsed content cache hit/miss counters for administrators
+    """
+
+    if not isAdmin():
+        return redirect("/login")
+    return jsonify(contentstore.get_stats())
+
+
+# python -m cmsimde.serve 預熱快取期間為 False, 並記錄伺服器種類與 worker 數
+readiness = {"ready": True}
+
+
+@app.route('/ready')
+def ready():
+
+    """Return 200 once the caches are warm and the content can be read, 503 before
+    """
+
+    state = dict(readiness)
+    state["content_version"] = content_version()
+    if state["content_version"] == "missing":
+        state["ready"] = False
+    return jsonify(state), 200 if state["ready"] else 503
+
+
+@app.route('/fragment_stats')
+def fragment_stats():
+
+    """Return get_page fragment cache hits, misses, evictions and size for administrators
+    """
+
+    if not isAdmin():
+        return redirect("/login")
+    return jsonify(fragment_cache.stats())
+
+
 # setup static directory
 @app.route('/static/<path:path>')
 def send_file(path):
@@ -2572,6 +3083,7 @@ window.location= 'https://' + location.host + location.pathname + location.searc
 <li><a href="/image_list">IList</a></li>
 <li><a href="/fileuploadform">FUpload</a></li>
 <li><a href="/download_list">FList</a></li>
+<li><a href="/revision_list">Revs</a></li>
 <li><a href="/logout">Logout</a></li>
 <li><a href="/generate_pages">Convert</a></li>
 '''
@@ -2660,6 +3172,7 @@ window.location= 'https://' + location.host + location.pathname + location.searc
 <li><a href="/image_list">IList</a></li>
 <li><a href="/fileuploadform">FUpload</a></li>
 <li><a href="/download_list">FList</a></li>
+<li><a href="/revision_list">Revs</a></li>
 <li><a href="/logout">Logout</a></li>
 <li><a href="/generate_pages">Convert</a></li>
 '''
@@ -2682,11 +3195,25 @@ window.location= 'https://' + location.host + location.pathname + location.searc
     return outstring
 
 
-def set_css2():
+def set_css2(search=None):
 
     """Set css for static site
     """
 
+    css_head, css_tail = static_css(search)
+    return css_head + syntaxhighlight2() + css_tail
+
+
+def static_css(search=None):
+
+    """Return the static page head before and after the syntaxhighlight scripts
+
+    search 為 "index" 時, 搜尋框改用 searchindex 產生的分段索引, 預設為 init.py 中的 static_search
+    """
+
+    if search is None:
+        search = getattr(init.Init, "static_search", "tipue")
+
     static_head = '''
         <head>
         <title>''' + init.Init.site_title + '''</title>
@@ -2719,7 +3246,14 @@ def set_css2():
         <!-- <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.3.1/jquery.min.js"></script> -->
         <script src="../cmsimde/static/chimper/js/jquery-3.3.1.min.js"></script>
         <link rel="stylesheet" href="./../cmsimde/static/tipuesearch/css/normalize.min.css">
-        <script src="./../cmsimde/static/tipuesearch/tipuesearch_set.js"></script>
+        '''
+    if search == "index":
+        # 瀏覽器只載入查詢詞所在的索引 shard
+        outstring += '''<link rel="stylesheet" href="./../cmsimde/static/tipuesearch/css/tipuesearch.css">
+        <script src="./../cmsimde/static/tipuesearch/cmsimde_search.js"></script>
+        '''
+    else:
+        outstring += '''<script src="./../cmsimde/static/tipuesearch/tipuesearch_set.js"></script>
         <script src="tipuesearch_content.js"></script>
         <link rel="stylesheet" href="./../cmsimde/static/tipuesearch/css/tipuesearch.css">
         <script src="./../cmsimde/static/tipuesearch/tipuesearch.js"></script>
@@ -2744,22 +3278,23 @@ def set_css2():
             }
             $(document).ready(doSearch);
         </script>
-        ''' + syntaxhighlight2()
+        '''
+    css_tail = ""
 
     site_title, password = parse_config()
     if uwsgi:
-        outstring += '''
+        css_tail += '''
 <script type="text/javascript">
 if ((location.href.search(/http:/) != -1) && (location.href.search(/login/) != -1)) \
 window.location= 'https://' + location.host + location.pathname + location.search;
 </script></head><body>
 '''
     else:
-        outstring += '''
+        css_tail += '''
 </head>
 <body>
 '''
-    return outstring
+    return outstring, css_tail
 
 
 def set_footer():
@@ -2793,18 +3328,21 @@ def sitemap(edit):
              "</section></div></body></html>"
 
 
-def sitemap2(head):
+def sitemap2(head, site = None):
 
     """Sitemap for static content generation
     """
 
     edit = 0
-    not_used_head, level, page = parse_content()
-    directory = render_menu2(head, level, page)
+    if site is None:
+        site = static_site(head)
+    level = site["level"]
+    page = site["page"]
+    directory = site["directory"]
     # 先改為使用 render_menu3 而非 render_menu2
     sitemap = render_menu3(head, level, page, sitemap=1)
     # add tipue search id
-    return set_css2() + "<div class='container'><nav>" + directory + \
+    return site["css"][0] + syntaxhighlight2(()) + site["css"][1] + "<div class='container'><nav>" + directory + \
              "</nav><section><h1>SMap</h1><div id=\"tipue_search_content\"></div>" + sitemap + \
              "</section></div></body></html>"
 
@@ -2850,29 +3388,42 @@ def ssavePage():
     #page_content = page_content.replace("\n","")
     head, level, page = parse_content()
     original_head_title = head[int(page_order)]
-    # 在插入新頁面資料前, 先複製 content.htm 一分到 content_backup.htm
-    shutil.copy2(config_dir + "content.htm", config_dir + "content_backup.htm")
     if page_content != "":
-        with open(config_dir + "content.htm", "w", encoding="utf-8") as file:
-            for index in range(len(head)):
-                if index == int(page_order):
-                    if action == "save":
-                        file.write(page_content)
-                    else:
-                        # make orig and new html content into list
-                        newSoup = bs4.BeautifulSoup(page_content, "html.parser")
-                        newList =[str(tag) for tag in newSoup.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'pre', 'ol', 'ul', 'script', 'table'])]
-                        oldPage = page[index]
-                        oldSoup = bs4.BeautifulSoup(oldPage, "html.parser")
-                        oldList =[snTosr(tag) for tag in oldSoup.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'pre', 'ol', 'ul', 'script', 'table'])]
-                        mergedList = merge_sequences(oldList, newList)
-                        newContent = ""
-                        for i in range(len(mergedList)):
-                            newContent += mergedList[i]
-                        file.write(newContent)
-                else:
-                    file.write("<h"+str(level[index])+ ">" + str(head[index]) + "</h" + \
-                                  str(level[index])+">"+str(page[index]))
+        if action == "save":
+            new_page = page_content
+        else:
+            # make orig and new html content into list
+            newSoup = bs4.BeautifulSoup(page_content, "html.parser")
+            newList =[str(tag) for tag in newSoup.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'pre', 'ol', 'ul', 'script', 'table'])]
+            oldPage = page[int(page_order)]
+            oldSoup = bs4.BeautifulSoup(oldPage, "html.parser")
+            oldList =[snTosr(tag) for tag in oldSoup.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'pre', 'ol', 'ul', 'script', 'table'])]
+            mergedList = merge_sequences(oldList, newList)
+            new_page = ""
+            for i in range(len(mergedList)):
+                new_page += mergedList[i]
+        old_version = content_version()
+        if content_backend == "sqlite":
+            # 只在同一個 transaction 中更新此頁 (以及新增的分頁)
+            splice = pagedb.save_page(content_db, int(page_order), new_page)
+        else:
+            # 依頁面索引只置換此頁的 byte 範圍, 無法置換時才重新組合整個檔案
+            splice = contentstore.save_page(config_dir + "content.htm", int(page_order), new_page)
+        if splice is not None:
+            # 存檔紀錄只比對改變的頁面範圍
+            record_splice(splice, old_version, action="ssavePage", order=int(page_order),
+                          heading=original_head_title)
+        else:
+            old_content = content_text()
+            # 其他頁面沿用原內容, 保留標題屬性與字元實體, 只置換此頁後再正規化寫入
+            if content_backend == "sqlite":
+                pagedb.save_all(content_db, contentstore.replace_page(old_content, int(page_order), new_page))
+            else:
+                path = config_dir + "content.htm"
+                contentstore.save(path, contentstore.replace_page(
+                    old_content, int(page_order), new_page, contentstore.is_normalized(path, old_content)))
+            # 存檔紀錄只附加與前一版本的差異
+            record_revision(old_content, action="ssavePage", order=int(page_order), heading=original_head_title)
     else:
         return error_log("Error: no content to save!")
     # if every ssavePage generate_pages needed
@@ -2900,106 +3451,90 @@ def ssavePage():
 
 @app.route('/start_static/')
 def start_static():
-    """Start local static server in https with IPv4/IPv6 support"""
+    """Start local static server in https with IPv4/IPv6 support
+
+    伺服器在背景執行緒中執行, 此 request 立即傳回; 已在執行時不重複綁定 port
+    """
     
     if isAdmin():
+        head, level, page = parse_content()
+        directory = render_menu(head, level, page)
+        if readiness.get("workers", 1) > 1:
+            # prefork 的各 worker 各自保存伺服器狀態, 無法得知其他 worker 是否已啟動, 也無法停止其他 worker 的伺服器
+            return set_css() + "<div class='container'><nav>" + \
+                         directory + "</nav><section><h1>Static Server</h1>" + \
+                         "多個 worker process 執行時無法由此啟動靜態網頁伺服器, 請以 python http-server.py 或 static.py 預覽" + \
+                         "</section></div></body></html>"
         try:
-            # 使用 init.py 中所設定的 IP address
-            server_address = init.Init.ip
-            server_port = static_port
-            
-            # 根據 IP 地址自動選擇 address family
-            try:
-                # 嘗試解析 IP 地址以確定是 IPv4 還是 IPv6
-                socket.inet_pton(socket.AF_INET, server_address)
-                address_family = socket.AF_INET
-            except socket.error:
-                try:
-                    socket.inet_pton(socket.AF_INET6, server_address)
-                    address_family = socket.AF_INET6
-                except socket.error:
-                    # 如果都不是有效的 IP，假設是 hostname 或 localhost
-                    address_family = socket.AF_INET6 if ':' in server_address else socket.AF_INET
-            
-            # 創建 SSL context
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            ssl_context.load_cert_chain(
-                certfile='cert.pem',
-                keyfile='key.pem'
-            )
-            
-            # 設定 HTTPS server
-            httpd = http.server.HTTPServer(
-                (server_address, server_port),
-                http.server.SimpleHTTPRequestHandler,
-                bind_and_activate=False
-            )
-            
-            # 創建 socket 並套用 SSL
-            httpd.socket = socket.socket(address_family, socket.SOCK_STREAM)
-            httpd.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            
-            # 為 IPv6 添加雙棧支援（如果系統支援）
-            if address_family == socket.AF_INET6:
-                try:
-                    httpd.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-                except (AttributeError, socket.error):
-                    pass  # 如果系統不支援雙棧，就使用純 IPv6
-            
-            httpd.socket = ssl_context.wrap_socket(
-                httpd.socket,
-                server_side=True
-            )
-            
-            # 綁定並啟動 server
-            httpd.socket.bind((server_address, server_port))
-            httpd.server_activate()
-            
-            # 根據 address family 顯示適當的協議資訊
-            protocol = "IPv6" if address_family == socket.AF_INET6 else "IPv4"
-            print(f"HTTPS Server started at https://{server_address}:{server_port} using {protocol}")
-            httpd.serve_forever()
-            
+            # 使用 init.py 中所設定的 IP address, 以網站目錄為根目錄
+            started, state = staticserver.start(init.Init.ip, static_port, _curdir,
+                                                certfile='cert.pem', keyfile='key.pem')
         except ssl.SSLError as e:
             print(f"SSL Error: {e}")
             return "SSL configuration error", 500
-        except Exception as e:
+        except OSError as e:
             print(f"Server Error: {e}")
+            if staticserver.port_in_use(e):
+                return "Port " + str(static_port) + " is used by another program", 500
             return "Server error", 500
+        if started:
+            print("HTTPS Server started at " + state["url"])
+        message = "已啟動" if started else "已在執行中"
+        return set_css() + "<div class='container'><nav>" + \
+                     directory + "</nav><section><h1>Static Server</h1>" + \
+                     "靜態網頁伺服器" + message + ": <a href='" + state["url"] + "content/index.html'>" + \
+                     state["url"] + "</a><br /><a href='/stop_static/'>Stop</a>" + \
+                     "</section></div></body></html>"
     else:
         return redirect("/login")
-def syntaxhighlight():
 
-    """Return syntaxhighlight needed scripts
+
+@app.route('/stop_static/')
+def stop_static():
+
+    """Stop the static server started by start_static
     """
 
-    return '''
-<script type="text/javascript" src="/static/syntaxhighlighter/shCore.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushBash.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushDiff.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushJScript.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushJava.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushPython.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushSql.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushHaxe.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushXml.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushPhp.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushPowerShell.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushLua.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushMojo.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushWbt.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushCpp.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushCss.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushCSharp.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushDart.js"></script>
-<script type="text/javascript" src="/static/syntaxhighlighter/shBrushRust.js"></script>
-<link type="text/css" rel="stylesheet" href="/static/syntaxhighlighter/css/shCoreDefault.css"/>
-<script type="text/javascript">SyntaxHighlighter.all();</script>
-<!-- 暫時不用
-<script src="/static/fengari-web.js"></script>
-<script type="text/javascript" src="/static/Cango-13v08-min.js"></script>
-<script type="text/javascript" src="/static/CangoAxes-4v01-min.js"></script>
-<script type="text/javascript" src="/static/gearUtils-05.js"></script>
+    if not isAdmin():
+        return redirect("/login")
+    head, level, page = parse_content()
+    directory = render_menu(head, level, page)
+    message = "已停止" if staticserver.stop() else "並未執行"
+    return set_css() + "<div class='container'><nav>" + \
+                 directory + "</nav><section><h1>Static Server</h1>" + \
+                 "靜態網頁伺服器" + message + \
+                 "</section></div></body></html>"
+
+
+@app.route('/static_status')
+def static_status():
+
+    """Return whether the static server runs, its url, uptime and open connections
+    """
+
+    if not isAdmin():
+        return redirect("/login")
+    return jsonify(staticserver.status())
+
+
+# syntaxhighlight2() 未指定頁面 brush 時載入的 brush
+syntaxhighlight_brushes = ["shBrushBash.js", "shBrushDiff.js", "shBrushJScript.js", "shBrushJava.js",
+                           "shBrushPython.js", "shBrushSql.js", "shBrushHaxe.js", "shBrushXml.js",
+                           "shBrushPhp.js", "shBrushPowerShell.js", "shBrushLua.js", "shBrushMojo.js",
+                           "shBrushWbt.js", "shBrushCpp.js", "shBrushCss.js", "shBrushCSharp.js",
+                           "shBrushDart.js", "shBrushRust.js"]
+
+
+def syntaxhighlight_extra(static):
+
+    """Return the markup after the syntaxhighlighter scripts, static is the url of the static directory
+    """
+
+    return '''<!-- 暫時不用
+<script src="''' + static + '''fengari-web.js"></script>
+<script type="text/javascript" src="''' + static + '''Cango-13v08-min.js"></script>
+<script type="text/javascript" src="''' + static + '''CangoAxes-4v01-min.js"></script>
+<script type="text/javascript" src="''' + static + '''gearUtils-05.js"></script>
 -->
 <!-- for Brython 暫時不用
 <script src="https://scrum-3.github.io/web/brython/brython.js"></script>
@@ -3013,49 +3548,53 @@ img.add_border {
 '''
 
 
-def syntaxhighlight2():
+def syntaxhighlight():
 
-    """Return syntaxhighlight for static pages
+    """Return syntaxhighlight needed scripts, brushes are loaded by shAutoloader when a page uses them
     """
 
+    brushes = {}
+    for alias, name in bundle.brush_aliases(os.path.join(app.static_folder, "syntaxhighlighter")).items():
+        brushes.setdefault(name, []).append(alias)
+    autoloader = ",\n        ".join("'" + " ".join(aliases) + " /static/syntaxhighlighter/" + name + "'"
+                                   for name, aliases in sorted(brushes.items()))
     return '''
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shCore.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushBash.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushDiff.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushJScript.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushJava.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushPython.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushSql.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushHaxe.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushXml.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushPhp.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushPowerShell.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushLua.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushMojo.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushWbt.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushCpp.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushCss.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushCSharp.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushDart.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/shBrushRust.js"></script>
-<link type="text/css" rel="stylesheet" href="./../cmsimde/static/syntaxhighlighter/css/shCoreDefault.css"/>
+<script type="text/javascript" src="/static/syntaxhighlighter/shCore.js"></script>
+<script type="text/javascript" src="/static/syntaxhighlighter/shAutoloader.js"></script>
+<link type="text/css" rel="stylesheet" href="/static/syntaxhighlighter/css/shCoreDefault.css"/>
+<script type="text/javascript">
+// shAutoloader 在頁面中尋找 brush 參數, 因此在文件載入後才執行
+document.addEventListener("DOMContentLoaded", function () {
+    SyntaxHighlighter.autoloader(
+        ''' + autoloader + '''
+    );
+    SyntaxHighlighter.all();
+});
+</script>
+''' + syntaxhighlight_extra("/static/")
+
+
+def syntaxhighlight2(brushes=None, bundle_name=None):
+
+    """Return syntaxhighlight for static pages
+
+    brushes 為頁面用到的 brush 檔名, 沒有 brush 時不載入 syntaxhighlighter, 預設為 syntaxhighlight_brushes.
+    bundle_name 為 shCore.js 與 brushes 串接而成的 bundle 檔名
+    """
+
+    if brushes is None:
+        brushes = syntaxhighlight_brushes
+    outstring = "\n"
+    if brushes:
+        if bundle_name is not None:
+            outstring += '<script type="text/javascript" src="' + bundle_name + '"></script>\n'
+        else:
+            for name in ["shCore.js"] + list(brushes):
+                outstring += '<script type="text/javascript" src="./../cmsimde/static/syntaxhighlighter/' + name + '"></script>\n'
+        outstring += '''<link type="text/css" rel="stylesheet" href="./../cmsimde/static/syntaxhighlighter/css/shCoreDefault.css"/>
 <script type="text/javascript">SyntaxHighlighter.all();</script>
-<!-- 暫時不用
-<script src="./../cmsimde/static/fengari-web.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/Cango-13v08-min.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/CangoAxes-4v01-min.js"></script>
-<script type="text/javascript" src="./../cmsimde/static/gearUtils-05.js"></script>
--->
-<!-- for Brython 暫時不用
-<script src="https://scrum-3.github.io/web/brython/brython.js"></script>
-<script src="https://scrum-3.github.io/web/brython/brython_stdlib.js"></script>
--->
-<style>
-img.add_border {
-    border: 3px solid blue;
-}
-</style>
 '''
+    return outstring + syntaxhighlight_extra("./../cmsimde/static/")
 
 
 def tinymce_editor(menu_input=None, editor_content=None, page_order=None):
@@ -3063,7 +3602,6 @@ def tinymce_editor(menu_input=None, editor_content=None, page_order=None):
     """Tinymce editor scripts
     """
 
-    sitecontent =file_get_contents(config_dir + "content.htm")
     editor = set_admin_css() + editorhead() + '''</head>''' + editorfoot()
     # edit all pages
     if page_order is None:
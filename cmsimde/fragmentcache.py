@@ -0,0 +1,90 @@
+# coding: utf-8
+
+"""Byte-bounded LRU cache of rendered get_page fragments
+
+選單, 頁首 css 與頁面內容在同一內容版本中皆相同, 以 (片段, 內容版本, ...) 為 key 保存.
+內容改變後舊版本的 key 不再被使用, 依 LRU 次序逐漸移出, 不需另外清除.
+"""
+
+import sys
+import threading
+import collections
+
+
+class FragmentCache(object):
+
+    """Thread safe LRU mapping whose values' total size stays within max_bytes
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key 對應 (片段, bytes), 最近使用的在最後
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+
+        """Return the fragment cached under key, None when missing
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+
+        """Cache value under key, evicting the least recently used fragments beyond max_bytes
+        """
+
+        size = sys.getsizeof(value)
+        # 超過上限的片段不保存, 以免清空整個 cache
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_render(self, key, render, valid=None):
+
+        """Return the fragment cached under key, calling render() and caching its result on a miss
+
+        valid() 在產生片段後傳回 False 時, 片段不放入 cache, 例如產生期間內容版本已經改變
+        """
+
+        value = self.get(key)
+        if value is None:
+            # 多個執行緒可能同時產生同一片段, 結果相同, 後寫入者取代前者
+            value = render()
+            if valid is None or valid():
+                self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+
+        """Return a copy of the counters and sizes for the fragment_stats route
+        """
+
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,352 @@
+# coding: utf-8
+
+"""Append-only revision journal of content.htm
+
+每次存檔只附加一筆 zlib 壓縮的差異紀錄, 取代先前每次完整複製的 content_backup.htm.
+第一筆, 以及內容在 journal 之外被改變 (例如 git pull) 時, 附加完整內容作為基準.
+單頁存檔以 record_splice 只比對改變的頁面範圍, 最後一筆紀錄保存在記憶體中, 不需讀取全文或整個 journal.
+
+python -m cmsimde.journal list [--config-dir config]
+python -m cmsimde.journal restore REV [--config-dir config] [--backend htm|sqlite]
+python -m cmsimde.journal compact [--keep 50] [--config-dir config]
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import difflib
+import hashlib
+import argparse
+import threading
+from cmsimde import contentstore
+
+# 同一 process 中的存檔與 compact 依序寫入 journal
+_lock = threading.Lock()
+# 各 journal 的 (檔案版本 key, 最後一筆紀錄的 header), 其他 process 寫入後 key 改變, 重新讀取
+_tails = {}
+# 比對共同前後綴時每次比較的字元數
+_CHUNK = 4096
+
+
+def _digest(text):
+
+    """Return hex digest of text recorded with every revision
+    """
+
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _common_prefix(a, b):
+
+    """Return length of the common prefix of a and b
+    """
+
+    n = min(len(a), len(b))
+    i = 0
+    # 先以整段比較快速跳過相同部分, 再逐字找出第一個不同字元
+    while i + _CHUNK <= n and a[i:i+_CHUNK] == b[i:i+_CHUNK]:
+        i += _CHUNK
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _common_suffix(a, b, limit):
+
+    """Return length of the common suffix of a and b, at most limit characters
+    """
+
+    n = min(len(a), len(b), limit)
+    i = 0
+    while i + _CHUNK <= n and a[len(a)-i-_CHUNK:len(a)-i] == b[len(b)-i-_CHUNK:len(b)-i]:
+        i += _CHUNK
+    while i < n and a[len(a)-i-1] == b[len(b)-i-1]:
+        i += 1
+    return i
+
+
+def diff(old, new):
+
+    """Return the changed range of old and line operations turning it into new
+    """
+
+    start = _common_prefix(old, new)
+    # 共同後綴不可與共同前綴重疊
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - start)
+    old_lines = old[start:len(old)-suffix].splitlines(True)
+    new_lines = new[start:len(new)-suffix].splitlines(True)
+    ops = [[i1, i2, "".join(new_lines[j1:j2])]
+           for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, False).get_opcodes()
+           if tag != "equal"]
+    return {"start": start, "end": len(old) - suffix, "ops": ops}
+
+
+def patch(old, change):
+
+    """Apply a diff() result to old
+    """
+
+    lines = old[change["start"]:change["end"]].splitlines(True)
+    parts = []
+    position = 0
+    for i1, i2, replacement in change["ops"]:
+        parts.extend(lines[position:i1])
+        parts.append(replacement)
+        position = i2
+    parts.extend(lines[position:])
+    return old[:change["start"]] + "".join(parts) + old[change["end"]:]
+
+
+def _records(journal_path, payloads=True):
+
+    """Yield (header, payload, end offset) of every complete record, payload is None when payloads is False
+    """
+
+    try:
+        f = open(journal_path, "rb")
+    except OSError:
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        while True:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            try:
+                header = json.loads(line.decode("utf-8"))
+            except ValueError:
+                break
+            # 寫入中斷的最後一筆紀錄不予採用
+            if f.tell() + header["size"] + 1 > size:
+                break
+            if payloads:
+                payload = f.read(header["size"])
+                f.seek(1, 1)
+            else:
+                payload = None
+                f.seek(header["size"] + 1, 1)
+            yield header, payload, f.tell()
+
+
+def revisions(journal_path):
+
+    """Return headers of every revision in journal_path, oldest first
+    """
+
+    return [header for header, payload, end in _records(journal_path, False)]
+
+
+def _encode(header, payload):
+
+    """Return the bytes of one journal record
+    """
+
+    header = dict(header, size=len(payload))
+    return json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n" + payload + b"\n"
+
+
+def _append(journal_path, header, payload):
+
+    """Append one record to journal_path and remember it as the last revision
+    """
+
+    with open(journal_path, "ab") as f:
+        f.write(_encode(header, payload))
+        f.flush()
+        os.fsync(f.fileno())
+    _tails[journal_path] = (contentstore.file_key(journal_path), header)
+
+
+def _tail(journal_path):
+
+    """Return the header of the last revision of journal_path, None when empty
+    """
+
+    try:
+        key = contentstore.file_key(journal_path)
+    except OSError:
+        return None
+    entry = _tails.get(journal_path)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    header, end = None, 0
+    for header, payload, end in _records(journal_path, False):
+        pass
+    if end != key[1]:
+        # 截去寫入中斷的紀錄, 新紀錄才會接在最後一筆完整紀錄之後
+        with open(journal_path, "r+b") as f:
+            f.truncate(end)
+        key = contentstore.file_key(journal_path)
+    _tails[journal_path] = (key, header)
+    return header
+
+
+def _base(journal_path, last, old):
+
+    """Append old as a full record unless it is the last revision's content, return the next revision number
+    """
+
+    rev = last["rev"] + 1 if last else 0
+    if last is None or last["sha1"] != _digest(old):
+        # 沒有基準或內容曾在 journal 之外變動, 先存入完整的舊內容
+        _append(journal_path, {"rev": rev, "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                               "type": "full", "action": "base", "sha1": _digest(old)},
+                zlib.compress(old.encode("utf-8")))
+        rev += 1
+    return rev
+
+
+def record(journal_path, old, new, version=None, **info):
+
+    """Append the change from old to new content as a new revision, return its header
+
+    version 為存檔後的內容版本, 下一次 record_splice 以此確認內容未在 journal 之外改變.
+    info 中的 action, order, heading 等資料一併存入紀錄, 供列表顯示
+    """
+
+    if old == new:
+        return None
+    with _lock:
+        rev = _base(journal_path, _tail(journal_path), old)
+        header = dict(info, rev=rev, time=time.strftime("%Y-%m-%d %H:%M:%S"), type="diff", sha1=_digest(new),
+                      version=version)
+        _append(journal_path, header, zlib.compress(json.dumps(diff(old, new), ensure_ascii=False).encode("utf-8")))
+    return header
+
+
+def record_splice(journal_path, splice, old_version, new_version, current, **info):
+
+    """Append a contentstore.Splice as a new revision, diffing only its range, return its header
+
+    old_version 與最後一筆紀錄的 version 相同時, 不需讀取全文; 否則以 current() 取得存檔後的全文,
+    還原出存檔前的內容作為基準
+    """
+
+    if splice.old == splice.new:
+        return None
+    with _lock:
+        last = _tail(journal_path)
+        if last is not None and old_version is not None and last.get("version") == old_version:
+            rev = last["rev"] + 1
+        else:
+            data = current().encode("utf-8")
+            end = splice.offset + len(splice.new.encode("utf-8"))
+            old = (data[:splice.offset] + splice.old.encode("utf-8") + data[end:]).decode("utf-8")
+            rev = _base(journal_path, last, old)
+        header = dict(info, rev=rev, time=time.strftime("%Y-%m-%d %H:%M:%S"), type="splice", sha1=splice.sha1,
+                      version=new_version)
+        change = {"offset": splice.offset, "length": len(splice.old.encode("utf-8")),
+                  "change": diff(splice.old, splice.new)}
+        _append(journal_path, header, zlib.compress(json.dumps(change, ensure_ascii=False).encode("utf-8")))
+    return header
+
+
+def patch_splice(old, change):
+
+    """Apply a record_splice change to old
+    """
+
+    data = old.encode("utf-8")
+    end = change["offset"] + change["length"]
+    replaced = patch(data[change["offset"]:end].decode("utf-8"), change["change"])
+    return (data[:change["offset"]] + replaced.encode("utf-8") + data[end:]).decode("utf-8")
+
+
+def text_at(journal_path, rev):
+
+    """Return content of revision rev rebuilt from the nearest full record before it
+    """
+
+    text = None
+    for header, payload, end in _records(journal_path):
+        if header["rev"] > rev:
+            break
+        data = zlib.decompress(payload).decode("utf-8")
+        if header["type"] == "full":
+            text = data
+        elif text is None:
+            pass
+        elif header["type"] == "splice":
+            text = patch_splice(text, json.loads(data))
+        else:
+            text = patch(text, json.loads(data))
+        if header["rev"] == rev:
+            # SQLite 的單頁存檔不計算全文 hash
+            if text is None or header["sha1"] is not None and _digest(text) != header["sha1"]:
+                raise ValueError("revision " + str(rev) + " cannot be rebuilt")
+            return text
+    raise KeyError("no revision " + str(rev))
+
+
+def compact(journal_path, keep=50):
+
+    """Drop all but the last keep revisions, folding the oldest kept one into a full record
+    """
+
+    with _lock:
+        records = list(_records(journal_path))
+        if len(records) <= keep:
+            return 0
+        cut = len(records) - keep
+        first, payload, end = records[cut]
+        if first["type"] != "full":
+            first = dict(first, type="full")
+            payload = zlib.compress(text_at(journal_path, first["rev"]).encode("utf-8"))
+        data = [_encode(first, payload)] + [_encode(header, payload) for header, payload, end in records[cut+1:]]
+        contentstore.write_atomic(journal_path, b"".join(data))
+    return cut
+
+
+def restore(config_dir, rev, backend="htm"):
+
+    """Restore the content in config_dir to revision rev and record it as a new revision, return its header
+    """
+
+    journal_path = os.path.join(config_dir, "content.journal")
+    text = text_at(journal_path, rev)
+    version = None
+    if backend == "sqlite":
+        from cmsimde import pagedb
+        db_path = os.path.join(config_dir, "content.db")
+        old = pagedb.export_text(db_path) if os.path.isfile(db_path) else ""
+        pagedb.save_all(db_path, text)
+        new = pagedb.export_text(db_path)
+        # 與 flaskapp.content_version 相同, 之後的單頁存檔不需讀取全文
+        version = "db-%d" % pagedb.version(db_path)
+    else:
+        htm_path = os.path.join(config_dir, "content.htm")
+        old = contentstore.read(htm_path) if os.path.isfile(htm_path) else ""
+        new = contentstore.save(htm_path, text)
+    return record(journal_path, old, new, version, action="restore", restored=rev)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m cmsimde.journal", description="content.htm revision journal")
+    parser.add_argument("command", choices=["list", "restore", "compact"])
+    parser.add_argument("rev", nargs="?", type=int, help="revision to restore")
+    parser.add_argument("--keep", type=int, default=50, help="revisions kept by compact")
+    parser.add_argument("--config-dir", default="config")
+    parser.add_argument("--backend", choices=["htm", "sqlite"], default=None,
+                        help="content backend restored, default init.py content_backend")
+    args = parser.parse_args()
+    journal_path = os.path.join(args.config_dir, "content.journal")
+    if args.command == "list":
+        for header in revisions(journal_path):
+            print("%5d  %s  %-10s %s" % (header["rev"], header["time"], header.get("action", ""),
+                                         header.get("heading") or ""))
+    elif args.command == "restore":
+        if args.rev is None:
+            parser.error("restore needs a revision")
+        backend = args.backend
+        if backend is None:
+            # 與 flaskapp 相同, 由網站根目錄取得 init.py
+            sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            import init
+            backend = getattr(init.Init, "content_backend", "htm")
+        restore(args.config_dir, args.rev, backend)
+        print(os.path.join(args.config_dir, "content.db" if backend == "sqlite" else "content.htm") +
+              " restored to revision " + str(args.rev))
+    else:
+        print(str(compact(journal_path, args.keep)) + " revisions removed from " + journal_path)
@@ -0,0 +1,378 @@
+# coding: utf-8
+
+"""SQLite page store backend for the CMS content model
+
+每一頁存為 pages 資料表中的一列, 由 init.py 中 Init.content_backend = "sqlite" 啟用.
+config/content.htm 可隨時匯入或匯出, 靜態網頁轉檔流程不受影響.
+
+python -m cmsimde.pagedb import|export [config_dir]
+"""
+
+import os
+import sys
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from cmsimde import contentstore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_order INTEGER PRIMARY KEY,
+    level TEXT NOT NULL,
+    heading TEXT NOT NULL,
+    markup TEXT NOT NULL,
+    body TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS pages_heading ON pages (heading);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('version', 0);
+"""
+# 非第一頁單頁存檔時, 先在前面放一個標題, 讓正規化以文件中段的規則處理該頁
+_PREFIX = "<h1>cmsimde</h1>"
+
+# 每個資料庫保留的閒置 connection 數
+POOL_SIZE = 4
+
+# 閒置的 connection 由同一 process 中的執行緒 (或 gevent greenlet) 輪流使用, key 為資料庫路徑
+_idle = {}
+# 本 process 中已建立 schema 的資料庫
+_schemas = set()
+_lock = threading.Lock()
+# fork 前開啟的 connection 不可在子 process 中使用, 也不關閉, 以免影響父 process 的鎖定
+_inherited = []
+
+
+def _forget_connections():
+    _inherited.extend(_idle.values())
+    _idle.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_connections)
+
+
+def _open(db_path):
+
+    """Return a new connection to db_path, creating the schema the first time db_path is opened
+    """
+
+    # 自行以 BEGIN/COMMIT 控制交易, connection 由 pool 交給其他執行緒使用
+    db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    with _lock:
+        created = db_path in _schemas
+    if not created:
+        # schema 含寫入, 只在每個 process 第一次開啟時執行
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(_SCHEMA)
+        with _lock:
+            _schemas.add(db_path)
+    return db
+
+
+@contextmanager
+def connect(db_path):
+
+    """Lend a pooled connection to db_path for the block
+    """
+
+    with _lock:
+        idle = _idle.get(db_path)
+        db = idle.pop() if idle else None
+    if db is None:
+        db = _open(db_path)
+    try:
+        yield db
+    finally:
+        with _lock:
+            idle = _idle.setdefault(db_path, [])
+            if len(idle) < POOL_SIZE:
+                idle.append(db)
+                db = None
+        if db is not None:
+            db.close()
+
+
+@contextmanager
+def transaction(db_path):
+
+    """Run the block in one write transaction and bump the content version
+    """
+
+    with connect(db_path) as db:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            db.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+
+@contextmanager
+def snapshot(db_path):
+
+    """Run the block in one read transaction, every query sees the same content version
+    """
+
+    with connect(db_path) as db:
+        db.execute("BEGIN")
+        try:
+            yield db
+        finally:
+            db.execute("COMMIT")
+
+
+def _version(db):
+    return db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0]
+
+
+def version(db_path):
+
+    """Return the content version, increased by every write transaction
+    """
+
+    with connect(db_path) as db:
+        return _version(db)
+
+
+def _row(order, level, title, markup, body):
+
+    """Return insert values of one page
+    """
+
+    digest = hashlib.sha1((markup + body).encode("utf-8")).hexdigest()
+    return (order, level, title, markup, body, digest)
+
+
+def _insert(db, rows):
+
+    """Insert page rows
+    """
+
+    db.executemany("INSERT INTO pages (page_order, level, heading, markup, body, hash) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def _subject_rows(subject, headings, first_order=0):
+
+    """Return page rows of subject split at its (level, title, start, end) headings
+
+    第一個標題之前的內容放在第一頁的標題之前, 匯出時與 content.htm 相同
+    """
+
+    pages = contentstore.split_pages(subject, headings)
+    return [_row(first_order + i, level, title, subject[start if i else 0:end], pages[i])
+            for i, (level, title, start, end) in enumerate(headings)]
+
+
+def save_all(db_path, subject):
+
+    """Replace every page with the normalized pages of subject
+    """
+
+    subject, headings = contentstore.parse_subject(subject)
+    rows = _subject_rows(subject, headings)
+    with transaction(db_path) as db:
+        db.execute("DELETE FROM pages")
+        _insert(db, rows)
+    return subject
+
+
+def save_page(db_path, order, subject):
+
+    """Replace page order with subject, which may hold more pages, in one transaction, return the Splice
+
+    Splice 的範圍為 export_text 中前一頁至下一頁的內容
+    """
+
+    if order > 0:
+        subject = contentstore.normalize(_PREFIX + subject)[len(_PREFIX):]
+    else:
+        subject = contentstore.normalize(subject)
+    headings = contentstore.heading_offsets(
+        subject, [(level, title, subject[start:end])
+                  for level, title, start, end in contentstore.scan_headings(subject)])
+    # 第一個標題之前的內容屬於前一頁
+    lead = subject[:headings[0][2]] if headings else subject
+    rows = []
+    for i, (level, title, start, end) in enumerate(headings):
+        stop = headings[i+1][2] if i + 1 < len(headings) else len(subject)
+        rows.append(_row(order + i, level, title, subject[start:end], subject[end:stop]))
+    with transaction(db_path) as db:
+        # 前一頁與下一頁可能因第一個標題之前的內容而改變
+        first = max(order - 1, 0)
+        offset = db.execute("SELECT COALESCE(SUM(LENGTH(CAST(markup AS BLOB)) + LENGTH(CAST(body AS BLOB))), 0) "
+                            "FROM pages WHERE page_order < ?", (first,)).fetchone()[0]
+        old_range = _range_text(db, first, order + 1)
+        if order == 0:
+            # 第一頁之前的內容不在編輯頁面中, 與 content.htm 相同保留, 新的內容接在其後
+            old = db.execute("SELECT level, heading, markup FROM pages WHERE page_order = 0").fetchone()
+            found = contentstore.scan_headings(old[2]) if old is not None else []
+            old_lead = old[2][:found[0][2]] if found else ""
+            following = db.execute("SELECT 1 FROM pages WHERE page_order = 1").fetchone()
+            if rows:
+                rows[0] = _row(0, rows[0][1], rows[0][2], old_lead + lead + rows[0][3], rows[0][4])
+            elif old is not None and following is None:
+                # 唯一一頁的標題被刪去時, 沒有其他頁面可放置內容, 保留原標題, 內容成為該頁內容
+                rows = [_row(0, old[0], old[1], old[2], lead)]
+                lead = ""
+            else:
+                lead = old_lead + lead
+        db.execute("DELETE FROM pages WHERE page_order = ?", (order,))
+        if lead and order > 0:
+            previous = db.execute("SELECT level, heading, markup, body FROM pages WHERE page_order = ?",
+                                  (order - 1,)).fetchone()
+            db.execute("UPDATE pages SET body = ?, hash = ?, updated_at = CURRENT_TIMESTAMP "
+                       "WHERE page_order = ?",
+                       (previous[3] + lead, _row(order - 1, previous[0], previous[1],
+                        previous[2], previous[3] + lead)[5], order - 1))
+        elif lead and not rows:
+            # 第一頁的標題被刪去時, 內容放在下一頁的標題之前
+            following = db.execute("SELECT level, heading, markup, body FROM pages WHERE page_order = ?",
+                                   (order + 1,)).fetchone()
+            if following is not None:
+                db.execute("UPDATE pages SET markup = ?, hash = ?, updated_at = CURRENT_TIMESTAMP "
+                           "WHERE page_order = ?",
+                           (lead + following[2], _row(order + 1, following[0], following[1],
+                            lead + following[2], following[3])[5], order + 1))
+        shift = len(rows) - 1
+        if shift:
+            # 先轉為負值再轉回, 避免 primary key 在更新過程中重複
+            db.execute("UPDATE pages SET page_order = -(page_order + ?) WHERE page_order > ?",
+                       (shift, order))
+            db.execute("UPDATE pages SET page_order = -page_order WHERE page_order < 0")
+        _insert(db, rows)
+        new_range = _range_text(db, first, order + 1 + shift)
+    return contentstore.Splice(offset, old_range, new_range, None)
+
+
+def _range_text(db, first, last):
+
+    """Return export_text of pages first to last
+    """
+
+    rows = db.execute("SELECT markup, body FROM pages WHERE page_order BETWEEN ? AND ? ORDER BY page_order",
+                      (first, last))
+    return "".join(markup + body for markup, body in rows)
+
+
+def _load(db, columns):
+
+    """Return lists of the columns of every page in page order
+    """
+
+    rows = db.execute("SELECT " + ", ".join(columns) + " FROM pages ORDER BY page_order").fetchall()
+    if not rows:
+        return "Error: no data in content.db"
+    return tuple([row[i] for row in rows] for i in range(len(columns)))
+
+
+def _load_headings(db):
+
+    """Return head and level lists with an empty page list
+    """
+
+    result = _load(db, ("heading", "level"))
+    # 與 get 的 snapshot 相同為 (head, level, page), 頁面另行讀取
+    return result if isinstance(result, str) else result + ((),)
+
+
+def get(db_path):
+
+    """Return head, level and page lists, cached until the content version changes
+    """
+
+    # 版本與頁面在同一 read transaction 中取得, cache 中的頁面必定屬於該版本
+    with snapshot(db_path) as db:
+        return contentstore.cached(db_path, _version(db), lambda: _load(db, ("heading", "level", "body")))
+
+
+class PageRows(object):
+
+    """Page list read one row at a time through the page_order primary key
+    """
+
+    def __init__(self, db_path, count, content_version):
+        self.db_path = db_path
+        self.count = count
+        self.content_version = content_version
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, order):
+        with snapshot(self.db_path) as db:
+            current = _version(db)
+            row = db.execute("SELECT body FROM pages WHERE page_order = ?", (order,)).fetchone()
+        # 版本改變時, 頁面次序可能已經不同, 改用完整讀取的結果
+        if current != self.content_version or row is None:
+            return get(self.db_path)[2][order]
+        return row[0]
+
+
+def get_pages(db_path):
+
+    """Return head and level lists plus lazily read pages, all of the content version PageRows carries
+    """
+
+    # 只讀取標題與層級, 頁面內容由 PageRows 以 primary key 逐頁讀取
+    with snapshot(db_path) as db:
+        content_version = _version(db)
+        headings = contentstore.cached(db_path + "#headings", content_version, lambda: _load_headings(db))
+    if isinstance(headings, str):
+        return headings
+    return headings.head, headings.level, PageRows(db_path, len(headings.head), content_version)
+
+
+def import_htm(db_path, htm_path):
+
+    """Replace the pages in db_path with the pages of content.htm
+    """
+
+    subject = contentstore.read(htm_path)
+    subject, headings = contentstore.parse_subject(subject, contentstore.is_normalized(htm_path, subject))
+    rows = _subject_rows(subject, headings)
+    with transaction(db_path) as db:
+        db.execute("DELETE FROM pages")
+        _insert(db, rows)
+    return len(rows)
+
+
+def export_text(db_path):
+
+    """Return content.htm text of the stored pages
+    """
+
+    with connect(db_path) as db:
+        rows = db.execute("SELECT markup, body FROM pages ORDER BY page_order")
+        return "".join(markup + body for markup, body in rows)
+
+
+def export_htm(db_path, htm_path):
+
+    """Write the stored pages to content.htm
+    """
+
+    return contentstore.save(htm_path, export_text(db_path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "export"):
+        raise SystemExit("usage: python -m cmsimde.pagedb import|export [config_dir]")
+    config_dir = sys.argv[2] if len(sys.argv) > 2 else "config"
+    db_path = os.path.join(config_dir, "content.db")
+    htm_path = os.path.join(config_dir, "content.htm")
+    if sys.argv[1] == "import":
+        print(str(import_htm(db_path, htm_path)) + " pages imported into " + db_path)
+    elif not os.path.isfile(db_path):
+        raise SystemExit("no " + db_path + " to export")
+    else:
+        export_htm(db_path, htm_path)
+        print(db_path + " exported to " + htm_path)
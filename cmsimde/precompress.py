@@ -0,0 +1,310 @@
+# coding: utf-8
+
+"""Precompressed gzip and brotli siblings of static site text assets
+
+轉檔後為大於 MIN_SIZE 的文字檔產生 .gz 與 (安裝 brotli 時) .br 壓縮檔, 伺服器依 Accept-Encoding
+直接送出壓縮檔, 執行時不需再壓縮. 壓縮檔的修改時間設為與原檔相同, 原檔未改變時不重新壓縮,
+原檔之後被修改時, 伺服器也不會送出過期的壓縮檔.
+"""
+
+import os
+import gzip
+import datetime
+import tempfile
+import mimetypes
+import email.utils
+import http.server
+import concurrent.futures
+from cmsimde import bundle
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 預先壓縮的文字檔類型
+TEXT_TYPES = (".html", ".htm", ".js", ".css", ".json", ".svg", ".xml", ".txt", ".map")
+# 小於此 bytes 數的檔案壓縮效益低, 不產生壓縮檔
+MIN_SIZE = 1024
+
+
+def variants():
+
+    """Return (Content-Encoding, file suffix, compress function) of each available encoding, preferred first
+    """
+
+    found = []
+    if brotli is not None:
+        found.append(("br", ".br", lambda data: brotli.compress(data, quality=11)))
+    # mtime=0 讓相同內容產生相同的 .gz 檔
+    found.append(("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0)))
+    return found
+
+
+def _replace(path, data, st):
+
+    """Write data beside path, give it the modification time of source stat st and os.replace it into place
+    """
+
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, st.st_mode & 0o777)
+        os.utime(temp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def compress_file(path, min_size=MIN_SIZE):
+
+    """Write the compressed siblings of path whose source changed, return the number written
+
+    壓縮後未變小或原檔小於 min_size 時, 移除既有的壓縮檔
+    """
+
+    st = os.stat(path)
+    data = None
+    written = 0
+    for encoding, suffix, compress in variants():
+        target = path + suffix
+        if st.st_size < min_size:
+            _remove(target)
+            continue
+        try:
+            if os.stat(target).st_mtime_ns == st.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            _remove(target)
+            continue
+        _replace(target, compressed, st)
+        written += 1
+    return written
+
+
+def compress_tree(directory, min_size=MIN_SIZE, jobs=None, prune=True):
+
+    """Compress every text asset under directory in a thread pool, return (files checked, siblings written)
+
+    prune 為 True 時, 移除原檔已不存在的壓縮檔. zlib 與 brotli 壓縮時會釋放 GIL, 以執行緒平行處理
+    """
+
+    sources = []
+    for root, dirs, files in os.walk(directory):
+        names = set(files)
+        for name in files:
+            # .build-manifest.json 等隱藏檔不對外提供
+            if name.startswith("."):
+                continue
+            if name.endswith(TEXT_TYPES):
+                sources.append(os.path.join(root, name))
+            elif prune and name.endswith((".gz", ".br")):
+                source, suffix = os.path.splitext(name)
+                if source.endswith(TEXT_TYPES) and source not in names:
+                    os.remove(os.path.join(root, name))
+    if not sources:
+        return 0, 0
+    with concurrent.futures.ThreadPoolExecutor(jobs or os.cpu_count() or 1) as executor:
+        written = sum(executor.map(lambda path: compress_file(path, min_size), sources))
+    return len(sources), written
+
+
+def accepted(header):
+
+    """Return the Content-Encodings an Accept-Encoding header allows, with their q values
+    """
+
+    found = {}
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, sep, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        found[coding] = q
+    return found
+
+
+def choose(path, header):
+
+    """Return (file, Content-Encoding) of the best fresh precompressed sibling of path the client accepts
+
+    沒有合用的壓縮檔時傳回 (path, None)
+    """
+
+    codings = accepted(header or "")
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None
+    best = None
+    for encoding, suffix, compress in variants():
+        q = codings.get(encoding, codings.get("*", 0.0))
+        if q <= 0 or (best is not None and q <= best[0]):
+            continue
+        try:
+            # 原檔在壓縮後被修改時不使用壓縮檔
+            if os.stat(path + suffix).st_mtime_ns < st.st_mtime_ns:
+                continue
+        except OSError:
+            continue
+        best = (q, path + suffix, encoding)
+    if best is None:
+        return path, None
+    return best[1], best[2]
+
+
+def has_variant(path):
+
+    """Return True when path has a precompressed sibling, so its response depends on Accept-Encoding
+    """
+
+    return any(os.path.isfile(path + suffix) for encoding, suffix, compress in variants())
+
+
+def etag(st, encoding=None):
+
+    """Return the strong ETag of a file stat, different for each Content-Encoding
+    """
+
+    return '"%x-%x%s"' % (st.st_mtime_ns, st.st_size, "-" + encoding if encoding else "")
+
+
+def etag_matches(header, tag):
+
+    """Return True when an If-None-Match header lists tag, weak tags compared as strong
+    """
+
+    if header.strip() == "*":
+        return True
+    for item in header.split(","):
+        item = item.strip()
+        if item.startswith("W/"):
+            item = item[2:]
+        if item == tag:
+            return True
+    return False
+
+
+class PrecompressedHandler(http.server.SimpleHTTPRequestHandler):
+
+    """SimpleHTTPRequestHandler that sends the .br or .gz sibling of a file when the client accepts it
+
+    以 HTTP/1.1 保持連線, 檔案以 sendfile 送出, 並以 ETag 與 Last-Modified 回應 304.
+    含內容 hash 的 bundle 與 nav asset 另加上長期快取的 Cache-Control
+    """
+
+    protocol_version = "HTTP/1.1"
+    # 閒置的保持連線在此秒數後關閉
+    timeout = 30
+    vary = False
+    cache_control = None
+
+    def end_headers(self):
+        if self.vary:
+            self.send_header("Vary", "Accept-Encoding")
+        if self.cache_control is not None:
+            self.send_header("Cache-Control", self.cache_control)
+        http.server.SimpleHTTPRequestHandler.end_headers(self)
+
+    def not_modified(self, tag, st):
+        # If-None-Match 優先於 If-Modified-Since
+        if "If-None-Match" in self.headers:
+            return etag_matches(self.headers["If-None-Match"], tag)
+        if "If-Modified-Since" not in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        if ims.tzinfo is not datetime.timezone.utc:
+            return False
+        last_modif = datetime.datetime.fromtimestamp(st.st_mtime, datetime.timezone.utc)
+        return last_modif.replace(microsecond=0) <= ims
+
+    def send_head(self):
+        self.vary = False
+        self.cache_control = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            # 與 SimpleHTTPRequestHandler 相同, 沒有結尾 / 時轉址, 沒有 index.html 時列出目錄
+            if not self.path.split("?", 1)[0].split("#", 1)[0].endswith("/"):
+                return http.server.SimpleHTTPRequestHandler.send_head(self)
+            for index in ("index.html", "index.htm"):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                return http.server.SimpleHTTPRequestHandler.send_head(self)
+        if not os.path.isfile(path):
+            return http.server.SimpleHTTPRequestHandler.send_head(self)
+        self.vary = has_variant(path)
+        self.cache_control = bundle.cache_control(path)
+        variant, encoding = choose(path, self.headers.get("Accept-Encoding"))
+        try:
+            f = open(variant, "rb")
+        except OSError:
+            self.send_error(http.HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        try:
+            fs = os.fstat(f.fileno())
+            tag = etag(fs, encoding)
+            if self.not_modified(tag, fs):
+                self.send_response(http.HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", tag)
+                self.end_headers()
+                f.close()
+                return None
+            self.send_response(http.HTTPStatus.OK)
+            self.send_header("Content-type", self.guess_type(path))
+            if encoding is not None:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(fs.st_size))
+            self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.send_header("ETag", tag)
+            self.end_headers()
+            return f
+        except BaseException:
+            f.close()
+            raise
+
+    def copyfile(self, source, outputfile):
+        # 由 kernel 直接送出檔案內容, TLS 連線由 ssl 模組改以一般寫入送出
+        try:
+            self.connection.sendfile(source)
+        except (AttributeError, ValueError, NotImplementedError):
+            http.server.SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
+
+
+def content_type(path):
+
+    """Return the Content-Type of path as the uncompressed file
+    """
+
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
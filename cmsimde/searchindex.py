@@ -0,0 +1,206 @@
+# coding: utf-8
+
+"""Sharded inverted index of static pages for the search box
+
+取代內含全部頁面文字的 tipuesearch_content.js. 詞彙以英數字詞與中日韓文字的兩字詞 (bigram) 為單位,
+依詞彙第一個字元分成多個 shard, 瀏覽器只載入查詢詞所在的 shard.
+cmsimde/static/tipuesearch/cmsimde_search.js 以相同規則切詞並查詢.
+
+content/search/meta.js       cmsimde_search.meta({"version", "pages": [[標題, 網址, 摘要]], "shards"})
+content/search/<shard>.js    cmsimde_search.shard(shard, {詞彙: [頁次, 次數, 位置差...]})
+"""
+
+import os
+import re
+import json
+import hashlib
+from html.parser import HTMLParser
+
+# 英數字詞, 以及連續的中日韓文字 (與 cmsimde_search.js 中的 pattern 相同)
+_TOKEN = re.compile("[0-9a-z\u00c0-\u024f]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+")
+_CJK = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+_SHARD_CHARS = "0123456789abcdefghijklmnopqrstuvwxyz"
+# 每頁摘要字數
+DESCRIPTION_LENGTH = 160
+# 各 shard 檔案所在的子目錄
+SEARCH_DIR = "search"
+
+
+class VisibleText(HTMLParser):
+
+    """Single pass collector of the text a reader sees, without building a document tree
+
+    script, style, head 與 title 內的文字及註解皆不收集, title 文字另存於 title.
+    """
+
+    skipped = ("script", "style", "head", "title")
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.parts = []
+        self.title_parts = []
+        # 尚未結束的 skipped 標註
+        self.open_skipped = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skipped:
+            self.open_skipped.append(tag)
+        elif tag == "body" and "head" in self.open_skipped:
+            # 與瀏覽器相同, body 開始時 head 隨之結束
+            del self.open_skipped[self.open_skipped.index("head"):]
+
+    def handle_endtag(self, tag):
+        if tag in self.open_skipped:
+            while self.open_skipped.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if not self.open_skipped:
+            self.parts.append(data)
+        elif self.open_skipped[-1] == "title":
+            self.title_parts.append(data)
+
+    def close(self):
+        HTMLParser.close(self)
+        # 各段文字以空白相接, 連續空白縮為一個
+        return " ".join("".join(self.title_parts).split()), " ".join(" ".join(self.parts).split())
+
+
+def extract_text(html):
+
+    """Return (title, visible text) of html, whitespace collapsed
+    """
+
+    parser = VisibleText()
+    parser.feed(html)
+    return parser.close()
+
+
+def visible_text(html):
+
+    """Return the visible text of html, whitespace collapsed
+    """
+
+    return extract_text(html)[1]
+
+
+def tokenize(text):
+
+    """Return the search terms of text in order, CJK runs split into overlapping bigrams
+    """
+
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        run = match.group(0)
+        if len(run) > 1 and _CJK.match(run):
+            tokens.extend(run[i:i+2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def shard_key(term):
+
+    """Return the shard of term: its first letter or digit, other characters grouped by 256 code points
+    """
+
+    first = term[0]
+    if first in _SHARD_CHARS:
+        return first
+    return "u%x" % (ord(first) >> 8)
+
+
+def build(pages):
+
+    """Return (meta, shards) of pages given as (title, url, text) tuples
+
+    每個詞彙的 posting 為 [頁次, 次數, 位置差, ...] 依頁次排列的扁平 list
+    """
+
+    postings = {}
+    for page_id, (title, url, text) in enumerate(pages):
+        # 標題接在內文之前一起編入位置
+        positions = {}
+        for position, term in enumerate(tokenize(title + " " + text)):
+            positions.setdefault(term, []).append(position)
+        for term, term_positions in positions.items():
+            posting = postings.setdefault(term, [])
+            posting.append(page_id)
+            posting.append(len(term_positions))
+            previous = 0
+            for position in term_positions:
+                posting.append(position - previous)
+                previous = position
+    shards = {}
+    for term in sorted(postings):
+        shards.setdefault(shard_key(term), {})[term] = postings[term]
+    meta = {"pages": [[title, url, " ".join(text.split())[:DESCRIPTION_LENGTH]] for title, url, text in pages]}
+    return meta, shards
+
+
+def js_json(value, separators=(",", ":")):
+
+    """Return value as JSON that is also a valid javascript expression
+    """
+
+    data = json.dumps(value, ensure_ascii=False, separators=separators)
+    # JSON 允許而舊版 javascript 字串不允許的行分隔字元
+    return data.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+
+
+def _script(call, *args):
+
+    """Return javascript calling cmsimde_search.call with JSON arguments
+    """
+
+    return "cmsimde_search." + call + "(" + ",".join(js_json(arg) for arg in args) + ");\n"
+
+
+def scripts(pages):
+
+    """Return file name to text of meta.js and every shard script of pages
+    """
+
+    meta, shards = build(pages)
+    files = {}
+    meta["shards"] = {}
+    for key, terms in shards.items():
+        data = _script("shard", key, terms)
+        files[key + ".js"] = data
+        # shard 內容的 hash 讓瀏覽器在內容改變時重新載入
+        meta["shards"][key] = hashlib.sha1(data.encode("utf-8")).hexdigest()[:12]
+    meta["version"] = hashlib.sha1(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    files["meta.js"] = _script("meta", meta)
+    return files
+
+
+def write(content_dir, pages, write_file):
+
+    """Write the search scripts of pages to content_dir/search, removing stale shards
+
+    write_file(path, data) 只在內容改變時寫入, 傳回寫入的檔案數
+    """
+
+    search_dir = os.path.join(content_dir, SEARCH_DIR)
+    os.makedirs(search_dir, exist_ok=True)
+    files = scripts(pages)
+    for name in os.listdir(search_dir):
+        if name.endswith(".js") and name not in files:
+            os.remove(os.path.join(search_dir, name))
+    return sum(1 for name, data in sorted(files.items()) if write_file(os.path.join(search_dir, name), data))
+
+
+def remove(content_dir):
+
+    """Remove the search scripts of content_dir, used when the site returns to tipuesearch_content.js
+    """
+
+    search_dir = os.path.join(content_dir, SEARCH_DIR)
+    # 沒有 meta.js 的 search 目錄不是由此產生, 不予處理
+    if not os.path.isfile(os.path.join(search_dir, "meta.js")):
+        return
+    for name in os.listdir(search_dir):
+        if name.endswith(".js"):
+            os.remove(os.path.join(search_dir, name))
+    if not os.listdir(search_dir):
+        os.rmdir(search_dir)
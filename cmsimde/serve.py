@@ -0,0 +1,320 @@
+# coding: utf-8
+
+"""Production launcher of the dynamic site, replacing main.py, waitress_server.py and wsgi.py
+
+python -m cmsimde.serve [--server auto|gevent|waitress|prefork|uvicorn] [--host HOST] [--port PORT]
+                        [--threads N] [--workers N] [--certfile FILE --keyfile FILE] [--no-warm]
+
+auto 依序使用已安裝的 gevent 與 waitress, 兩者皆未安裝時使用 prefork. prefork 在 POSIX 系統上
+fork 多個 worker process 共用同一 listening socket, 各 worker 以固定大小的 thread pool 處理要求.
+先綁定 port, 再解析 content 並產生選單, 頁首與第一頁的快取. waitress 與單一 process 時
+預熱在背景執行緒中進行, 期間已可回應要求, /ready 回應 503, 完成後回應 200. gevent 的預熱在 greenlet 中進行,
+不讓出 CPU, 預熱期間的連線在預熱完成後才處理. 多個 worker 的 prefork 在 fork 前預熱,
+worker 繼承預熱後的快取, 預熱期間的連線在 listening socket 中等候. 各 worker 無法共用 start_static
+啟動的靜態網頁伺服器狀態, 因此多個 worker 時網頁中的 start_static 停用.
+uvicorn 執行 cmsimde.asgi, 不在 auto 的選擇之中.
+
+gevent 必須在 socket, threading 與 ssl 被 import 之前 monkey patch, 因此本模組開頭只 import
+不使用這些模組的標準函式庫, 其餘在選定伺服器之後才 import.
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib.util
+
+# 與 flaskapp 相同, 由網站根目錄取得 init.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import init
+
+SERVERS = ("auto", "gevent", "waitress", "prefork", "uvicorn")
+# gevent 預設同時處理的連線數, greenlet 成本低, 不依 CPU 數調整
+GEVENT_CONNECTIONS = 1000
+# prefork worker 意外結束後, 重新 fork 前等待的秒數
+RESPAWN_DELAY = 1.0
+
+
+def available(server):
+
+    """Return True when the module server needs can be imported
+    """
+
+    if server == "prefork":
+        return True
+    # 只尋找模組而不 import, gevent 尚未 monkey patch 前不載入其他模組
+    return importlib.util.find_spec(server) is not None
+
+
+def pick_server(server):
+
+    """Return the server auto stands for, the first of gevent, waitress and prefork installed
+    """
+
+    if server != "auto":
+        return server
+    for name in ("gevent", "waitress"):
+        if available(name):
+            return name
+    return "prefork"
+
+
+def auto_workers(server, cpu=None):
+
+    """Return the default number of processes of server
+    """
+
+    if server != "prefork" or not hasattr(os, "fork"):
+        return 1
+    return 2 * (cpu or os.cpu_count() or 1) + 1
+
+
+def auto_threads(server, cpu=None):
+
+    """Return the default number of request threads of each process of server
+    """
+
+    if server == "gevent":
+        return GEVENT_CONNECTIONS
+    cpu = cpu or os.cpu_count() or 1
+    # prefork 已依 CPU 數增加 process, 各 worker 只需少量執行緒處理 I/O 等待
+    if server == "prefork" and hasattr(os, "fork"):
+        return 4
+    return min(32, max(4, 2 * cpu))
+
+
+def warm(flaskapp):
+
+    """Parse the content and render the menu, header and first page into the caches, return the seconds taken
+
+    在另一執行緒中進行; pagedb 在 fork 後不使用 fork 前開啟的 sqlite connection
+    """
+
+    import threading
+    import urllib.parse
+    result = {}
+
+    def run():
+        start = time.perf_counter()
+        pages = flaskapp.parse_content()
+        # 沒有 content.htm 時 parse_content 傳回錯誤訊息, 不需預熱
+        if not isinstance(pages, str) and pages[0]:
+            client = flaskapp.app.test_client()
+            url = "/get_page/" + urllib.parse.quote(pages[0][0], safe="")
+            # 一般與 gzip 要求分別填入 fragment cache 與壓縮結果 cache
+            client.get(url)
+            client.get(url, headers={"Accept-Encoding": "gzip, br"})
+        result["seconds"] = time.perf_counter() - start
+
+    thread = threading.Thread(target=run, name="cmsimde-warm")
+    thread.start()
+    thread.join()
+    return result.get("seconds")
+
+
+def pooled_server_class():
+
+    """Return a werkzeug BaseWSGIServer subclass handling requests in a fixed size thread pool
+    """
+
+    import concurrent.futures
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class Handler(WSGIRequestHandler):
+        # 每個要求後關閉連線, 閒置的 keep-alive 連線不會佔住 pool 中的執行緒
+        protocol_version = "HTTP/1.0"
+
+    class Server(BaseWSGIServer):
+        multithread = True
+
+        def __init__(self, host, port, app, threads, fd=None, ssl_context=None):
+            BaseWSGIServer.__init__(self, host, port, app, handler=Handler, ssl_context=ssl_context, fd=fd)
+            self.pool = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="cmsimde-request")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+        def process_request_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return Server
+
+
+def listen(host, port):
+
+    """Return a listening socket at host:port that forked workers inherit
+    """
+
+    import socket
+    from cmsimde import staticserver
+    sock = socket.socket(staticserver.address_family(host), socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+    return sock
+
+
+def ssl_context(certfile, keyfile):
+    if certfile is None:
+        return None
+    import ssl
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def run_gevent(app, sock, threads, certfile, keyfile):
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+    options = {}
+    if certfile is not None:
+        options = {"certfile": certfile, "keyfile": keyfile}
+    WSGIServer(sock, app, spawn=Pool(threads), **options).serve_forever()
+
+
+def run_waitress(app, sock, threads):
+    import waitress
+    waitress.serve(app, sockets=[sock], threads=threads, ident="cmsimde")
+
+
+def run_uvicorn(host, port, threads, certfile, keyfile):
+    import uvicorn
+    from cmsimde import asgi
+    # 快取預熱由 asgi 的 lifespan startup 進行
+    uvicorn.run(asgi.ReadApp(threads=threads), host=host, port=port, log_level="warning",
+                ssl_certfile=certfile, ssl_keyfile=keyfile, lifespan="on")
+
+
+def run_prefork(app, sock, threads, workers, certfile, keyfile):
+
+    """Serve app from workers forked processes sharing one listening socket, restarting workers that exit
+    """
+
+    import signal
+    server_class = pooled_server_class()
+    context = ssl_context(certfile, keyfile)
+    host, port = sock.getsockname()[:2]
+    if workers <= 1 or not hasattr(os, "fork"):
+        # Windows 沒有 fork, 以單一 process 執行
+        server_class(host, port, app, threads, fd=sock.fileno(), ssl_context=context).serve_forever()
+        return
+    children = set()
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server_class(host, port, app, threads, fd=sock.fileno(), ssl_context=context).serve_forever()
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print("worker %d exited with status %d, restarting" % (pid, status), file=sys.stderr)
+            time.sleep(RESPAWN_DELAY)
+            spawn()
+    sock.close()
+
+
+def main(argv=None):
+
+    """Warm the caches and serve the dynamic site until interrupted
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m cmsimde.serve", description="dynamic site server")
+    parser.add_argument("--server", choices=SERVERS, default=getattr(init.Init, "serve_server", "auto"),
+                        help="default init.py serve_server")
+    parser.add_argument("--host", default=init.Init.ip, help="default init.py ip")
+    parser.add_argument("--port", type=int, default=init.Init.dynamic_port, help="default init.py dynamic_port")
+    parser.add_argument("--threads", type=int, default=getattr(init.Init, "serve_threads", None),
+                        help="request threads per process (greenlets for gevent), default from the cpu count")
+    parser.add_argument("--workers", type=int, default=getattr(init.Init, "serve_workers", None),
+                        help="prefork processes, default 2 * cpu count + 1")
+    parser.add_argument("--certfile", default=None, help="serve https with this certificate, e.g. cert.pem")
+    parser.add_argument("--keyfile", default=None, help="private key of --certfile, e.g. key.pem")
+    parser.add_argument("--no-warm", action="store_true", help="accept requests without warming the caches")
+    args = parser.parse_args(argv)
+    if (args.certfile is None) != (args.keyfile is None):
+        parser.error("--certfile and --keyfile go together")
+    server = pick_server(args.server)
+    if not available(server):
+        parser.error(server + " is not installed, pip install " + server + " or use --server prefork")
+    # 0 不是未指定, 由下方檢查回報錯誤
+    threads = auto_threads(server) if args.threads is None else args.threads
+    workers = auto_workers(server) if args.workers is None else args.workers
+    if threads < 1 or workers < 1:
+        parser.error("--threads and --workers must be at least 1")
+    if server == "waitress" and args.certfile is not None:
+        parser.error("waitress does not serve https, put stunnel or a reverse proxy in front of it")
+    if server == "uvicorn":
+        if workers > 1:
+            # 登入 session 中的 token 在各 process 中不同, uvicorn 的 worker 不是由同一 process fork 而來
+            parser.error("uvicorn runs one worker, admin logins are only valid in the process they were made in")
+        print("cmsimde uvicorn server on %s://%s:%d/, %d thread(s)" %
+              ("https" if args.certfile else "http", args.host, args.port, threads))
+        run_uvicorn(args.host, args.port, threads, args.certfile, args.keyfile)
+        return 0
+    if server == "gevent":
+        # 在 import socket, threading, ssl 與 flaskapp 之前置換, 檔案與 sqlite 以外的 I/O 才不會阻擋其他連線
+        from gevent import monkey
+        monkey.patch_all()
+    import threading
+    from cmsimde import flaskapp
+    sock = listen(args.host, args.port)
+    forked = server == "prefork" and workers > 1 and hasattr(os, "fork")
+    flaskapp.readiness.update({"ready": args.no_warm, "server": server, "workers": workers, "threads": threads})
+    url = "%s://%s:%d/" % ("https" if args.certfile else "http", args.host, args.port)
+    print("cmsimde %s server on %s, %d worker(s) x %d thread(s)" % (server, url, workers, threads))
+
+    def warm_caches():
+        seconds = warm(flaskapp)
+        flaskapp.readiness.update({"ready": True, "warm_seconds": seconds})
+        print("caches warmed in %s" % ("-" if seconds is None else "%.3f s" % seconds))
+
+    if args.no_warm:
+        pass
+    elif forked:
+        # worker 繼承預熱後的快取, 預熱期間的連線在 listening socket 中等候
+        warm_caches()
+    else:
+        threading.Thread(target=warm_caches, name="cmsimde-warm-start", daemon=True).start()
+    if server == "gevent":
+        run_gevent(flaskapp.app, sock, threads, args.certfile, args.keyfile)
+    elif server == "waitress":
+        run_waitress(flaskapp.app, sock, threads)
+    else:
+        run_prefork(flaskapp.app, sock, threads, workers, args.certfile, args.keyfile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
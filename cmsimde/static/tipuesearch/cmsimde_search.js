@@ -0,0 +1,223 @@
+/*
+cmsimde static search: queries the sharded inverted index written by cmsimde/searchindex.py
+and shows the results in #tipue_search_content with the tipuesearch.css classes.
+
+Terms are split as in searchindex.tokenize(): lower case letter and digit words, CJK runs as
+overlapping bigrams. Letter words and single characters also match longer terms they begin.
+Only the shards of the query terms are loaded, from search/<shard>.js beside the page.
+*/
+
+var cmsimde_search = (function () {
+
+    var token = /[0-9a-z\u00c0-\u024f]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+/g;
+    var cjk = /^[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]/;
+    var meta = null;
+    var shards = {};
+    var waiting = {};
+
+    function tokenize(text) {
+        var tokens = [], match, run, i;
+        text = text.toLowerCase();
+        token.lastIndex = 0;
+        while ((match = token.exec(text)) !== null) {
+            run = match[0];
+            if (run.length > 1 && cjk.test(run)) {
+                for (i = 0; i + 1 < run.length; i++) {
+                    tokens.push(run.substr(i, 2));
+                }
+            } else {
+                tokens.push(run);
+            }
+        }
+        return tokens;
+    }
+
+    function shardKey(term) {
+        var first = term.charAt(0);
+        if (/[0-9a-z]/.test(first)) {
+            return first;
+        }
+        return "u" + (first.charCodeAt(0) >> 8).toString(16);
+    }
+
+    function load(name, done) {
+        if (name === "meta" ? meta : shards[name]) {
+            done();
+            return;
+        }
+        if (waiting[name]) {
+            waiting[name].push(done);
+            return;
+        }
+        waiting[name] = [done];
+        var script = document.createElement("script");
+        script.src = "search/" + name + ".js" + (name === "meta" ? "" : "?v=" + meta.shards[name]);
+        script.onerror = function () {
+            // 載入失敗的 shard 視為沒有任何詞彙
+            if (name === "meta") {
+                meta = {"pages": [], "shards": {}};
+            } else {
+                shards[name] = {};
+            }
+            loaded(name);
+        };
+        document.head.appendChild(script);
+    }
+
+    function loaded(name) {
+        var callbacks = waiting[name] || [];
+        delete waiting[name];
+        for (var i = 0; i < callbacks.length; i++) {
+            callbacks[i]();
+        }
+    }
+
+    // 查詢詞在各頁的位置, {頁次: [位置, ...]}
+    function positions(term) {
+        var found = {}, shard = shards[shardKey(term)] || {}, prefix = !cjk.test(term) || term.length === 1;
+        for (var key in shard) {
+            if (key === term || (prefix && key.lastIndexOf(term, 0) === 0)) {
+                var posting = shard[key], i = 0;
+                while (i < posting.length) {
+                    var page = posting[i], count = posting[i + 1], position = 0;
+                    found[page] = found[page] || [];
+                    for (var j = 0; j < count; j++) {
+                        position += posting[i + 2 + j];
+                        found[page].push(position);
+                    }
+                    i += 2 + count;
+                }
+            }
+        }
+        return found;
+    }
+
+    function rank(query, terms) {
+        var lists = [], results = [], page, i;
+        for (i = 0; i < terms.length; i++) {
+            lists.push(positions(terms[i]));
+        }
+        for (page in lists[0]) {
+            var score = 0, all = true;
+            for (i = 0; i < lists.length; i++) {
+                if (!lists[i][page]) {
+                    all = false;
+                    break;
+                }
+                score += lists[i][page].length;
+            }
+            if (!all) {
+                continue;
+            }
+            // 查詢詞依序相鄰出現時加分, 兩字詞查詢即為完整字串比對
+            var sets = [];
+            for (i = 0; i < lists.length; i++) {
+                sets.push({});
+                for (var j = 0; j < lists[i][page].length; j++) {
+                    sets[i][lists[i][page][j]] = true;
+                }
+            }
+            for (var p = 0; p < lists[0][page].length; p++) {
+                var start = lists[0][page][p], phrase = true;
+                for (i = 1; i < lists.length && phrase; i++) {
+                    phrase = sets[i][start + i] === true;
+                }
+                if (phrase) {
+                    score += 10;
+                }
+            }
+            if (meta.pages[page][0].toLowerCase().indexOf(query.toLowerCase()) !== -1) {
+                score += 50;
+            }
+            results.push([score, +page]);
+        }
+        results.sort(function (a, b) { return b[0] - a[0] || a[1] - b[1]; });
+        return results;
+    }
+
+    function escape(text) {
+        return text.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;").replace(/"/g, "&quot;");
+    }
+
+    function show(query, results) {
+        var out = '<div id="tipue_search_results_count">' + results.length + ' results</div>';
+        for (var i = 0; i < results.length; i++) {
+            var page = meta.pages[results[i][1]];
+            out += '<div class="tipue_search_result">' +
+                '<div class="tipue_search_content_title"><a href="' + escape(page[1]) + '">' + escape(page[0]) + '</a></div>' +
+                '<div class="tipue_search_content_url"><a href="' + escape(page[1]) + '">' + escape(page[1]) + '</a></div>' +
+                '<div class="tipue_search_content_text">' + escape(page[2]) + '</div></div>';
+        }
+        if (!results.length) {
+            out += '<div id="tipue_search_error">Nothing found for ' + escape(query) + '</div>';
+        }
+        document.getElementById("tipue_search_content").innerHTML = out;
+    }
+
+    function search(query, done) {
+        var terms = tokenize(query);
+        if (!terms.length) {
+            done([]);
+            return;
+        }
+        load("meta", function () {
+            var names = [], pending, i;
+            for (i = 0; i < terms.length; i++) {
+                var name = shardKey(terms[i]);
+                if (meta.shards[name] && names.indexOf(name) === -1) {
+                    names.push(name);
+                }
+            }
+            pending = names.length;
+            if (!pending) {
+                done([]);
+                return;
+            }
+            for (i = 0; i < names.length; i++) {
+                load(names[i], function () {
+                    pending -= 1;
+                    if (!pending) {
+                        done(rank(query, terms));
+                    }
+                });
+            }
+        });
+    }
+
+    function start() {
+        var input = document.getElementById("tipue_search_input");
+        var match = /[?&]q=([^&#]*)/.exec(location.search);
+        if (!input || !match) {
+            return;
+        }
+        var query = match[1].replace(/\+/g, " ");
+        try {
+            query = decodeURIComponent(query);
+        } catch (e) {
+            query = unescape(query);
+        }
+        input.value = query;
+        search(query, function (results) {
+            show(query, results);
+        });
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", start);
+    } else {
+        start();
+    }
+
+    return {
+        "tokenize": tokenize,
+        "search": search,
+        "meta": function (data) {
+            meta = data;
+            loaded("meta");
+        },
+        "shard": function (name, data) {
+            shards[name] = data;
+            loaded(name);
+        }
+    };
+})();
@@ -0,0 +1,165 @@
+# coding: utf-8
+
+"""Background https server of the static site, started and stopped by flaskapp routes
+
+伺服器在背景執行緒中執行, 不佔用 Flask 的 request 執行緒. 每個連線由各自的執行緒處理,
+TLS handshake 也在連線的執行緒中進行, 慢速的用戶端不會阻擋其他連線.
+同一 process 只啟動一個伺服器, 重複啟動時傳回執行中伺服器的狀態.
+"""
+
+import os
+import sys
+import ssl
+import time
+import errno
+import socket
+import threading
+import functools
+import http.server
+import socketserver
+from cmsimde import precompress
+
+# 執行中的伺服器狀態, 沒有伺服器時為 None, 以 _lock 保護
+_running = None
+_lock = threading.Lock()
+
+
+def address_family(host):
+
+    """Return the socket address family of host, an IPv4 or IPv6 address or a host name
+    """
+
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return family
+        except (OSError, ValueError):
+            pass
+    # 不是有效的 IP 時, 假設是 hostname 或 localhost
+    return socket.AF_INET6 if ":" in host else socket.AF_INET
+
+
+class StaticServer(http.server.ThreadingHTTPServer):
+
+    """ThreadingHTTPServer that wraps each accepted connection in TLS inside the connection thread
+    """
+
+    daemon_threads = True
+    # TLS handshake 的逾時秒數
+    handshake_timeout = 30
+    # Windows 的 SO_REUSEADDR 允許兩個 socket 綁定同一 port, 改用 SO_EXCLUSIVEADDRUSE
+    allow_reuse_address = os.name != "nt"
+
+    def __init__(self, server_address, handler, ssl_context=None):
+        self.ssl_context = ssl_context
+        # 處理中的連線數, 由 status() 傳回
+        self.connections = 0
+        self.connections_lock = threading.Lock()
+        self.address_family = address_family(server_address[0])
+        http.server.ThreadingHTTPServer.__init__(self, server_address, handler)
+
+    def server_bind(self):
+        if os.name == "nt":
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        if self.address_family == socket.AF_INET6:
+            try:
+                # IPv6 雙棧支援, 系統不支援時只使用 IPv6
+                self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            except (AttributeError, OSError):
+                pass
+        # 不使用 HTTPServer.server_bind 中可能很慢的 socket.getfqdn()
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = self.server_address[0]
+        self.server_port = self.server_address[1]
+
+    def finish_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections += 1
+        try:
+            if self.ssl_context is None:
+                self.RequestHandlerClass(request, client_address, self)
+                return
+            request.settimeout(self.handshake_timeout)
+            connection = self.ssl_context.wrap_socket(request, server_side=True)
+            try:
+                self.RequestHandlerClass(connection, client_address, self)
+            finally:
+                self.shutdown_request(connection)
+        finally:
+            with self.connections_lock:
+                self.connections -= 1
+
+    def handle_error(self, request, client_address):
+        # 用戶端中斷連線或拒絕自簽憑證時不列出 traceback
+        error = sys.exc_info()[1]
+        if isinstance(error, (ssl.SSLError, ConnectionError, socket.timeout)):
+            return
+        http.server.ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+def start(host, port, directory, certfile=None, keyfile=None, handler=precompress.PrecompressedHandler):
+
+    """Serve directory at host:port in a background thread, https when certfile is given
+
+    已有伺服器執行時不再啟動, 傳回 (是否新啟動, 狀態). port 無法綁定時 raise OSError
+    """
+
+    global _running
+    with _lock:
+        if _running is not None:
+            return False, _status()
+        context = None
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+        server = StaticServer((host, port), functools.partial(handler, directory=directory), context)
+        thread = threading.Thread(target=server.serve_forever, name="cmsimde-static-server", daemon=True)
+        thread.start()
+        _running = {"server": server, "thread": thread, "directory": directory, "started": time.time(),
+                    "scheme": "https" if context is not None else "http"}
+        return True, _status()
+
+
+def stop():
+
+    """Stop the background server, return False when none is running
+    """
+
+    global _running
+    with _lock:
+        if _running is None:
+            return False
+        _running["server"].shutdown()
+        _running["server"].server_close()
+        _running["thread"].join()
+        _running = None
+        return True
+
+
+def _status():
+    if _running is None:
+        return {"running": False}
+    server = _running["server"]
+    host, port = server.server_address[:2]
+    if server.address_family == socket.AF_INET6:
+        host = "[" + host + "]"
+    return {"running": True, "url": _running["scheme"] + "://" + host + ":" + str(port) + "/",
+            "directory": _running["directory"], "uptime": round(time.time() - _running["started"], 1),
+            "connections": server.connections}
+
+
+def status():
+
+    """Return the state of the background server for the static_status route
+    """
+
+    with _lock:
+        return _status()
+
+
+def port_in_use(error):
+
+    """Return True when OSError error means the port is already bound by another program
+    """
+
+    return error.errno in (errno.EADDRINUSE, getattr(errno, "WSAEADDRINUSE", errno.EADDRINUSE))
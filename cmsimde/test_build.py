@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import json
+import time
+import random
+import shutil
+import tempfile
+import functools
+import threading
+import html.parser
+import http.client
+import http.server
+import subprocess
+import urllib.parse
+import unittest
+
+from cmsimde import bench, contentstore, flaskapp, precompress, searchindex
+from cmsimde.test_flaskapp import SiteTestCase
+
+
+class BuildTestCase(SiteTestCase):
+    # 轉檔結果寫入暫存目錄中的各子目錄
+    def setUp(self):
+        super(BuildTestCase, self).setUp()
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+
+    def build(self, name, *args, **kwargs):
+        content_dir = os.path.join(self.work, name) + "/"
+        os.makedirs(content_dir, exist_ok=True)
+        flaskapp.build_static(content_dir, *args, **kwargs)
+        return content_dir
+
+    def edit(self, order, html):
+        head, level, page = contentstore.get(self.content_path)
+        contentstore.save(self.content_path, "".join(
+            "<h" + level[i] + ">" + head[i] + "</h" + level[i] + ">" + page[i] + (html if i == order else "")
+            for i in range(len(head))))
+
+
+class TestBuildStatic(BuildTestCase):
+    def setUp(self):
+        super(TestBuildStatic, self).setUp()
+        self.pages = 120
+        self.save(bench.synthetic_content(self.pages)[0])
+
+    def test_jobs_identical(self):
+        self.assertEqual(bench.read_tree(self.build("serial", 1)), bench.read_tree(self.build("pool", 2)))
+
+    def test_per_page_rendering(self):
+        # 與 user-011 之前逐頁解析的轉檔結果比較
+        tree = bench.read_tree(self.build("content", 1))
+        newhead = flaskapp.static_heads(flaskapp.parse_content()[0])
+        for order in random.Random(self.pages).sample(range(self.pages), 10):
+            html_doc = flaskapp.get_page2(newhead[order], newhead, 0)
+            expected = html_doc.replace('<meta charset="utf-8">', '<meta charset="utf-8">\n<meta property="head" '
+                                        'content="H' + str(1 + order % 3) + '">')
+            self.assertEqual(tree[newhead[order] + ".html"].decode("utf-8"), expected, newhead[order])
+
+    def test_search_text(self):
+        page = flaskapp.parse_content()[2]
+        self.assertEqual([searchindex.visible_text(w) for w in page], [bench.legacy_search_text(w) for w in page])
+
+    def test_incremental(self):
+        # 修改一頁的內容後再刪除最後一頁, 增量轉檔須與完整轉檔相同, 且不重寫內容未改變的檔案
+        content_dir = self.build("content", 1)
+        newhead = flaskapp.static_heads(flaskapp.parse_content()[0])
+        edited = self.pages // 2
+        for written in ({newhead[edited] + ".html", "tipuesearch_content.js"}, None):
+            before = dict((name, os.stat(content_dir + name).st_mtime_ns) for name in os.listdir(content_dir))
+            # 確保重寫的檔案修改時間必定不同
+            time.sleep(0.01)
+            if written is not None:
+                self.edit(edited, "<p>edited</p>")
+            else:
+                subject = contentstore.read(self.content_path)
+                contentstore.save(self.content_path, subject[:subject.rindex("<h")])
+            flaskapp.build_static(content_dir, 1, True)
+            full_dir = self.build("full" + str(written is None), 1)
+            self.assertEqual(bench.read_tree(content_dir), bench.read_tree(full_dir))
+            rewritten = set(name for name in os.listdir(content_dir)
+                            if before.get(name) != os.stat(content_dir + name).st_mtime_ns)
+            rewritten.discard(".build-manifest.json")
+            if written is not None:
+                self.assertEqual(rewritten, written)
+
+    def test_incremental_index(self):
+        content_dir = self.build("index", 1, search="index")
+        self.edit(self.pages // 2, "<p>edited 索引</p>")
+        flaskapp.build_static(content_dir, 1, True, search="index")
+        full_dir = self.build("full", 1, search="index")
+        self.assertEqual(bench.read_tree(content_dir), bench.read_tree(full_dir))
+        self.assertEqual(bench.read_tree(content_dir + searchindex.SEARCH_DIR),
+                         bench.read_tree(full_dir + searchindex.SEARCH_DIR))
+
+
+# 以最少的 DOM 執行 nav asset, 印出 script 加入選單的 [標題, 子選單] 樹
+NAV_DOM = """
+function element(tag) {
+    return {tag: tag, children: [], attributes: {}, textContent: "",
+            setAttribute: function (name, value) { this.attributes[name] = value; },
+            appendChild: function (child) { child.parentNode = this; this.children.push(child); },
+            insertBefore: function (child, before) {
+                var i = before === null ? -1 : this.children.indexOf(before);
+                this.children.splice(i < 0 ? this.children.length : i, 0, child);
+            }};
+}
+var menu = element("ul"), script = element("script");
+menu.appendChild(script);
+var document = {currentScript: script, createElement: element};
+%s
+function tree(ul) {
+    return ul.children.filter(function (li) { return li.tag == "li"; }).map(function (li) {
+        var a = li.children[0], sub = li.children.filter(function (c) { return c.tag == "ul"; });
+        return [a.textContent, sub.length ? tree(sub[0]) : []];
+    });
+}
+console.log(JSON.stringify(tree(menu)));
+"""
+
+
+class MenuParser(html.parser.HTMLParser):
+    # 依瀏覽器的規則建立 site-menu 的 [標題, 子選單] 樹: 新的 li 關閉未結束的 li, </ul> 一併關閉其中的 li
+    def __init__(self):
+        html.parser.HTMLParser.__init__(self)
+        self.tree = None
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "ul" and self.tree is None and "site-menu" in (dict(attrs).get("class") or ""):
+            self.tree = []
+            self.stack = [("ul", self.tree)]
+        elif not self.stack:
+            return
+        elif tag == "ul":
+            self.stack.append(("ul", self.stack[-1][1][1] if self.stack[-1][0] == "li" else []))
+        elif tag == "li":
+            if self.stack[-1][0] == "li":
+                self.stack.pop()
+            item = ["", []]
+            self.stack[-1][1].append(item)
+            self.stack.append(("li", item))
+        elif tag == "a":
+            self.stack.append(("a", self.stack[-1][1]))
+
+    def handle_endtag(self, tag):
+        if not self.stack:
+            return
+        if tag in ("li", "a") and self.stack[-1][0] == tag:
+            self.stack.pop()
+        elif tag == "ul":
+            while self.stack and self.stack.pop()[0] != "ul":
+                pass
+
+    def handle_data(self, data):
+        if self.stack and self.stack[-1][0] == "a":
+            self.stack[-1][1][0] += data
+
+
+class TestNavAsset(BuildTestCase):
+    def setUp(self):
+        super(TestNavAsset, self).setUp()
+        # 含跳過層級的標題, 選單與 render_menu2 相同只往下一層
+        levels = [1, 2, 3, 3, 1, 3, 2, 1, 2, 2, 3, 1]
+        self.save("".join("<h%d>Page %d</h%d><p>%d</p>" % (l, i, l, i) for i, l in enumerate(levels)))
+        self.head, self.level, page = flaskapp.parse_content()
+        parser = MenuParser()
+        parser.feed(flaskapp.render_menu2(self.head, self.level, page))
+        # 第一項為主頁選單
+        self.inline = parser.tree[1:]
+
+    def test_same_tree_as_inline_menu(self):
+        self.assertEqual(flaskapp.static_nav_tree(self.head, self.level), self.inline)
+
+    @unittest.skipUnless(shutil.which("node"), "no node to run the nav asset")
+    def test_script_builds_inline_menu(self):
+        name, data = flaskapp.static_nav_asset(self.head, self.level)
+        output = subprocess.run(["node", "-e", NAV_DOM % data], stdout=subprocess.PIPE, check=True).stdout
+        self.assertEqual(json.loads(output.decode("utf-8")), self.inline)
+
+    def test_pages_load_asset(self):
+        content_dir = self.build("external", 1, nav="external")
+        name = flaskapp.static_nav_asset(self.head, self.level)[0]
+        tree = bench.read_tree(content_dir)
+        self.assertEqual(tree[name].decode("utf-8"), flaskapp.static_nav_asset(self.head, self.level)[1])
+        for page in ["index.html"] + [head + ".html" for head in self.head]:
+            html = tree[page].decode("utf-8")
+            self.assertIn("<script src='" + name + "'></script>", html, page)
+            self.assertNotIn("<a href='Page 5.html'>Page 5</a>", html, page)
+        # 選單改變時 asset 檔名隨之改變, 舊檔案被刪除
+        self.edit(0, "<h2>Added</h2><p>a</p>")
+        flaskapp.build_static(content_dir, 1, True, nav="external")
+        self.assertNotIn(name, os.listdir(content_dir))
+
+
+class TestStaticUrls(unittest.TestCase):
+    def test_same_as_replace_passes(self):
+        rnd = random.Random(2024)
+        page = [bench.url_page(rnd) for i in range(2000)]
+        self.assertEqual(flaskapp.static_urls(page), bench.legacy_urls(page))
+
+
+class QuietHandler(precompress.PrecompressedHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPrecompress(BuildTestCase):
+    def setUp(self):
+        super(TestPrecompress, self).setUp()
+        self.save(bench.synthetic_content(100)[0])
+        self.content_dir = self.build("content", 1, precompress_assets=False)
+
+    def test_compress_tree(self):
+        precompress.compress_tree(self.content_dir)
+        self.assertEqual(precompress.compress_tree(self.content_dir)[1], 0)
+        tree = bench.read_tree(self.content_dir)
+        self.assertIn("index.html.gz", tree)
+        for name, data in tree.items():
+            if name.endswith(".gz"):
+                self.assertEqual(gzip.decompress(data), tree[name[:-3]], name)
+        # 刪除的頁面其壓縮檔一併移除
+        os.remove(self.content_dir + "Page 1.html")
+        precompress.compress_tree(self.content_dir)
+        self.assertFalse(os.path.exists(self.content_dir + "Page 1.html.gz"))
+
+    def test_served(self):
+        precompress.compress_tree(self.content_dir)
+        handler = functools.partial(QuietHandler, directory=self.content_dir)
+        httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        for name in ("index.html", "Page 2.html", "sitemap.html", "tipuesearch_content.js"):
+            with open(self.content_dir + name, "rb") as f:
+                data = f.read()
+            for accept in ("gzip, deflate", "identity", "gzip;q=0"):
+                connection = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1])
+                connection.request("GET", "/" + urllib.parse.quote(name), headers={"Accept-Encoding": accept})
+                response = connection.getresponse()
+                body = response.read()
+                connection.close()
+                compressed = accept == "gzip, deflate" and os.path.isfile(self.content_dir + name + ".gz")
+                self.assertEqual(response.getheader("Content-Encoding"), "gzip" if compressed else None)
+                self.assertEqual(gzip.decompress(body) if compressed else body, data)
+
+
+if __name__ == "__main__":
+    unittest.main()
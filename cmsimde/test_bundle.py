@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cmsimde import bundle
+
+BRUSH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "syntaxhighlighter")
+
+
+class TestPageBrushes(unittest.TestCase):
+    def setUp(self):
+        super(TestPageBrushes, self).setUp()
+        self.aliases = bundle.brush_aliases(BRUSH_DIR)
+
+    def test_aliases(self):
+        self.assertEqual(self.aliases["py"], "shBrushPython.js")
+        self.assertEqual(self.aliases["python"], "shBrushPython.js")
+        self.assertEqual(self.aliases["js"], "shBrushJScript.js")
+
+    def test_class_attributes(self):
+        html = ("<pre class=\"brush: py\">a</pre><pre class='brush:js; gutter: false'>b</pre>"
+                "<pre CLASS = \"code brush: cpp;\">c</pre><pre class=\"brush: python\">d</pre>")
+        self.assertEqual(bundle.page_brushes(html, self.aliases),
+                         ("shBrushCpp.js", "shBrushJScript.js", "shBrushPython.js"))
+
+    def test_unknown_and_plain_text(self):
+        # 沒有 brush 檔案的語言, 以及 class 屬性以外的文字不列入
+        html = "<pre class=\"brush: nothing\">a</pre><p>brush: py</p><pre title=\"brush: js\">b</pre>"
+        self.assertEqual(bundle.page_brushes(html, self.aliases), ())
+        self.assertEqual(bundle.page_brushes("", self.aliases), ())
+
+
+class TestBundle(unittest.TestCase):
+    def test_concatenated_in_order(self):
+        work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work)
+        paths = []
+        for name, data in (("a.js", "\ufeff'use strict';\nvar a = 1"), ("b.js", "var b = 2 // end\n\n")):
+            paths.append(os.path.join(work, name))
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                f.write(data)
+        name, data = bundle.bundle("sh", paths)
+        self.assertEqual(data, ";\n/* a.js */\n'use strict';\nvar a = 1\n;\n/* b.js */\nvar b = 2 // end\n;\n")
+        self.assertEqual(name, bundle.fingerprinted("sh", data))
+        self.assertRegex(name, bundle.FINGERPRINT)
+        self.assertEqual(bundle.cache_control("/content/" + name), bundle.IMMUTABLE)
+        self.assertIsNone(bundle.cache_control("/content/index.html"))
+        self.assertNotEqual(bundle.bundle("sh", paths[::-1])[0], name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from cmsimde import bench, contentstore
+
+# 隨附的 content.htm, 由網站根目錄取得
+SHIPPED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "content.htm")
+
+
+def split_with(subject, headings):
+    headings = contentstore.heading_offsets(subject, headings)
+    return ([title for level, title, start, end in headings],
+            [level for level, title, start, end in headings],
+            contentstore.split_pages(subject, headings))
+
+
+def fuzz_content(rnd):
+
+    """Return random content.htm text mixing headings with markup bs4 handles specially
+    """
+
+    titles = ["About", "Dup", "w5_1", "中文 標題", "A &amp; B", "x &lt; y", " pad ", "Dup"]
+    bodies = ["<p>text</p>", "<!-- <h1>About</h1> -->", "<script>var s = '<h2>x</h2>';</script>",
+              "<style>h1 {color: red}</style>", "<br/>", "<img src=\"/images/a.png\"/>",
+              "<pre class=\"brush: python\">a\n  b</pre>", "&nbsp;", "<table><tr><td>1</td></tr></table>",
+              "\n", "<p>line\r\nbreak</p>", "<div><p>nested</p></div>", "plain & text"]
+    inner = ["", "<b>bold</b>", "<span>s</span> t", "<img src='x.png'/>", "<!-- c -->",
+             "<script>1</script>", "<ruby>r<rt>t</rt></ruby>", "<br/>"]
+    parts = []
+    for i in range(rnd.randint(1, 40)):
+        level = rnd.choice("123")
+        attrs = rnd.choice(["", " id=\"h%d\"" % i, " class='c' style=\"color:red\""])
+        title = rnd.choice(titles) + rnd.choice(inner) if rnd.random() < 0.3 else rnd.choice(titles)
+        parts.append("<h%s%s>%s</h%s>" % (level, attrs, title, level))
+        parts.extend(rnd.choice(bodies) for j in range(rnd.randint(0, 4)))
+    return "".join(parts)
+
+
+class TestSplit(unittest.TestCase):
+    def test_offset_split(self):
+        subject, htag = bench.synthetic_content(500)
+        self.assertEqual(bench.offset_split(subject, htag), tuple(bench.legacy_split(subject, htag)))
+
+    def test_heading_index(self):
+        head = [tag.text for tag in bench.synthetic_content(500)[1]]
+        self.assertEqual(bench.indexed_lookups(head), bench.legacy_lookups(head))
+
+
+class TestTokenizer(unittest.TestCase):
+    # 串流 tokenizer 找到的標題與分頁結果須與 bs4 相同
+    def assertSameAsBs4(self, subject):
+        self.assertEqual(split_with(subject, bench.scanned_headings(subject)),
+                         split_with(subject, bench.bs4_headings(subject)), subject[:2000])
+
+    @unittest.skipUnless(os.path.isfile(SHIPPED), "no shipped content.htm")
+    def test_shipped(self):
+        self.assertSameAsBs4(contentstore.normalize(contentstore.read(SHIPPED)))
+
+    def test_fuzzed(self):
+        rnd = random.Random(2024)
+        for i in range(500):
+            self.assertSameAsBs4(contentstore.normalize(fuzz_content(rnd)))
+
+    def test_synthetic(self):
+        subject = bench.synthetic_content(1000)[0]
+        self.assertEqual(bench.scanned_headings(subject), bench.bs4_headings(subject))
+
+
+class TestSavePage(unittest.TestCase):
+    def setUp(self):
+        super(TestSavePage, self).setUp()
+        work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work)
+        self.path = os.path.join(work, "content.htm")
+
+    def tearDown(self):
+        contentstore.invalidate()
+        super(TestSavePage, self).tearDown()
+
+    def splice(self, rnd):
+        # 隨機置換一頁, 結果須與整份存檔相同, 傳回是否以 splice 存檔
+        subject = contentstore.read(self.path)
+        index = contentstore.get_index(self.path)
+        data = subject.encode("utf-8")
+        order = rnd.randrange(len(index["pages"]))
+        head_start, stop = index["pages"][order][2], index["pages"][order][4]
+        if rnd.random() < 0.5:
+            new = fuzz_content(rnd)
+        else:
+            # 保留原標題, 只改變頁面內容
+            new = data[head_start:index["pages"][order][3]].decode("utf-8") + \
+                  "".join(fuzz_content(rnd).split(">", 1)[1:])
+        expected = contentstore.normalize(data[:head_start].decode("utf-8") + new + data[stop:].decode("utf-8"))
+        if contentstore.save_page(self.path, order, new) is None:
+            return False
+        result = contentstore.read(self.path)
+        spliced_index = contentstore.get_index(self.path)
+        snapshot = contentstore.get(self.path)
+        contentstore.invalidate()
+        parsed = contentstore.parse_file(self.path)
+        self.assertEqual(result, expected)
+        self.assertEqual(tuple(tuple(item) for item in parsed), tuple(tuple(item) for item in snapshot))
+        contentstore.save(self.path, result)
+        self.assertEqual(contentstore.get_index(self.path)["pages"], spliced_index["pages"])
+        return True
+
+    def test_fuzzed(self):
+        rnd = random.Random(2024)
+        spliced = 0
+        for i in range(200):
+            contentstore.save(self.path, fuzz_content(rnd))
+            if contentstore.get_index(self.path)["pages"]:
+                spliced += self.splice(rnd)
+        self.assertTrue(spliced)
+
+    def test_middle_page(self):
+        subject = bench.synthetic_content(1000)[0]
+        contentstore.save(self.path, subject)
+        head, level, page = contentstore.get(self.path)
+        order = len(head) // 2
+        new = "<h2>" + head[order] + "</h2>" + page[order] + "<p>edited</p>"
+        contentstore.save(self.path, "".join(
+            new if i == order else "<h" + level[i] + ">" + head[i] + "</h" + level[i] + ">" + page[i]
+            for i in range(len(head))))
+        expected = contentstore.read(self.path)
+        contentstore.save(self.path, subject)
+        contentstore.get(self.path)
+        self.assertIsNotNone(contentstore.save_page(self.path, order, new))
+        self.assertEqual(contentstore.read(self.path), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
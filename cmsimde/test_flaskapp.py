@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+
+from cmsimde import bench, contentstore, flaskapp, fragmentcache, compress
+
+
+def stress_version(pages, name):
+    # 每頁內容含版本與頁面次序
+    return "".join("<h%d>page_%d</h%d><p>version %s page %d</p>\n" % (1 + i % 2, i, 1 + i % 2, name, i)
+                   for i in range(pages))
+
+
+class SiteTestCase(unittest.TestCase):
+    # 在暫存目錄中建立網站, 結束後還原 flaskapp 的設定
+    def setUp(self):
+        super(SiteTestCase, self).setUp()
+        saved = (flaskapp.config_dir, flaskapp.content_backend, flaskapp.fragment_cache, flaskapp.journal_path)
+        self.addCleanup(self.restore, saved)
+        self.config_dir = tempfile.mkdtemp() + "/"
+        self.addCleanup(shutil.rmtree, self.config_dir)
+        self.content_path = self.config_dir + "content.htm"
+        flaskapp.config_dir = self.config_dir
+        flaskapp.journal_path = self.config_dir + "content.journal"
+        flaskapp.content_backend = "htm"
+        self.client = flaskapp.app.test_client()
+
+    def restore(self, saved):
+        flaskapp.config_dir, flaskapp.content_backend, flaskapp.fragment_cache, flaskapp.journal_path = saved
+        contentstore.invalidate()
+
+    def save(self, subject):
+        contentstore.save(self.content_path, subject)
+        flaskapp.parse_config()
+
+
+class TestConcurrentSaves(SiteTestCase):
+    def test_no_torn_reads(self):
+        # 兩個版本的頁數不同, 讀到混合內容時頁面內容或頁數必定不符
+        pages = 50
+        versions = [stress_version(pages, "A"), stress_version(pages + 1, "B")]
+        self.save(versions[0])
+        stop = threading.Event()
+        errors = []
+        requests = [0] * 4
+
+        def read(number):
+            client = flaskapp.app.test_client()
+            rnd = random.Random(number)
+            while not stop.is_set():
+                order = rnd.randrange(pages)
+                response = client.get("/get_page/page_" + str(order))
+                text = response.get_data(as_text=True)
+                if response.status_code != 200 or \
+                   ("version A page %d<" % order not in text and "version B page %d<" % order not in text):
+                    errors.append("get_page/page_%d: %d %s" % (order, response.status_code, text[-300:]))
+                head, level, page = contentstore.get(self.content_path)
+                name = "A" if len(head) == pages else "B"
+                if page[order] != "<p>version %s page %d</p>\n" % (name, order):
+                    errors.append("snapshot of %d pages has page %d: %r" % (len(head), order, page[order]))
+                requests[number] += 1
+
+        def write():
+            saves = 0
+            while not stop.is_set():
+                contentstore.save(self.content_path, versions[saves % 2])
+                saves += 1
+
+        threads = [threading.Thread(target=read, args=(i,)) for i in range(len(requests))]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        time.sleep(2)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(requests))
+        self.assertEqual(errors[:5], [])
+
+
+class TestRestore(SiteTestCase):
+    def test_bad_revision(self):
+        self.save(bench.synthetic_content(10)[0])
+        with self.client.session_transaction() as session:
+            session["admin_" + flaskapp.token] = 1
+        for rev in ("", "x", "12"):
+            response = self.client.post("/doRestore", data={"rev": rev})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"no revision " + rev.encode("utf-8"), response.get_data())
+
+
+class TestSavePage(SiteTestCase):
+    def setUp(self):
+        super(TestSavePage, self).setUp()
+        with self.client.session_transaction() as session:
+            session["admin_" + flaskapp.token] = 1
+
+    def ssave(self, subject, order, new, splice):
+        # splice 為 False 時, 模擬頁面索引無法使用而改為完整存檔
+        self.save(subject)
+        save_page = contentstore.save_page
+        if not splice:
+            contentstore.save_page = lambda path, order, subject: None
+            self.addCleanup(setattr, contentstore, "save_page", save_page)
+        try:
+            self.client.post("/ssavePage", data={"page_content": new, "page_order": str(order)})
+        finally:
+            contentstore.save_page = save_page
+        return contentstore.read(self.content_path)
+
+    def test_fallback_same_as_splice(self):
+        subject = "<p>lead</p><h1 id=\"a\">A &amp; B</h1><p>x &lt; y</p>\n<h2 class='c'>中文 &nbsp;標題</h2>" \
+                  "<p>&copy; 2024</p><h3>Last</h3><p>z</p>"
+        for order, new in [(0, "<h1>A &amp; B</h1><p>edited &gt;</p>"), (1, "<h2>New</h2><p>n</p>"),
+                           (2, "<h3>Last</h3><p>z</p><h1>Added</h1><p>a</p>")]:
+            spliced = self.ssave(subject, order, new, True)
+            self.assertEqual(self.ssave(subject, order, new, False), spliced)
+
+
+class TestConditional(SiteTestCase):
+    def test_etag(self):
+        self.save(bench.synthetic_content(100)[0])
+        url = "/get_page/Page 51"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], "public, no-cache")
+        tag = response.headers["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": tag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b"")
+        # 修改其他頁面時選單或前後頁連結可能改變, ETag 必須隨之改變
+        head, level, page = contentstore.get(self.content_path)
+        contentstore.save_page(self.content_path, 0,
+                               "<h" + level[0] + ">" + head[0] + "</h" + level[0] + ">" + page[0] + "<p>edited</p>")
+        response = self.client.get(url, headers={"If-None-Match": tag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], tag)
+        self.assertNotEqual(self.client.get(url + "/1").headers["Cache-Control"], "public, no-cache")
+
+
+class TestFragmentCache(SiteTestCase):
+    def setUp(self):
+        super(TestFragmentCache, self).setUp()
+        self.save(bench.synthetic_content(200)[0])
+        self.urls = ["/get_page/Page " + str(i) for i in range(1, 200, 10) if i % 50]
+
+    def render(self, max_bytes):
+        flaskapp.fragment_cache = fragmentcache.FragmentCache(max_bytes)
+        # 第二次要求由 cache 中的片段組成
+        return [[self.client.get(url).get_data() for url in self.urls] for i in range(2)]
+
+    def test_identical_html(self):
+        expected = self.render(0)
+        self.assertEqual(self.render(8 * 1024 * 1024), expected)
+        self.assertTrue(flaskapp.fragment_cache.stats()["hits"])
+
+    def test_byte_bound(self):
+        # 上限小於所有片段時, 仍不超過上限
+        self.render(16 * 1024)
+        stats = flaskapp.fragment_cache.stats()
+        self.assertTrue(stats["evictions"])
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+    def test_save_between_reads(self):
+        # 讀取頁面與產生片段之間存檔, 舊版本的選單不可放入新版本的 key
+        flaskapp.fragment_cache = fragmentcache.FragmentCache(8 * 1024 * 1024)
+        head, level, page = contentstore.get(self.content_path)
+        order = head.index("Page 1")
+        new = "<h" + level[order] + ">Page 1</h" + level[order] + ">" + page[order] + "<h2>Inserted</h2><p>x</p>"
+        get_pages = contentstore.get_pages
+        calls = []
+
+        def get_pages_then_save(path):
+            # 第一次為 ETag 的讀取, 第二次為 get_page 本身的讀取
+            pages = get_pages(path)
+            calls.append(path)
+            if len(calls) == 2:
+                contentstore.get_pages = get_pages
+                self.assertIsNotNone(contentstore.save_page(path, order, new))
+            return pages
+
+        contentstore.get_pages = get_pages_then_save
+        self.addCleanup(setattr, contentstore, "get_pages", get_pages)
+        self.assertEqual(self.client.get("/get_page/Page 1").status_code, 200)
+        self.assertIs(contentstore.get_pages, get_pages)
+        self.assertIn(b"Inserted", self.client.get("/get_page/Page 1").get_data())
+
+
+class TestCompress(SiteTestCase):
+    def test_gzip_decodes_to_page(self):
+        self.save(bench.synthetic_content(100)[0])
+        url = "/get_page/Page 1"
+        plain = self.client.get(url).get_data()
+        for i in range(2):
+            # 第二次由 ETag 取得 cache 中的壓縮結果
+            response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+            self.assertEqual(gzip.decompress(response.get_data()), plain)
+
+    def test_identity_varies(self):
+        # 不接受壓縮的用戶端收到的原內容也須標示 Vary, 以免 shared cache 交給接受 gzip 的用戶端
+        self.save(bench.synthetic_content(100)[0])
+        for headers in ({}, {"Accept-Encoding": "identity"}):
+            response = self.client.get("/get_page/Page 1", headers=headers)
+            self.assertIsNone(response.headers.get("Content-Encoding"))
+            self.assertIn("accept-encoding", response.headers.get("Vary", "").lower())
+
+    def test_file_response_not_compressed(self):
+        response = self.client.get("/static/cmsimply.css", headers={"Accept-Encoding": "gzip"})
+        response.close()
+        self.assertIsNone(response.headers.get("Content-Encoding"))
+
+    def test_streaming_passes_through(self):
+        sent = []
+
+        def streaming_app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/html")])
+            for i in range(3):
+                sent.append(i)
+                yield b"x" * 4096
+
+        middleware = compress.CompressMiddleware(streaming_app)
+        headers = []
+        app_iter = middleware({"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": "gzip", "PATH_INFO": "/"},
+                              lambda status, response_headers, exc_info=None: headers.extend(response_headers))
+        next(iter(app_iter))
+        self.assertEqual(sent, [0])
+        self.assertNotIn(("Content-Encoding", "gzip"), headers)
+
+
+class TestAsgi(SiteTestCase):
+    def get(self, app, path, headers):
+        messages = []
+        scope = {"type": "http", "method": "GET", "path": path, "raw_path": path.encode("utf-8"),
+                 "query_string": b"", "root_path": "", "scheme": "http", "http_version": "1.1",
+                 "server": ("127.0.0.1", 80), "client": ("127.0.0.1", 1024),
+                 "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]}
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(app(scope, receive, send))
+        headers = dict((name.decode("latin-1").lower(), value.decode("latin-1"))
+                       for name, value in messages[0]["headers"])
+        return messages[0]["status"], headers, b"".join(
+            message.get("body", b"") for message in messages[1:])
+
+    def test_same_page_as_flask(self):
+        from cmsimde import asgi
+        self.save(bench.synthetic_content(100)[0])
+        app = asgi.ReadApp(threads=2)
+        self.addCleanup(app.executor.shutdown)
+        expected = self.client.get("/get_page/Page 1").get_data()
+        status, headers, body = self.get(app, "/get_page/Page 1", {})
+        self.assertEqual((status, body), (200, expected))
+        status, headers, body = self.get(app, "/get_page/Page 1", {"accept-encoding": "gzip"})
+        self.assertEqual(headers["content-encoding"], "gzip")
+        self.assertEqual(gzip.decompress(body), expected)
+        status, headers, body = self.get(app, "/get_page/Page 1", {"if-none-match": headers["etag"]})
+        self.assertEqual(status, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
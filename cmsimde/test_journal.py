@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from cmsimde import bench, contentstore, journal, pagedb
+
+
+def random_text(rnd):
+    # 含空行, 中文與 \r\n 的多行文字
+    words = ["<p>a</p>", "中文", "\n", "\r\n", "line\n", "", "<h1>x</h1>\n", "z" * 50]
+    return "".join(rnd.choice(words) for i in range(rnd.randint(0, 30)))
+
+
+class TestDiff(unittest.TestCase):
+    def test_patch_rebuilds_new(self):
+        rnd = random.Random(2024)
+        for i in range(500):
+            old = random_text(rnd)
+            new = random_text(rnd) if rnd.random() < 0.3 else \
+                old[:rnd.randint(0, len(old))] + random_text(rnd) + old[rnd.randint(0, len(old)):]
+            self.assertEqual(journal.patch(old, journal.diff(old, new)), new, (old, new))
+
+    def test_common_ends_not_diffed(self):
+        old = "a" * 10000 + "old" + "b" * 10000
+        change = journal.diff(old, "a" * 10000 + "new" + "b" * 10000)
+        self.assertEqual((change["start"], change["end"]), (10000, 10003))
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        super(JournalTestCase, self).setUp()
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config_dir)
+        self.addCleanup(contentstore.invalidate)
+        self.journal_path = os.path.join(self.config_dir, "content.journal")
+        self.htm_path = os.path.join(self.config_dir, "content.htm")
+
+    def save_versions(self, count):
+        # 交替以整份存檔與單頁存檔記錄, 傳回各版本的內容
+        texts = {}
+        old = contentstore.save(self.htm_path, bench.synthetic_content(20)[0])
+        for i in range(count):
+            if i % 2:
+                head, level, page = contentstore.get(self.htm_path)
+                new_page = "<h" + level[i] + ">" + head[i] + "</h" + level[i] + ">" + page[i] + "<p>%d</p>" % i
+                splice = contentstore.save_page(self.htm_path, i, new_page)
+                header = journal.record_splice(self.journal_path, splice, None, None,
+                                               lambda: contentstore.read(self.htm_path))
+            else:
+                new = contentstore.save(self.htm_path, old + "<p>%d</p>" % i)
+                header = journal.record(self.journal_path, old, new)
+            old = contentstore.read(self.htm_path)
+            texts[header["rev"]] = old
+        return texts
+
+
+class TestRevisions(JournalTestCase):
+    def test_text_at(self):
+        texts = self.save_versions(10)
+        # 第一筆為存檔前內容的完整紀錄
+        self.assertEqual(journal.revisions(self.journal_path)[0]["type"], "full")
+        for rev, text in texts.items():
+            self.assertEqual(journal.text_at(self.journal_path, rev), text)
+        self.assertRaises(KeyError, journal.text_at, self.journal_path, max(texts) + 1)
+
+    def test_outside_change_adds_base(self):
+        self.save_versions(2)
+        contentstore.save(self.htm_path, "<h1>pulled</h1><p>p</p>")
+        new = contentstore.save(self.htm_path, "<h1>pulled</h1><p>edited</p>")
+        header = journal.record(self.journal_path, "<h1>pulled</h1><p>p</p>", new)
+        base = journal.revisions(self.journal_path)[-2]
+        self.assertEqual((base["type"], base["rev"]), ("full", header["rev"] - 1))
+        self.assertEqual(journal.text_at(self.journal_path, header["rev"]), new)
+
+    def test_incomplete_record_ignored(self):
+        texts = self.save_versions(3)
+        with open(self.journal_path, "ab") as f:
+            f.write(b'{"rev": 99, "size": 100}\npartial')
+        self.assertEqual(journal.revisions(self.journal_path)[-1]["rev"], max(texts))
+        # 下一筆紀錄取代中斷的紀錄
+        journal._tails.clear()
+        old = contentstore.read(self.htm_path)
+        new = contentstore.save(self.htm_path, old + "<p>after</p>")
+        header = journal.record(self.journal_path, old, new)
+        self.assertEqual(header["rev"], max(texts) + 1)
+        self.assertEqual(journal.text_at(self.journal_path, header["rev"]), new)
+
+    def test_compact(self):
+        texts = self.save_versions(10)
+        count = len(journal.revisions(self.journal_path))
+        self.assertEqual(journal.compact(self.journal_path, keep=4), count - 4)
+        headers = journal.revisions(self.journal_path)
+        self.assertEqual(len(headers), 4)
+        self.assertEqual(headers[0]["type"], "full")
+        for header in headers:
+            self.assertEqual(journal.text_at(self.journal_path, header["rev"]), texts[header["rev"]])
+        self.assertRaises(KeyError, journal.text_at, self.journal_path, headers[0]["rev"] - 1)
+        self.assertEqual(journal.compact(self.journal_path, keep=4), 0)
+
+    def test_restore_htm(self):
+        texts = self.save_versions(4)
+        header = journal.restore(self.config_dir, 1)
+        self.assertEqual(contentstore.read(self.htm_path), texts[1])
+        self.assertEqual((header["action"], header["restored"]), ("restore", 1))
+        self.assertEqual(journal.text_at(self.journal_path, header["rev"]), texts[1])
+
+    def test_restore_sqlite(self):
+        texts = self.save_versions(4)
+        db_path = os.path.join(self.config_dir, "content.db")
+        pagedb.import_htm(db_path, self.htm_path)
+        journal.restore(self.config_dir, 1, "sqlite")
+        self.assertEqual(pagedb.export_text(db_path), texts[1])
+        # content.htm 不受影響
+        self.assertEqual(contentstore.read(self.htm_path), texts[max(texts)])
+
+
+if __name__ == "__main__":
+    unittest.main()
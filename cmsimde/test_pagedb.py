@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cmsimde import contentstore, pagedb
+
+
+class TestPageDb(unittest.TestCase):
+    def setUp(self):
+        super(TestPageDb, self).setUp()
+        work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work)
+        self.addCleanup(contentstore.invalidate)
+        self.db_path = os.path.join(work, "content.db")
+        pagedb.save_all(self.db_path, "<h1>A</h1><p>a</p><h2>B</h2><p>b</p><h1>C</h1><p>c</p>")
+
+    def test_new_connection_does_not_write(self):
+        # 寫入 transaction 進行中, 新開啟的 connection 不再執行含寫入的 schema, 可立即讀取
+        with pagedb.transaction(self.db_path):
+            self.assertEqual(pagedb.get_pages(self.db_path)[0], ("A", "B", "C"))
+
+    def test_connections_reused_across_threads(self):
+        opened = []
+        original = pagedb._open
+
+        def count(db_path):
+            opened.append(db_path)
+            return original(db_path)
+
+        pagedb._open = count
+        self.addCleanup(setattr, pagedb, "_open", original)
+        for i in range(50):
+            thread = threading.Thread(target=pagedb.version, args=(self.db_path,))
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(opened), 1)
+
+    def test_heading_index(self):
+        with pagedb.connect(self.db_path) as db:
+            plan = db.execute("EXPLAIN QUERY PLAN SELECT page_order FROM pages WHERE heading = ?",
+                              ("B",)).fetchall()
+        self.assertIn("pages_heading", " ".join(str(row) for row in plan))
+
+    def test_get_pages_reads_headings_only(self):
+        head, level, page = pagedb.get_pages(self.db_path)
+        self.assertEqual((head, level), (("A", "B", "C"), ("1", "2", "1")))
+        # 頁面內容未整批載入, 由 primary key 逐頁讀取
+        self.assertNotIn(self.db_path, contentstore._cache)
+        self.assertEqual([page[i] for i in range(len(page))], ["<p>a</p>", "<p>b</p>", "<p>c</p>"])
+        self.assertNotIn(self.db_path, contentstore._cache)
+
+    def test_page_rows_after_save(self):
+        head, level, page = pagedb.get_pages(self.db_path)
+        pagedb.save_page(self.db_path, 1, "<h2>New</h2><p>n</p><h2>B</h2><p>b</p>")
+        # 版本改變後改用完整讀取的結果
+        self.assertEqual(page[1], "<p>n</p>")
+        self.assertEqual(pagedb.get_pages(self.db_path)[0], ("A", "New", "B", "C"))
+
+    def test_first_page_without_heading(self):
+        pagedb.save_page(self.db_path, 0, "<p>lead</p>")
+        self.assertEqual(pagedb.export_text(self.db_path),
+                         "<p>lead</p><h2>B</h2><p>b</p><h1>C</h1><p>c</p>")
+
+    def test_only_page_without_heading(self):
+        pagedb.save_all(self.db_path, "<h1>A</h1><p>a</p>")
+        pagedb.save_page(self.db_path, 0, "<p>kept</p>")
+        # 沒有其他頁面可放置內容時保留原標題
+        self.assertEqual(pagedb.export_text(self.db_path), "<h1>A</h1><p>kept</p>")
+        self.assertEqual(pagedb.get(self.db_path)[2], ("<p>kept</p>",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from cmsimde import searchindex
+
+SEARCH_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "tipuesearch", "cmsimde_search.js")
+
+
+def positions(shards, term):
+    # 與 cmsimde_search.js 的 positions 相同, 英數字詞與單一字元也比對以其開頭的詞彙
+    found = {}
+    prefix = not searchindex._CJK.match(term) or len(term) == 1
+    for key, posting in shards.get(searchindex.shard_key(term), {}).items():
+        if key == term or prefix and key.startswith(term):
+            i = 0
+            while i < len(posting):
+                page, count = posting[i], posting[i+1]
+                position = 0
+                for delta in posting[i+2:i+2+count]:
+                    position += delta
+                    found.setdefault(page, []).append(position)
+                i += 2 + count
+    return found
+
+
+def script_argument(data, call):
+    # cmsimde_search.call(...); 的 JSON 引數
+    prefix = "cmsimde_search." + call + "("
+    assert data.startswith(prefix) and data.endswith(");\n")
+    return json.loads("[" + data[len(prefix):-3] + "]")
+
+
+class TestTokenize(unittest.TestCase):
+    def test_words(self):
+        self.assertEqual(searchindex.tokenize("Hello, World_42 x-ray"), ["hello", "world", "42", "x", "ray"])
+
+    def test_latin_range(self):
+        # À-ɏ 的字母為同一字詞的一部分, 大寫轉為小寫
+        self.assertEqual(searchindex.tokenize("Café ÑANDÚ Łódź"), ["café", "ñandú", "łódź"])
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(searchindex.tokenize("中文標題"), ["中文", "文標", "標題"])
+        self.assertEqual(searchindex.tokenize("中"), ["中"])
+        self.assertEqual(searchindex.tokenize("python程式設計abc"), ["python", "程式", "式設", "設計", "abc"])
+        self.assertEqual(searchindex.tokenize("ひらがな 한국어"), ["ひら", "らが", "がな", "한국", "국어"])
+
+    def test_same_pattern_as_search_js(self):
+        with open(SEARCH_JS, encoding="utf-8") as f:
+            source = f.read()
+        pattern = re.search(r"var token = /(.*)/g;", source).group(1)
+        pattern = re.sub(r"\\u([0-9a-f]{4})", lambda m: chr(int(m.group(1), 16)), pattern)
+        self.assertEqual(pattern, searchindex._TOKEN.pattern)
+
+    def test_prefix_in_same_shard(self):
+        # 查詢詞的前綴與完整詞彙在同一 shard, 瀏覽器只需載入一個 shard
+        for term in ["python", "42nd", "ñandú", "中文", "한국"]:
+            for i in range(1, len(term) + 1):
+                self.assertEqual(searchindex.shard_key(term[:i]), searchindex.shard_key(term))
+        self.assertEqual(searchindex.shard_key("中文"), "u4e")
+        self.assertEqual(searchindex.shard_key("é"), "u0")
+
+
+class TestBuild(unittest.TestCase):
+    pages = [("Intro", "Intro.html", "python  is\nfun python"),
+             ("中文", "中文.html", "程式設計 python3 " + "x " * 200),
+             ("Empty", "Empty.html", "")]
+
+    def test_postings(self):
+        meta, shards = searchindex.build(self.pages)
+        # 標題接在內文之前: intro python is fun python, 位置以差值保存
+        self.assertEqual(shards["p"]["python"], [0, 2, 1, 3])
+        self.assertEqual(shards["i"]["intro"], [0, 1, 0])
+        self.assertEqual(shards["x"]["x"][:4], [1, 200, 5, 1])
+        self.assertEqual(positions(shards, "python"), {0: [1, 4], 1: [4]})
+        self.assertEqual(positions(shards, "pyth"), {0: [1, 4], 1: [4]})
+        self.assertEqual(positions(shards, "中"), {1: [0]})
+        self.assertEqual(positions(shards, "文程"), {})
+        self.assertEqual(positions(shards, "式設"), {1: [2]})
+        for key, terms in shards.items():
+            for term in terms:
+                self.assertEqual(searchindex.shard_key(term), key)
+
+    def test_meta_pages(self):
+        meta, shards = searchindex.build(self.pages)
+        self.assertEqual(meta["pages"][0], ["Intro", "Intro.html", "python is fun python"])
+        self.assertEqual(len(meta["pages"][1][2]), searchindex.DESCRIPTION_LENGTH)
+        self.assertEqual(meta["pages"][2], ["Empty", "Empty.html", ""])
+
+    def test_scripts(self):
+        files = searchindex.scripts(self.pages)
+        meta_data = script_argument(files.pop("meta.js"), "meta")[0]
+        meta, shards = searchindex.build(self.pages)
+        self.assertEqual(meta_data["pages"], meta["pages"])
+        self.assertEqual(sorted(files), sorted(key + ".js" for key in shards))
+        for name, data in files.items():
+            key = name[:-3]
+            self.assertEqual(script_argument(data, "shard"), [key, shards[key]])
+            self.assertEqual(meta_data["shards"][key], hashlib.sha1(data.encode("utf-8")).hexdigest()[:12])
+        # 內容改變時版本隨之改變
+        changed = script_argument(searchindex.scripts(self.pages[:2])["meta.js"], "meta")[0]
+        self.assertNotEqual(changed["version"], meta_data["version"])
+
+    def test_write_and_remove(self):
+        content_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, content_dir)
+        search_dir = os.path.join(content_dir, searchindex.SEARCH_DIR)
+
+        def write_file(path, data):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(data)
+            return True
+
+        count = searchindex.write(content_dir, self.pages, write_file)
+        self.assertEqual(count, len(os.listdir(search_dir)))
+        self.assertIn("u4e.js", os.listdir(search_dir))
+        # 已不需要的 shard 被刪除
+        searchindex.write(content_dir, self.pages[:1], write_file)
+        self.assertNotIn("u4e.js", os.listdir(search_dir))
+        searchindex.remove(content_dir)
+        self.assertFalse(os.path.exists(search_dir))
+        # 沒有 meta.js 的 search 目錄不予處理
+        os.makedirs(search_dir)
+        write_file(os.path.join(search_dir, "own.js"), "")
+        searchindex.remove(content_dir)
+        self.assertEqual(os.listdir(search_dir), ["own.js"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import unittest
+import contextlib
+
+from cmsimde import flaskapp, serve, staticserver
+from cmsimde.test_flaskapp import SiteTestCase
+
+
+class ServeTestCase(unittest.TestCase):
+    # 以 installed 模擬已安裝的伺服器模組, 並記錄 main 呼叫的 run_* 而不實際執行
+    def setUp(self):
+        super(ServeTestCase, self).setUp()
+        self.installed = {"prefork", "waitress", "uvicorn"}
+        self.calls = []
+        self.available = serve.available
+        self.patch("available", lambda server: server in self.installed)
+        for name in ("run_gevent", "run_waitress", "run_prefork", "run_uvicorn"):
+            self.patch(name, self.recorder(name))
+        saved = dict(flaskapp.readiness)
+        self.addCleanup(lambda: (flaskapp.readiness.clear(), flaskapp.readiness.update(saved)))
+
+    def patch(self, name, value):
+        self.addCleanup(setattr, serve, name, getattr(serve, name))
+        setattr(serve, name, value)
+
+    def recorder(self, name):
+        def run(*args):
+            # 第二個參數為 listening socket, uvicorn 則自行綁定
+            for arg in args:
+                if hasattr(arg, "close"):
+                    arg.close()
+            self.calls.append((name, args))
+        return run
+
+    def main(self, *argv):
+        return serve.main(["--host", "127.0.0.1", "--port", "0", "--no-warm"] + list(argv))
+
+    def error(self, *argv):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as raised:
+                self.main(*argv)
+        self.assertEqual(raised.exception.code, 2)
+        return stderr.getvalue()
+
+
+class TestPickServer(ServeTestCase):
+    def test_auto(self):
+        for installed, expected in (({"gevent", "waitress"}, "gevent"), ({"waitress"}, "waitress"),
+                                    (set(), "prefork"), ({"uvicorn"}, "prefork")):
+            self.installed = installed | {"prefork"}
+            self.assertEqual(serve.pick_server("auto"), expected, installed)
+
+    def test_explicit(self):
+        self.installed = set()
+        for server in ("gevent", "waitress", "prefork", "uvicorn"):
+            self.assertEqual(serve.pick_server(server), server)
+
+    def test_available(self):
+        # 只尋找模組而不 import, prefork 不需任何模組
+        self.assertTrue(self.available("prefork"))
+        self.assertTrue(self.available("unittest"))
+        self.assertFalse(self.available("no_such_server_module"))
+
+
+class TestDefaults(unittest.TestCase):
+    def test_workers(self):
+        self.assertEqual(serve.auto_workers("waitress", 4), 1)
+        self.assertEqual(serve.auto_workers("gevent", 4), 1)
+        self.assertEqual(serve.auto_workers("prefork", 4), 9 if hasattr(os, "fork") else 1)
+
+    def test_threads(self):
+        self.assertEqual(serve.auto_threads("gevent", 4), serve.GEVENT_CONNECTIONS)
+        self.assertEqual(serve.auto_threads("waitress", 1), 4)
+        self.assertEqual(serve.auto_threads("waitress", 8), 16)
+        self.assertEqual(serve.auto_threads("waitress", 64), 32)
+        self.assertEqual(serve.auto_threads("prefork", 8), 4 if hasattr(os, "fork") else 16)
+
+
+class TestMain(ServeTestCase):
+    def test_waitress(self):
+        self.assertEqual(self.main("--threads", "6"), 0)
+        name, args = self.calls[0]
+        self.assertEqual((name, args[0], args[2]), ("run_waitress", flaskapp.app, 6))
+        self.assertEqual((flaskapp.readiness["server"], flaskapp.readiness["workers"]), ("waitress", 1))
+        self.assertTrue(flaskapp.readiness["ready"])
+
+    def test_prefork(self):
+        self.main("--server", "prefork", "--workers", "3", "--threads", "2")
+        name, args = self.calls[0]
+        self.assertEqual((name, args[2], args[3]), ("run_prefork", 2, 3))
+        self.assertEqual(flaskapp.readiness["workers"], 3)
+
+    def test_auto_without_servers(self):
+        self.installed = {"prefork"}
+        self.main("--workers", "1")
+        self.assertEqual(self.calls[0][0], "run_prefork")
+
+    def test_uvicorn(self):
+        self.main("--server", "uvicorn", "--threads", "3")
+        self.assertEqual(self.calls, [("run_uvicorn", ("127.0.0.1", 0, 3, None, None))])
+
+    def test_argument_errors(self):
+        self.assertIn("--certfile and --keyfile", self.error("--certfile", "cert.pem"))
+        self.assertIn("at least 1", self.error("--server", "prefork", "--threads", "0"))
+        self.assertIn("at least 1", self.error("--server", "prefork", "--workers", "0"))
+        self.assertIn("waitress does not serve https",
+                      self.error("--server", "waitress", "--certfile", "cert.pem", "--keyfile", "key.pem"))
+        self.assertIn("uvicorn runs one worker", self.error("--server", "uvicorn", "--workers", "2"))
+        self.assertIn("gevent is not installed", self.error("--server", "gevent"))
+        self.error("--server", "tornado")
+        self.assertEqual(self.calls, [])
+
+
+class TestStartStaticPrefork(SiteTestCase):
+    def test_disabled_with_workers(self):
+        self.save("<h1>A</h1><p>a</p>")
+        saved = dict(flaskapp.readiness)
+        self.addCleanup(lambda: (flaskapp.readiness.clear(), flaskapp.readiness.update(saved)))
+        flaskapp.readiness.update({"server": "prefork", "workers": 3})
+        with self.client.session_transaction() as session:
+            session["admin_" + flaskapp.token] = 1
+        response = self.client.get("/start_static/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("多個 worker process", response.get_data(as_text=True))
+        self.assertFalse(staticserver.status()["running"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import os
+import ssl
+import shutil
+import socket
+import tempfile
+import unittest
+import http.client
+
+from cmsimde import flaskapp, staticserver
+from cmsimde.test_flaskapp import SiteTestCase
+
+# 網站根目錄中的自簽憑證
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestStaticServer(unittest.TestCase):
+    def setUp(self):
+        super(TestStaticServer, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(staticserver.stop)
+        with open(os.path.join(self.directory, "index.html"), "w", encoding="utf-8") as f:
+            f.write("<p>static</p>")
+
+    def get(self, state, context=None):
+        port = int(state["url"].rsplit(":", 1)[1].strip("/"))
+        if context is None:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        else:
+            connection = http.client.HTTPSConnection("127.0.0.1", port, timeout=10, context=context)
+        connection.request("GET", "/index.html")
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response.status, body
+
+    def test_start_stop(self):
+        started, state = staticserver.start("127.0.0.1", 0, self.directory)
+        self.assertTrue(started)
+        self.assertEqual(self.get(state), (200, b"<p>static</p>"))
+        # 重複啟動時傳回執行中伺服器的狀態
+        started, again = staticserver.start("127.0.0.1", 0, self.directory)
+        self.assertFalse(started)
+        self.assertEqual(again["url"], state["url"])
+        self.assertTrue(staticserver.status()["running"])
+        self.assertTrue(staticserver.stop())
+        self.assertEqual(staticserver.status(), {"running": False})
+        self.assertFalse(staticserver.stop())
+        # 停止後可再次啟動
+        started, state = staticserver.start("127.0.0.1", 0, self.directory)
+        self.assertTrue(started)
+
+    def test_port_in_use(self):
+        other = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(other.close)
+        other.bind(("127.0.0.1", 0))
+        other.listen(1)
+        with self.assertRaises(OSError) as raised:
+            staticserver.start("127.0.0.1", other.getsockname()[1], self.directory)
+        self.assertTrue(staticserver.port_in_use(raised.exception))
+        self.assertEqual(staticserver.status(), {"running": False})
+
+    @unittest.skipUnless(os.path.isfile(os.path.join(SITE_DIR, "cert.pem")), "no cert.pem")
+    def test_https(self):
+        started, state = staticserver.start("127.0.0.1", 0, self.directory,
+                                            certfile=os.path.join(SITE_DIR, "cert.pem"),
+                                            keyfile=os.path.join(SITE_DIR, "key.pem"))
+        self.assertTrue(state["url"].startswith("https://"))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        self.assertEqual(self.get(state, context), (200, b"<p>static</p>"))
+
+
+class TestStaticStatus(SiteTestCase):
+    def test_admin_only(self):
+        response = self.client.get("/static_status")
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers["Location"].endswith("/login"))
+        with self.client.session_transaction() as session:
+            session["admin_" + flaskapp.token] = 1
+        self.assertEqual(self.client.get("/static_status").get_json(), {"running": False})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,15 @@ import os
 import subprocess
 import threading
 import http.server, ssl
+# 用戶端接受時送出靜態網頁轉檔產生的 .br 或 .gz 壓縮檔
+from cmsimde.precompress import PrecompressedHandler
 
 def domake():
     # build directory
     #os.chdir("./../")
     server_address = ('localhost', 8444)
-    httpd = http.server.HTTPServer(server_address, http.server.SimpleHTTPRequestHandler)
+    # PrecompressedHandler 以 HTTP/1.1 保持連線, 每個連線由各自的執行緒處理, 閒置連線不會阻擋其他用戶端
+    httpd = http.server.ThreadingHTTPServer(server_address, PrecompressedHandler)
     httpd.socket = ssl.wrap_socket(httpd.socket,
                                    server_side=True,
                                    certfile='./localhost.crt',
@@ -14,6 +14,29 @@ class Init(object):
     ip = "127.0.0.1"
     dynamic_port = 9443
     static_port = 8443
+    # 頁面內容存放方式: "htm" 為 config/content.htm, "sqlite" 為 config/content.db
+    content_backend = "htm"
+    # python -m cmsimde.build 靜態網頁轉檔同時使用的 process 數, None 為 CPU 核心數, 網頁中的轉檔固定逐頁進行
+    build_jobs = None
+    # 靜態網頁選單: "inline" 放入每一頁, "external" 存為各頁共用的 nav-*.js
+    static_nav = "inline"
+    # 靜態網頁額外的網址置換 (原字串, 新字串), 接在 flaskapp.static_url_rewrites 之後套用
+    static_url_rewrites = []
+    # 靜態網頁搜尋: "tipue" 為 tipuesearch_content.js, "index" 為 content/search/ 分段索引
+    static_search = "tipue"
+    # 靜態網頁轉檔後為較大的文字檔產生 .gz (安裝 brotli 時另有 .br) 壓縮檔
+    static_precompress = False
+    # 靜態網頁頁尾程式與各頁用到的 syntaxhighlighter brush 串接為含 hash 檔名的 bundle
+    static_bundle = False
+    # get_page 選單, 頁首與頁面內容 cache 的 bytes 上限, 0 為不使用
+    fragment_cache_bytes = 8 * 1024 * 1024
+    # 動態網頁較大的文字回應依瀏覽器支援以 gzip (安裝 brotli 時為 br) 壓縮
+    compress_responses = True
+    # python -m cmsimde.serve 的伺服器: "auto", "gevent", "waitress", "prefork" 或 "uvicorn" (cmsimde.asgi)
+    serve_server = "auto"
+    # 各 process 的執行緒數與 prefork 的 process 數, None 依 CPU 核心數決定
+    serve_threads = None
+    serve_workers = None
     def __init__(self):
         # hope to create downloads and images directories　
         if not os.path.isdir(_curdir + "/downloads"):
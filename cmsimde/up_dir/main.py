@@ -1,6 +1,4 @@
-from cmsimde import flaskapp
-from gevent.pywsgi import WSGIServer
+from cmsimde import serve
 
-#flaskapp.app.run(host="0.0.0.0", debug=True)
-http_server = WSGIServer(('0.0.0.0', 8080), flaskapp.app)
-http_server.serve_forever()
\ No newline at end of file
+# 以 gevent 在 0.0.0.0:8080 執行, 啟動前先預熱快取, 其他選項見 python -m cmsimde.serve --help
+serve.main(["--server", "gevent", "--host", "0.0.0.0", "--port", "8080"])
@@ -22,6 +22,24 @@ except ImportError:
 
 from pelican import signals
 
+try:
+    # 與 cmsimde 靜態網頁共用的串流文字擷取, local_publishconf.py 已將網站目錄加入 sys.path
+    from cmsimde.searchindex import extract_text
+except ImportError:
+    extract_text = None
+
+
+def page_text(html):
+    """Return (title, visible text) of html without script, style, head and comments"""
+
+    if extract_text is not None:
+        return extract_text(html)
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.title.get_text() if soup.title is not None else ''
+    for tag in soup(['script', 'style', 'head', 'title']):
+        tag.decompose()
+    return ' '.join(title.split()), soup.get_text(' ', strip=True)
+
 
 class Tipue_Search_JSON_Generator(object):
 
@@ -40,12 +58,10 @@ class Tipue_Search_JSON_Generator(object):
         if getattr(page, 'status', 'published') != 'published':
             return
 
-        soup_title = BeautifulSoup(page.title.replace('&nbsp;', ' '), 'html.parser')
-        page_title = soup_title.get_text(' ', strip=True).replace('“', '"').replace('”', '"').replace('’', "'").replace('^', '&#94;')
+        page_title = page_text(page.title.replace('&nbsp;', ' '))[1].replace('“', '"').replace('”', '"').replace('’', "'").replace('^', '&#94;')
 
-        soup_text = BeautifulSoup(page.content, 'html.parser')
-        page_text = soup_text.get_text(' ', strip=True).replace('“', '"').replace('”', '"').replace('’', "'").replace('¶', ' ').replace('^', '&#94;')
-        page_text = ' '.join(page_text.split())
+        text = page_text(page.content)[1].replace('“', '"').replace('”', '"').replace('’', "'").replace('¶', ' ').replace('^', '&#94;')
+        text = ' '.join(text.split())
 
         if getattr(page, 'category', 'None') == 'None':
             page_category = ''
@@ -55,7 +71,7 @@ class Tipue_Search_JSON_Generator(object):
         page_url = self.siteurl + '/' + page.url
 
         node = {'title': page_title,
-                'text': page_text,
+                'text': text,
                 'tags': page_category,
                 'url': page_url}
 
@@ -64,15 +80,9 @@ class Tipue_Search_JSON_Generator(object):
 
     def create_tpage_node(self, srclink):
 
-        srcfile = open(os.path.join(self.output_path, self.tpages[srclink]), encoding='utf-8')
-        soup = BeautifulSoup(srcfile, 'html.parser')
-        page_text = soup.get_text()
-
-        # What happens if there is not a title.
-        if soup.title is not None:
-            page_title = soup.title.string
-        else:
-            page_title = ''
+        with open(os.path.join(self.output_path, self.tpages[srclink]), encoding='utf-8') as srcfile:
+            # page_text returns '' when there is not a title
+            page_title, text = page_text(srcfile.read())
 
         # Should set default category?
         page_category = ''
@@ -80,7 +90,7 @@ class Tipue_Search_JSON_Generator(object):
         page_url = urljoin(self.siteurl, self.tpages[srclink])
 
         node = {'title': page_title,
-                'text': page_text,
+                'text': text,
                 'tags': page_category,
                 'url': page_url}
 
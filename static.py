@@ -1,21 +1,45 @@
-from flask import Flask, send_from_directory
+import os
+from flask import Flask, request, send_from_directory
+from werkzeug.security import safe_join
+# 靜態網頁轉檔產生的 .br 與 .gz 壓縮檔, 以及含內容 hash 的 bundle
+from cmsimde import precompress, bundle
 
 app = Flask(__name__)
 
+
+def send_precompressed(directory, filename):
+    # 用戶端接受時送出預先壓縮的檔案, 執行時不需壓縮
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        return send_from_directory(directory, filename)
+    variant, encoding = precompress.choose(path, request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        response = send_from_directory(directory, filename)
+    else:
+        response = send_from_directory(directory, filename + variant[len(path):],
+                                       mimetype=precompress.content_type(path))
+        response.headers['Content-Encoding'] = encoding
+    if precompress.has_variant(path):
+        response.vary.add('Accept-Encoding')
+    if bundle.cache_control(path) is not None:
+        response.headers['Cache-Control'] = bundle.cache_control(path)
+    return response
+
+
 # Route to serve the index.html file
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return send_precompressed('.', 'index.html')
 
 # Route to serve static files from the ./cmsimde/static directory
 @app.route('/cmsimde/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory('cmsimde/static', filename)
+    return send_precompressed('cmsimde/static', filename)
 
 # Route to serve other HTML files from the root directory
 @app.route('/<path:filename>')
 def serve_html(filename):
-    return send_from_directory('.', filename)
+    return send_precompressed('.', filename)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,5 +1,5 @@
-from waitress import serve
-from cmsimde import flaskapp
+from cmsimde import serve
 # 8xxxx is for Stunnel accept port
 # 9xxxx is for localhost internal port
-serve(flaskapp.app, listen='127.0.0.1:各學員9開頭的內部埠號', threads=8)
+# threads 依 CPU 核心數決定, 可另加 "--threads", "8"
+serve.main(["--server", "waitress", "--host", "127.0.0.1", "--port", "各學員9開頭的內部埠號"])